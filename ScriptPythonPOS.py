@@ -9,6 +9,9 @@ Script simple et efficace pour imprimante thermique 57mm
 - Ajout de texte sous l'image avec --text
 - Vérification automatique du papier
 
+Wrapper en ligne de commande autour de printer_service.py (le même code
+d'impression que l'application, qui garde la connexion série ouverte).
+
 Usage:
   python3 script.py --image photo.jpg
   python3 script.py --image photo.jpg --hd
@@ -23,175 +26,69 @@ import logging
 import sys
 import argparse
 import os
-# Supprimer TOUS les avertissements et messages
-warnings.filterwarnings("ignore")
-logging.getLogger().setLevel(logging.CRITICAL)
 
-from escpos.printer import Serial
-from PIL import Image, ImageEnhance
+from dither_utils import DITHER_MODES
+from printer_service import DEFAULT_BUFFER_BYTES, PrinterService
+
 
 def parse_arguments():
     """Parser les arguments de ligne de commande"""
     parser = argparse.ArgumentParser(description='Impression thermique rapide')
-    parser.add_argument('--hd', action='store_true', 
+    parser.add_argument('--hd', action='store_true',
                        help='Haute densité (meilleure qualité, plus lent)')
     parser.add_argument('--image', type=str, required=True,
                        help='Chemin vers l\'image à imprimer (obligatoire)')
     parser.add_argument('--text', type=str,
                        help='Texte à ajouter sous l\'image')
+    parser.add_argument('--dither', type=str, default='escpos', choices=DITHER_MODES,
+                       help='Mode de tramage (défaut: escpos)')
+    parser.add_argument('--contrast', type=float, default=1.0,
+                       help='Contraste avant tramage (défaut: 1.0)')
+    parser.add_argument('--gamma', type=float, default=1.0,
+                       help='Gamma avant tramage (défaut: 1.0)')
+    parser.add_argument('--buffer', type=int, default=DEFAULT_BUFFER_BYTES,
+                       help=f'Tampon de l\'imprimante en octets (défaut: {DEFAULT_BUFFER_BYTES})')
     parser.add_argument('--port', type=str, default='/dev/ttyAMA0',
                        help='Port série de l\'imprimante (défaut: /dev/ttyAMA0)')
     parser.add_argument('--baudrate', type=int, default=9600,
                        help='Baudrate de l\'imprimante (défaut: 9600)')
     return parser.parse_args()
 
-def connect_printer(serial_port='/dev/ttyAMA0', baudrate=9600):
-    """Connexion à l'imprimante avec paramètres de vitesse"""
-    printer = Serial(devfile=serial_port, baudrate=baudrate, timeout=1)
-     
-    return printer
-
-def check_paper_status(printer):
-    """Vérifier le statut du papier selon les codes de votre imprimante"""
-    try:
-        if hasattr(printer, 'paper_status'):
-            status = printer.paper_status()
-            
-            if status == 0:
-                return False, "Plus de papier (status: 0)"
-            elif status == 2:
-                return True, "Papier présent (status: 2)"
-            else:
-                return None, f"Status inconnu: {status}"
-        else:
-            return None, "Méthode paper_status non disponible"
-            
-    except Exception as e:
-        return None, f"Erreur vérification papier: {e}"
-
-def optimize_image(img_path, high_density=False):
-    """Optimiser l'image avec compensation pour la haute densité"""
-    # Charger et convertir en gris
-    img = Image.open(img_path).convert('L')
-    original_width, original_height = img.size
-    
-    # Largeur maximale selon la densité
-    if high_density:
-        max_width = 384  # Haute densité = largeur complète
-        height_compensation = 1.0  # Compensation ajustée pour l'écrasement en HD
-    else:
-        max_width = 192  # Basse densité = largeur réduite
-        height_compensation = 1.0  # Pas de compensation en basse densité
-    
-    # Redimensionner SEULEMENT si l'image est plus large que la limite
-    if original_width > max_width:
-        # Calculer le ratio pour préserver les proportions
-        ratio = max_width / original_width
-        new_height = int(original_height * ratio * height_compensation)
-        img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-    elif high_density:
-        # Même si l'image est plus petite, appliquer la compensation en HD
-        new_height = int(original_height * height_compensation)
-        img = img.resize((original_width, new_height), Image.Resampling.LANCZOS)
-      
-    return img
-
-def print_image(printer, img, filename, high_density=False):
-    """Imprimer avec densité configurable"""
-    printer.image(
-        img,
-        impl='bitImageRaster',
-        high_density_vertical=high_density,
-        high_density_horizontal=high_density,
-        fragment_height=1920
-    )
-
-def print_text_bottom(printer, text):
-    """Imprimer du texte en bas, pleine largeur"""
-    if not text:
-        return
-    
-    # Petit saut de ligne après l'image
-    printer.text("\n")
-    
-    # Texte centré et en gras pour plus de visibilité
-    printer.set(align='center')
-    printer.set(bold=True)
-    
-    # Imprimer le texte
-    printer.text(text)
-    
-    # Remettre les paramètres par défaut
-    printer.set(align='left')
-    printer.set(bold=False)
-
-def print_with_paper_check(printer, optimized_img, filename, high_density, bottom_text):
-    """Imprimer avec vérification préalable du papier"""
-    
-    # Vérifier le papier avant d'imprimer
-    paper_ok, paper_msg = check_paper_status(printer)
-    
-    if paper_ok is False:
-        print(f"⚠️  ATTENTION: {paper_msg}")
-        print("Veuillez recharger le papier avant d'imprimer.")
-        return False
-    elif paper_ok is None:
-        print(f"⚠️  {paper_msg}")
-        print("Impression sans vérification du papier...")
-    else:
-        print(f"✅ {paper_msg}")
-    
-    # Procéder à l'impression
-    print_image(printer, optimized_img, filename, high_density)
-    print_text_bottom(printer, bottom_text)
-    printer.text("\n\n\n\n")  # 4 retours pour plus d'espace
-    
-    return True
 
 def main():
+    # Supprimer TOUS les avertissements et messages
+    warnings.filterwarnings("ignore")
+    logging.getLogger().setLevel(logging.CRITICAL)
+
     # Parser les arguments
     args = parse_arguments()
-    
+
     # Vérifier que l'image existe
     image_file = args.image
     if not os.path.exists(image_file):
         print(f"Erreur: Image '{image_file}' non trouvée")
         return
-    
-    # Mode densité et texte
-    high_density = args.hd
-    bottom_text = args.text
-    
-    # Paramètres de connexion
-    printer_port = args.port
-    printer_baudrate = args.baudrate
-    
-    # Connexion et impression
+
+    service = PrinterService(args.port, args.baudrate)
     try:
-        printer = connect_printer(printer_port, printer_baudrate)
-        
-        # Traitement de l'image
-        optimized_img = optimize_image(image_file, high_density)
-        
-        # Impression avec vérification du papier
-        success = print_with_paper_check(printer, optimized_img, 
-                                       os.path.basename(image_file), 
-                                       high_density, bottom_text)
-        
-        if success:
-            print("✅ Impression terminée")
-            sys.exit(0)  # Succès
-        else:
-            print("❌ Impression annulée - Plus de papier")
-            sys.exit(2)  # Code d'erreur spécifique pour manque de papier
-        
-    except Exception as e:
-        print(f"Erreur: {e}")
+        result = service.print_photo(image_file, high_density=args.hd, footer_text=args.text or '',
+                                     dither=args.dither, contrast=args.contrast, gamma=args.gamma,
+                                     buffer_bytes=args.buffer)
     finally:
-        try:
-            printer.close()
-        except:
-            pass
+        service.close()
+
+    if result['success']:
+        metrics = result.get('metrics', {})
+        print(f"✅ Impression terminée (premier octet après {metrics.get('ttfb_ms')} ms, "
+              f"{metrics.get('bytes_sent')} octets à {metrics.get('throughput_bps')} o/s)")
+        sys.exit(0)  # Succès
+    elif result.get('error_type') == 'no_paper':
+        print("❌ Impression annulée - Plus de papier")
+        sys.exit(2)  # Code d'erreur spécifique pour manque de papier
+    else:
+        print(f"Erreur: {result.get('error')}", file=sys.stderr)
+        sys.exit(1)
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -6,12 +6,10 @@ import os
 import time
 import subprocess
 import threading
-import asyncio
 import requests
 import logging
 import signal
 import atexit
-import base64
 import sys
 import queue
 import json
@@ -19,18 +17,30 @@ import shutil
 import shlex
 from flask import stream_with_context
 from datetime import datetime
-from runware import Runware, IImageInference
+from PIL import Image
 from config_utils import (
     PHOTOS_FOLDER,
     EFFECT_FOLDER,
+    CACHE_FOLDER,
+    ASSETS_FOLDER,
+    ALLOWED_EXTENSIONS,
     load_config,
     save_config,
     ensure_directories,
     SETTINGS
 )
 from camera_utils import UsbCamera, detect_cameras, MockCamera, MyPicammera
-from telegram_utils import send_to_telegram
-from led_utilities import start_led_animation_mode, start_led_multiple_animation_mode, stop_led_animation_mode, release_strip
+from telegram_utils import TelegramOutbox
+from led_utilities import start_led_animation_mode, start_led_multiple_animation_mode, stop_led_animation_mode, release_strip, led_engine_stats
+from export_utils import ZipStream, collect_export_entries, parse_range_header
+from catalog_utils import PhotoCatalog, ensure_display_image, remove_display_image
+from dither_utils import normalize_dither_mode
+from printer_service import PrinterMonitor, PrintQueue, RasterCache, get_printer_pool, release_printer_pool
+from printer_assets import LOGO_POSITIONS, PRINT_LOGO_FILE, load_print_asset
+from runware_client import RunwareClient
+from local_effects import LOCAL_FILTERS, LocalEffectEngine, local_filter_name
+from effect_service import (DEFAULT_EFFECT_PROMPT, ORIGIN_SPECULATIVE, EffectBudget, EffectCache, EffectQueue,
+                            parse_effect_styles)
 
 
 app = Flask(__name__)
@@ -42,66 +52,94 @@ logger = logging.getLogger(__name__)
 # Initialiser les dossiers nécessaires
 ensure_directories()
 
+# Configuration chargée avant le pool d'imprimantes et le moniteur, qui la lisent dès le démarrage
+config = load_config()
+
 def check_printer_status():
-    """Vérifier l'état de l'imprimante thermique"""
+    """État de l'imprimante thermique (depuis le cache du moniteur, sans accès au port)"""
+    return printer_monitor.status()
+
+
+def _printer_endpoints():
+    """Imprimante principale puis imprimantes supplémentaires du pool : [(port, baudrate), ...]"""
+    baudrate = config.get('printer_baudrate', 9600)
+    ports = [config.get('printer_port', '/dev/ttyAMA0')] + list(config.get('printer_pool_ports', []))
+    return [(port, baudrate) for port in dict.fromkeys(p for p in ports if p)]
+
+
+def printer_pool():
+    """Pool d'imprimantes persistant configuré selon la configuration courante"""
+    return get_printer_pool(_printer_endpoints())
+
+
+# Impressions rastérisées à l'avance (après capture/effet) pour démarrer l'envoi immédiatement
+raster_cache = RasterCache()
+
+def _on_print_job_event(payload):
+    """Relayer l'avancement des impressions et rafraîchir le statut après chaque job"""
+    notify_clients_event(payload)
+    # Plus de papier : déjà enregistré dans le pool par la file (bascule sur une autre imprimante)
+    if payload.get('job', {}).get('status') in ('done', 'error', 'cancelled'):
+        printer_monitor.poke()
+
+
+# File d'impression : un worker par imprimante du pool, l'avancement part sur /events
+print_queue = PrintQueue(printer_pool, notify=_on_print_job_event, raster_cache=raster_cache)
+
+# Surveillance du statut : seul accès périodique aux ports, qui saute les imprimantes occupées
+printer_monitor = PrinterMonitor(printer_pool,
+                                 enabled=lambda: config.get('printer_enabled', True),
+                                 notify=lambda payload: notify_clients_event(payload),
+                                 interval=float(SETTINGS.get('printer_status_interval', 15)))
+printer_monitor.start()
+
+
+def _find_photo_path(filename):
+    """Chemin d'une photo dans le dossier photos ou effets (None si introuvable)"""
+    for folder in (PHOTOS_FOLDER, EFFECT_FOLDER):
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _print_logo_path():
+    return os.path.join(ASSETS_FOLDER, PRINT_LOGO_FILE)
+
+
+def _print_logo():
+    """Logo d'événement prêt pour l'impression (None si désactivé ou absent)"""
+    if not config.get('print_logo_enabled', False):
+        return None
     try:
-        # Vérifier si le module escpos est disponible
-        try:
-            from escpos.printer import Serial
-        except ImportError:
-            return {
-                'status': 'error',
-                'message': 'Module escpos manquant. Installez-le avec: pip install python-escpos',
-                'paper_status': 'unknown'
-            }
-        
-        # Récupérer la configuration de l'imprimante
-        printer_port = config.get('printer_port', '/dev/ttyAMA0')
-        printer_baudrate = config.get('printer_baudrate', 9600)
-        
-        # Vérifier si l'imprimante est activée
-        if not config.get('printer_enabled', True):
-            return {
-                'status': 'disabled',
-                'message': 'Imprimante désactivée dans la configuration',
-                'paper_status': 'unknown'
-            }
-        
-        # Tenter de se connecter à l'imprimante
-        try:
-            printer = Serial(printer_port, baudrate=printer_baudrate, timeout=1)
-            
-            # Vérifier l'état du papier (commande ESC/POS standard)
-            printer._raw(b'\x10\x04\x01')  # Commande de statut en temps réel
-            
-            # Lire la réponse (si disponible)
-            # Note: Cette partie peut varier selon le modèle d'imprimante
-            
-            printer.close()
-            
-            return {
-                'status': 'ok',
-                'message': 'Imprimante connectée',
-                'paper_status': 'ok',
-                'port': printer_port,
-                'baudrate': printer_baudrate
-            }
-            
-        except Exception as e:
-            return {
-                'status': 'error',
-                'message': f'Erreur de connexion: {str(e)}',
-                'paper_status': 'unknown',
-                'port': printer_port,
-                'baudrate': printer_baudrate
-            }
-            
+        return load_print_asset(_print_logo_path(), config.get('print_resolution', 384) > 384,
+                                normalize_dither_mode(config.get('print_dither_mode')),
+                                config.get('print_logo_position', 'header'), config.get('print_logo_resident', True))
     except Exception as e:
-        return {
-            'status': 'error',
-            'message': f'Erreur lors de la vérification: {str(e)}',
-            'paper_status': 'unknown'
-        }
+        logger.info(f"[PRINTER] Logo d'impression illisible: {e}")
+        return None
+
+
+def _print_settings():
+    """Réglages d'impression courants (densité, pied de page, logo)"""
+    return {'high_density': config.get('print_resolution', 384) > 384,
+            'footer_text': config.get('footer_text', ''),
+            'dither': normalize_dither_mode(config.get('print_dither_mode')),
+            'contrast': float(config.get('print_contrast', 1.0)),
+            'gamma': float(config.get('print_gamma', 1.0)),
+            'buffer_bytes': int(config.get('printer_buffer_bytes', 4096)),
+            'logo': _print_logo()}
+
+
+def _prefetch_print(photo_path):
+    """Rastériser une photo en arrière-plan, en prévision d'un appui sur Imprimer"""
+    if config.get('printer_enabled', True):
+        raster_cache.prefetch(photo_path, **_print_settings())
+
+
+def _enqueue_print(photo_path, copies=1, origin='guest'):
+    """Ajouter une impression à la file avec les réglages courants"""
+    return print_queue.submit(photo_path, copies=copies, origin=origin, **_print_settings())
 
 
 # Fonction pour détecter les ports série disponibles
@@ -146,12 +184,72 @@ def detect_serial_ports():
 
 
 # Variables globales
-config = load_config()
 current_photo = None
 camera_active = False
 camera_process = None
 my_camera = None
 
+# Catalogue des photos (flux incrémental du diaporama, rattachement des effets)
+photo_catalog = PhotoCatalog({'photo': PHOTOS_FOLDER, 'effet': EFFECT_FOLDER})
+photo_catalog.scan()
+try:
+    DISPLAY_WIDTH = int(SETTINGS.get('slideshow_display_width', 1280))
+except (TypeError, ValueError):
+    DISPLAY_WIDTH = 1280
+
+# Connexion Runware persistante sur sa propre boucle asyncio (ouverte dès le démarrage si les effets sont actifs)
+runware_client = RunwareClient(keepalive=float(SETTINGS.get('runware_keepalive', 30)),
+                               url=SETTINGS.get('runware_url') or None)
+if config.get('effect_enabled', False):
+    runware_client.warm_up(config.get('runware_api_key'))
+
+# Filtres locaux (OpenCV) : styles « local:... » et secours quand Runware est injoignable
+local_effect_engine = LocalEffectEngine(workers=int(SETTINGS.get('local_effect_workers', 2)))
+
+# Effets IA en arrière-plan : la requête rend la main, l'avancement part sur /events
+effect_queue = EffectQueue(runware_client, EFFECT_FOLDER,
+                           concurrency=lambda: config.get('effect_max_concurrent', 2),
+                           notify=lambda payload: notify_clients_event(payload),
+                           on_done=lambda job, path: _on_effect_done(job, path),
+                           max_pending=int(SETTINGS.get('effect_queue_limit', 20)),
+                           cache=EffectCache(os.path.join(CACHE_FOLDER, 'effect_cache.json'), EFFECT_FOLDER,
+                                             max_entries=int(SETTINGS.get('effect_cache_entries', 200))),
+                           speculative_limit=lambda: config.get('effect_speculative_max', 1),
+                           budget=EffectBudget(os.path.join(CACHE_FOLDER, 'effect_budget.json'),
+                                               limit=lambda: config.get('effect_speculative_budget', 100)),
+                           local_engine=local_effect_engine,
+                           fallback_filter=lambda: config.get('effect_local_fallback') or None)
+
+# Envois Telegram : un seul worker et une file gardée sur disque (reprise après redémarrage),
+# au rythme permis par Telegram pour chaque chat (photos en attente regroupées en albums)
+telegram_outbox = TelegramOutbox(os.path.join(CACHE_FOLDER, 'telegram_outbox.json'), config=lambda: config,
+                                 notify=lambda payload: notify_clients_event(payload),
+                                 api_url=SETTINGS.get('telegram_api_url') or None)
+telegram_outbox.start()
+
+def _photo_folder(photo_type):
+    return EFFECT_FOLDER if photo_type == 'effet' else PHOTOS_FOLDER
+
+def _on_catalog_change(action, entry):
+    """Pousser les ajouts/suppressions de photos aux clients SSE (diaporama)"""
+    if action == 'added':
+        # Préparer l'image d'affichage en arrière-plan pour des transitions instantanées
+        source_path = os.path.join(_photo_folder(entry['type']), entry['filename'])
+        threading.Thread(target=ensure_display_image, args=(source_path, CACHE_FOLDER, DISPLAY_WIDTH), daemon=True).start()
+        # La plupart des photos revues sont imprimées : préparer le raster tout de suite
+        _prefetch_print(source_path)
+    elif action == 'removed':
+        remove_display_image(entry['filename'], CACHE_FOLDER, DISPLAY_WIDTH)
+        raster_cache.discard(os.path.join(_photo_folder(entry['type']), entry['filename']))
+    notify_clients_event({
+        'event': f"photo_{action}",
+        'filename': entry['filename'],
+        'type': entry['type'],
+        'cursor': photo_catalog.cursor()
+    })
+
+photo_catalog.add_listener(_on_catalog_change)
+
 @app.route('/')
 def index():
     """Page principale avec aperçu vidéo"""
@@ -181,11 +279,13 @@ def capture_photo():
                 
                 current_photo = filename
                 logger.info(f"Frame MJPEG capturée avec succès: {filename}")
+                photo_catalog.add(filename, 'photo')
+                _speculate_effect(filepath)
                 
                 # Envoyer sur Telegram si activé
                 send_type = config.get('telegram_send_type', 'photos')
                 if send_type in ['photos', 'both']:
-                    threading.Thread(target=send_to_telegram, args=(filepath, config, "photo")).start()
+                    telegram_outbox.enqueue(filepath, "photo")
                 
                 return jsonify({'success': True, 'filename': filename})
             else:
@@ -216,52 +316,13 @@ def print_photo():
         if not config.get('printer_enabled', True):
             return jsonify({'success': False, 'error': 'Imprimante désactivée dans la configuration'})
         
-        # Chercher la photo dans le bon dossier
-        photo_path = None
-        if os.path.exists(os.path.join(PHOTOS_FOLDER, current_photo)):
-            photo_path = os.path.join(PHOTOS_FOLDER, current_photo)
-        elif os.path.exists(os.path.join(EFFECT_FOLDER, current_photo)):
-            photo_path = os.path.join(EFFECT_FOLDER, current_photo)
-        else:
+        photo_path = _find_photo_path(current_photo)
+        if not photo_path:
             return jsonify({'success': False, 'error': 'Photo introuvable'})
         
-        # Vérifier l'existence du script d'impression
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ScriptPythonPOS.py')
-        if not os.path.exists(script_path):
-            return jsonify({'success': False, 'error': 'Script d\'impression introuvable (ScriptPythonPOS.py)'})
-        
-        # Construire la commande d'impression avec les nouveaux paramètres
-        cmd = ['python3', 'ScriptPythonPOS.py', '--image', photo_path]
-        
-        # Ajouter les paramètres de port et baudrate
-        printer_port = config.get('printer_port', '/dev/ttyAMA0')
-        printer_baudrate = config.get('printer_baudrate', 9600)
-        cmd.extend(['--port', printer_port, '--baudrate', str(printer_baudrate)])
-        
-        # Ajouter le texte de pied de page si configuré
-        footer_text = config.get('footer_text', '')
-        if footer_text:
-            cmd.extend(['--text', footer_text])
-        
-        # Ajouter l'option haute résolution selon la configuration
-        print_resolution = config.get('print_resolution', 384)
-        if print_resolution > 384:
-            cmd.append('--hd')
-        
-        # Exécuter l'impression
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
-        
-        if result.returncode == 0:
-            return jsonify({'success': True, 'message': 'Photo imprimée avec succès!'})
-        elif result.returncode == 2:
-            # Code d'erreur spécifique pour manque de papier
-            return jsonify({'success': False, 'error': 'Plus de papier dans l\'imprimante', 'error_type': 'no_paper'})
-        else:
-            error_msg = result.stderr.strip() if result.stderr else 'Erreur inconnue'
-            if 'ModuleNotFoundError' in error_msg and 'escpos' in error_msg:
-                return jsonify({'success': False, 'error': 'Module escpos manquant. Installez-le avec: pip install python-escpos'})
-            else:
-                return jsonify({'success': False, 'error': f'Erreur d\'impression: {error_msg}'})
+        # Mise en file : la réponse part tout de suite, l'avancement arrive via /events (print_job)
+        job = _enqueue_print(photo_path)
+        return jsonify({'success': True, 'job_id': job.id, 'job': job.to_dict()})
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -282,6 +343,9 @@ def delete_current_photo():
             
             if photo_path and os.path.exists(photo_path):
                 os.remove(photo_path)
+                photo_catalog.remove(current_photo)
+                # Effets en cours ou anticipés sur cette photo : inutiles désormais
+                effect_queue.cancel_source(current_photo)
                 current_photo = None
                 return jsonify({'success': True})
             else:
@@ -293,134 +357,137 @@ def delete_current_photo():
 
 @app.route('/apply_effect', methods=['POST'])
 def apply_effect():
-    """Appliquer un effet IA à la photo actuelle"""
-    global current_photo
-    
+    """Lancer un effet IA sur la photo actuelle (job en arrière-plan, suivi via /events)"""
     if not current_photo:
         return jsonify({'success': False, 'error': 'Aucune photo à traiter'})
     
     if not config.get('effect_enabled', False):
         return jsonify({'success': False, 'error': 'Les effets sont désactivés'})
     
-    if not config.get('runware_api_key'):
+    # Sans clé Runware : seuls les styles locaux ou le filtre de secours restent possibles
+    if not config.get('runware_api_key') and not config.get('effect_local_fallback') and \
+            not all(local_filter_name(style['prompt']) for style in _effect_styles()):
         return jsonify({'success': False, 'error': 'Clé API Runware manquante'})
     
+    # Photo originale : la photo actuelle peut déjà être un effet (autre style choisi après un premier résultat)
+    current = photo_catalog.get(current_photo)
+    source = (current.get('source') if current else None) or current_photo
+    photo_path = os.path.join(PHOTOS_FOLDER, source)
+    if not os.path.exists(photo_path):
+        return jsonify({'success': False, 'error': 'Photo introuvable'})
+    
+    # Un job par style : chaque résultat arrive sur /events dès qu'il est prêt
+    steps, api_key = _effect_params()
+    jobs = [job for job in (effect_queue.submit(photo_path, style['prompt'], steps, api_key, style=style['name'])
+                            for style in _effect_styles()) if job is not None]
+    if not jobs:
+        return jsonify({'success': False, 'error': 'Trop d\'effets en attente, réessayez dans un instant'})
+    return jsonify({'success': True, 'job_id': jobs[0].id, 'job': jobs[0].to_dict(),
+                    'jobs': [job.to_dict() for job in jobs]})
+
+@app.route('/select_effect', methods=['POST'])
+def select_effect():
+    """Choix de l'invité parmi la photo originale et ses effets"""
+    global current_photo
+    filename = (request.get_json(silent=True) or {}).get('filename')
+    current = photo_catalog.get(current_photo) if current_photo else None
+    if not filename or current is None:
+        return jsonify({'success': False, 'error': 'Aucune photo à choisir'})
+    source = current.get('source') or current_photo
+    chosen = photo_catalog.get(filename)
+    if chosen is None or (filename != source and chosen.get('source') != source):
+        return jsonify({'success': False, 'error': 'Photo introuvable'})
+    current_photo = filename
+    return jsonify({'success': True, 'filename': filename})
+
+def _effect_params():
+    """(étapes, clé API) communs à tous les styles"""
+    return int(config.get('effect_steps', 5)), config.get('runware_api_key', '')
+
+def _effect_styles():
+    """Styles configurés dans l'admin, ou à défaut le prompt d'effet unique"""
+    styles = [style for style in config.get('effect_styles') or [] if style.get('prompt')]
+    return styles or [{'name': 'Effet', 'prompt': config.get('effect_prompt') or DEFAULT_EFFECT_PROMPT}]
+
+def _speculate_effect(photo_path):
+    """Mode anticipé : lancer l'effet dès la capture, l'invité le demandera très probablement"""
+    # Nouvelle capture : les effets anticipés des photos précédentes ne seront plus demandés
+    effect_queue.cancel_speculative(keep_source=os.path.basename(photo_path))
+    if not (config.get('effect_enabled', False) and config.get('effect_speculative', False)
+            and config.get('runware_api_key')):
+        return
+    # Seul le premier style est anticipé (dépense API maîtrisée)
+    style = _effect_styles()[0]
     try:
-        # Chemin de la photo actuelle
-        photo_path = os.path.join(PHOTOS_FOLDER, current_photo)
-        
-        if not os.path.exists(photo_path):
-            return jsonify({'success': False, 'error': 'Photo introuvable'})
-        
-        # Exécuter la fonction asynchrone
-        result = asyncio.run(apply_effect_async(photo_path))
-        return result
-            
+        effect_queue.submit(photo_path, style['prompt'], *_effect_params(), origin=ORIGIN_SPECULATIVE,
+                            style=style['name'])
     except Exception as e:
-        logger.info(f"Erreur lors de l'application de l'effet: {e}")
-        return jsonify({'success': False, 'error': f'Erreur IA: {str(e)}'})
+        logger.info(f"[EFFECT] Effet anticipé non lancé: {e}")
+
+@app.route('/admin/effect_budget/reset', methods=['POST'])
+def reset_effect_budget():
+    """Remettre à zéro le compteur d'effets anticipés (nouvel événement)"""
+    if effect_queue.budget is not None:
+        effect_queue.budget.reset()
+    return jsonify({'success': True, 'budget': effect_queue.stats()['speculative']['budget']})
 
-async def apply_effect_async(photo_path):
-    """Fonction asynchrone pour appliquer l'effet IA"""
+def _on_effect_done(job, effect_path):
+    """Image d'effet produite (ou retrouvée dans le cache) : rattachée à sa photo source dans le catalogue"""
     global current_photo
+    effect_filename = os.path.basename(effect_path)
     
-    try:
-        logger.info("[DEBUG IA] Début de l'application de l'effet IA")
-        logger.info(f"[DEBUG IA] Photo source: {photo_path}")
-        logger.info(f"[DEBUG IA] Clé API configurée: {'Oui' if config.get('runware_api_key') else 'Non'}")
-        logger.info(f"[DEBUG IA] Prompt: {config.get('effect_prompt', 'Transform this photo into a beautiful ghibli style')}")
-        
-        # Initialiser Runware
-        logger.info("[DEBUG IA] Initialisation de Runware...")
-        runware = Runware(api_key=config['runware_api_key'])
-        logger.info("[DEBUG IA] Connexion à Runware...")
-        await runware.connect()
-        logger.info("[DEBUG IA] Connexion établie avec succès")
-        
-        # Lire et encoder l'image en base64
-        logger.info("[DEBUG IA] Lecture et encodage de l'image...")
-        with open(photo_path, 'rb') as img_file:
-            img_data = img_file.read()
-            img_base64 = base64.b64encode(img_data).decode('utf-8')
-        logger.info(f"[DEBUG IA] Image encodée: {len(img_base64)} caractères base64")
-        
-        # Préparer la requête d'inférence avec referenceImages (requis pour ce modèle)
-        logger.info("[DEBUG IA] Préparation de la requête d'inférence avec referenceImages...")
-        request = IImageInference(
-            positivePrompt=config.get('effect_prompt', 'Transforme cette image en illustration de style Studio Ghibli'),
-            referenceImages=[f"data:image/jpeg;base64,{img_base64}"],
-            model="runware:106@1",
-            height=752, 
-            width=1392,  
-            steps=config.get('effect_steps', 5),
-            CFGScale=2.5,
-            numberResults=1
-        )
-        logger.info("[DEBUG IA] Requête préparée avec les paramètres de base:")
-        logger.info(f"[DEBUG IA]   - Modèle: runware:106@1")
-        logger.info(f"[DEBUG IA]   - Dimensions: 1392x752")
-        logger.info(f"[DEBUG IA]   - Étapes: {config.get('effect_steps', 5)}")
-        logger.info(f"[DEBUG IA]   - CFG Scale: 2.5")
-        logger.info(f"[DEBUG IA]   - Nombre de résultats: 1")
-        
-        # Appliquer l'effet
-        logger.info("[DEBUG IA] Envoi de la requête à l'API Runware...")
-        # La méthode correcte est imageInference
-        images = await runware.imageInference(requestImage=request)
-        logger.info(f"[DEBUG IA] Réponse reçue: {len(images) if images else 0} image(s) générée(s)")
-        
-        if images and len(images) > 0:
-            # Télécharger l'image transformée
-            logger.info(f"[DEBUG IA] URL de l'image générée: {images[0].imageURL}")
-            logger.info("[DEBUG IA] Téléchargement de l'image transformée...")
-            import requests
-            response = requests.get(images[0].imageURL)
-            logger.info(f"[DEBUG IA] Statut de téléchargement: {response.status_code}")
-            
-            if response.status_code == 200:
-                logger.info(f"[DEBUG IA] Taille de l'image téléchargée: {len(response.content)} bytes")
-                
-                # S'assurer que le dossier effet existe
-                logger.info(f"[DEBUG IA] Vérification du dossier effet: {EFFECT_FOLDER}")
-                os.makedirs(EFFECT_FOLDER, exist_ok=True)
-                logger.info(f"[DEBUG IA] Dossier effet existe: {os.path.exists(EFFECT_FOLDER)}")
-                
-                # Créer un nouveau nom de fichier pour l'image avec effet
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                effect_filename = f'effect_{timestamp}.jpg'
-                effect_path = os.path.join(EFFECT_FOLDER, effect_filename)
-                logger.info(f"[DEBUG IA] Sauvegarde vers: {effect_path}")
-                
-                # Sauvegarder l'image avec effet
-                with open(effect_path, 'wb') as f:
-                    f.write(response.content)
-                logger.info("[DEBUG IA] Image sauvegardée avec succès")
-                
-                # Mettre à jour la photo actuelle
-                current_photo = effect_filename
-                logger.info(f"[DEBUG IA] Photo actuelle mise à jour: {current_photo}")
-                logger.info("[DEBUG IA] Effet appliqué avec succès!")
-                
-                # Envoyer sur Telegram si activé
-                send_type = config.get('telegram_send_type', 'photos')
-                if send_type in ['effet', 'both']:
-                    threading.Thread(target=send_to_telegram, args=(effect_path, config, "effet")).start()
-                
-                return jsonify({
-                    'success': True, 
-                    'message': 'Effet appliqué avec succès!',
-                    'new_filename': effect_filename
-                })
-            else:
-                logger.info(f"[DEBUG IA] ERREUR: Échec du téléchargement (code {response.status_code})")
-                return jsonify({'success': False, 'error': 'Erreur lors du téléchargement de l\'image transformée'})
-        else:
-            logger.info("[DEBUG IA] ERREUR: Aucune image générée par l'IA")
-            return jsonify({'success': False, 'error': 'Aucune image générée par l\'IA'})
-            
-    except Exception as e:
-        logger.info(f"Erreur lors de l'application de l'effet: {e}")
-        return jsonify({'success': False, 'error': f'Erreur IA: {str(e)}'})
+    # La photo actuelle ne change que si l'invité est encore sur la photo source
+    if current_photo == job.source:
+        current_photo = effect_filename
+        logger.info(f"[EFFECT] Photo actuelle mise à jour: {current_photo}")
+    if job.cached:
+        return  # déjà au catalogue et déjà envoyée
+    photo_catalog.add(effect_filename, 'effet', source=job.source)
+    _prefetch_print(effect_path)
+    
+    # Envoyer sur Telegram si activé
+    send_type = config.get('telegram_send_type', 'photos')
+    if send_type in ['effet', 'both']:
+        telegram_outbox.enqueue(effect_path, "effet")
+
+@app.route('/api/effect_jobs')
+def api_effect_jobs():
+    """Inspection de la file des effets IA"""
+    return jsonify({'jobs': effect_queue.list_jobs(), **effect_queue.stats(), 'runware': runware_client.stats()})
+
+@app.route('/api/effect_jobs/<job_id>')
+def api_effect_job(job_id):
+    """Statut d'un effet IA"""
+    job = effect_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job introuvable'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/effect_jobs/<job_id>/cancel', methods=['POST'])
+def cancel_effect_job(job_id):
+    """Annuler un effet IA en attente ou en cours"""
+    if effect_queue.cancel(job_id):
+        return jsonify({'success': True})
+    return jsonify({'success': False, 'error': 'Job introuvable ou déjà terminé'})
+
+@app.route('/api/telegram_outbox')
+def api_telegram_outbox():
+    """File des envois Telegram (?filename=... : envois d'une photo)"""
+    filename = request.args.get('filename')
+    deliveries = telegram_outbox.status(filename) if filename else telegram_outbox.list_entries()
+    return jsonify({'deliveries': deliveries, **telegram_outbox.stats()})
+
+@app.route('/api/telegram_outbox/<entry_id>/retry', methods=['POST'])
+def retry_telegram_delivery(entry_id):
+    """Relancer un envoi Telegram abandonné"""
+    if telegram_outbox.retry(entry_id):
+        return jsonify({'success': True})
+    return jsonify({'success': False, 'error': 'Envoi introuvable ou non abandonné'})
+
+@app.route('/api/led_stats')
+def api_led_stats():
+    """Cadence du moteur LED (frames envoyées, échéances manquées, temps de rendu et d'écriture)"""
+    return jsonify({'led': led_engine_stats()})
 
 @app.route('/admin')
 def admin():
@@ -516,6 +583,22 @@ def save_admin_config():
         
         effect_steps = request.form.get('effect_steps', '5').strip()
         config['effect_steps'] = int(effect_steps) if effect_steps else 5
+        try:
+            config['effect_max_concurrent'] = min(max(int(request.form.get('effect_max_concurrent', '2')), 1), 8)
+        except ValueError:
+            config['effect_max_concurrent'] = 2
+        config['effect_styles'] = parse_effect_styles(request.form.get('effect_styles', ''))
+        config['effect_speculative'] = 'effect_speculative' in request.form
+        local_fallback = request.form.get('effect_local_fallback', '')
+        config['effect_local_fallback'] = local_fallback if local_fallback in LOCAL_FILTERS else ''
+        try:
+            config['effect_speculative_max'] = min(max(int(request.form.get('effect_speculative_max', '1')), 1), 8)
+        except ValueError:
+            config['effect_speculative_max'] = 1
+        try:
+            config['effect_speculative_budget'] = max(int(request.form.get('effect_speculative_budget', '100')), 0)
+        except ValueError:
+            config['effect_speculative_budget'] = 100
         
         config['runware_api_key'] = request.form.get('runware_api_key', '')
         config['telegram_enabled'] = 'telegram_enabled' in request.form
@@ -543,6 +626,11 @@ def save_admin_config():
             config['printer_baudrate'] = int(printer_baudrate)
         except ValueError:
             config['printer_baudrate'] = 9600
+
+        # Imprimantes supplémentaires (pool) : ports séparés par des virgules
+        pool_ports = request.form.get('printer_pool_ports', '').replace(';', ',').split(',')
+        config['printer_pool_ports'] = [port for port in dict.fromkeys(p.strip() for p in pool_ports)
+                                        if port and port != config['printer_port']]
         
         print_resolution = request.form.get('print_resolution', '384').strip()
         try:
@@ -550,6 +638,23 @@ def save_admin_config():
         except ValueError:
             config['print_resolution'] = 384
 
+        config['print_dither_mode'] = normalize_dither_mode(request.form.get('print_dither_mode', 'escpos'))
+        for key, low, high in (('print_contrast', 0.5, 3.0), ('print_gamma', 0.3, 3.0)):
+            try:
+                config[key] = min(max(float(request.form.get(key, '1.0')), low), high)
+            except ValueError:
+                config[key] = 1.0
+
+        try:
+            config['printer_buffer_bytes'] = min(max(int(request.form.get('printer_buffer_bytes', '4096')), 256), 65536)
+        except ValueError:
+            config['printer_buffer_bytes'] = 4096
+
+        config['print_logo_enabled'] = 'print_logo_enabled' in request.form
+        position = request.form.get('print_logo_position', 'header')
+        config['print_logo_position'] = position if position in LOGO_POSITIONS else 'header'
+        config['print_logo_resident'] = 'print_logo_resident' in request.form
+
         led_annimation = request.form.get('led_annimation', 'color_wipe').strip()
         try:
             config['led_annimation'] = int(led_annimation)
@@ -563,6 +668,13 @@ def save_admin_config():
             config['led_delay_transition'] = 1
         
         save_config(config)
+        # Les rasters préparés ne correspondent plus forcément aux réglages d'impression
+        raster_cache.invalidate()
+        # Port ou activation peut-être modifiés : revérifier l'imprimante
+        printer_monitor.poke()
+        # Clé API peut-être modifiée : rouvrir la connexion Runware avant le prochain effet
+        if config.get('effect_enabled', False):
+            runware_client.warm_up(config.get('runware_api_key'))
         flash('Configuration sauvegardée avec succès!', 'success')
         
     except Exception as e:
@@ -590,6 +702,10 @@ def delete_all_photos():
                     os.remove(os.path.join(EFFECT_FOLDER, filename))
                     deleted_count += 1
         
+        photo_catalog.clear()
+        raster_cache.invalidate()
+        shutil.rmtree(os.path.join(CACHE_FOLDER, f'display_{DISPLAY_WIDTH}'), ignore_errors=True)
+        notify_clients_event({'event': 'photos_cleared', 'cursor': photo_catalog.cursor()})
         flash(f'{deleted_count} photo(s) supprimée(s) avec succès!', 'success')
     except Exception as e:
         flash(f'Erreur lors de la suppression: {str(e)}', 'error')
@@ -612,51 +728,70 @@ def download_photo(filename):
         flash(f'Erreur lors du téléchargement: {str(e)}', 'error')
         return redirect(url_for('admin'))
 
+@app.route('/admin/export.zip')
+def export_photos_zip():
+    """Exporter les photos dans une archive ZIP générée à la volée (reprise via Range supportée)
+    - query params : type=all|photo|effet, from=AAAA-MM-JJ, to=AAAA-MM-JJ
+    """
+    export_type = request.args.get('type', 'all')
+    try:
+        date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Format de date invalide (attendu AAAA-MM-JJ)'}), 400
+
+    folders = []
+    if export_type in ('all', 'photo'):
+        folders.append((PHOTOS_FOLDER, 'photos'))
+    if export_type in ('all', 'effet'):
+        folders.append((EFFECT_FOLDER, 'effet'))
+    if not folders:
+        return jsonify({'success': False, 'error': f'Type d\'export inconnu: {export_type}'}), 400
+
+    zip_stream = ZipStream(collect_export_entries(folders, date_from, date_to))
+    etag = zip_stream.etag()
+    total_size = zip_stream.total_size
+
+    # If-Range : ne reprendre que si l'archive n'a pas changé depuis le premier téléchargement
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if not if_range or if_range.strip('"') == etag:
+        try:
+            byte_range = parse_range_header(request.headers.get('Range'), total_size)
+        except ValueError:
+            return Response(status=416, headers={'Content-Range': f'bytes */{total_size}'})
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="photobooth_{datetime.now().strftime("%Y%m%d")}_{export_type}.zip"',
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+        'Cache-Control': 'no-cache',
+    }
+    if byte_range:
+        start, end = byte_range
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end}/{total_size}'
+    else:
+        start, end = 0, total_size - 1
+        status = 200
+    headers['Content-Length'] = str(end - start + 1)
+
+    logger.info(f"[EXPORT] Export ZIP {export_type}: {len(zip_stream.entries)} fichier(s), {total_size} octets, plage {start}-{end}")
+    return Response(stream_with_context(zip_stream.iter_range(start, end)), status=status,
+                    mimetype='application/zip', headers=headers, direct_passthrough=True)
+
 @app.route('/admin/reprint_photo/<filename>', methods=['POST'])
 def reprint_photo(filename):
-    """Réimprimer une photo spécifique"""
+    """Réimprimer une photo spécifique (N copies, rastérisée une seule fois)"""
     try:
-        # Chercher la photo dans les deux dossiers
-        photo_path = None
-        if os.path.exists(os.path.join(PHOTOS_FOLDER, filename)):
-            photo_path = os.path.join(PHOTOS_FOLDER, filename)
-        elif os.path.exists(os.path.join(EFFECT_FOLDER, filename)):
-            photo_path = os.path.join(EFFECT_FOLDER, filename)
-        
+        photo_path = _find_photo_path(filename)
         if photo_path:
-            # Vérifier si le script d'impression existe
-            script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ScriptPythonPOS.py')
-            if not os.path.exists(script_path):
-                flash('Script d\'impression introuvable (ScriptPythonPOS.py)', 'error')
-                return redirect(url_for('admin'))
-            
-            # Utiliser le script d'impression existant
-            import subprocess
-            cmd = [
-                'python3', 'ScriptPythonPOS.py',
-                '--image', photo_path
-            ]
-            
-            # Ajouter le texte de pied de page si défini
-            footer_text = config.get('footer_text', '')
-            if footer_text:
-                cmd.extend(['--text', footer_text])
-            
-            # Ajouter l'option HD si la résolution est élevée
-            print_resolution = config.get('print_resolution', 384)
-            if print_resolution > 384:
-                cmd.append('--hd')
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
-            
-            if result.returncode == 0:
-                flash('Photo réimprimée avec succès!', 'success')
-            else:
-                error_msg = result.stderr.strip() if result.stderr else 'Erreur inconnue'
-                if 'ModuleNotFoundError' in error_msg and 'escpos' in error_msg:
-                    flash('Module escpos manquant. Installez-le avec: pip install python-escpos', 'error')
-                else:
-                    flash(f'Erreur d\'impression: {error_msg}', 'error')
+            try:
+                copies = max(1, min(int(request.form.get('copies', 1)), 20))
+            except ValueError:
+                copies = 1
+            job = _enqueue_print(photo_path, copies=copies, origin='admin')
+            flash(f'Réimpression ajoutée à la file ({copies} copie(s), job {job.id})', 'success')
         else:
             flash('Photo introuvable', 'error')
     except Exception as e:
@@ -664,6 +799,87 @@ def reprint_photo(filename):
     
     return redirect(url_for('admin'))
 
+@app.route('/api/print_jobs')
+def api_print_jobs():
+    """Inspection de la file d'impression"""
+    return jsonify({'jobs': print_queue.list_jobs(), 'pending': print_queue.pending_count(),
+                    'printers': printer_pool().stats(), 'raster_cache': raster_cache.stats()})
+
+@app.route('/api/print_jobs/<job_id>')
+def api_print_job(job_id):
+    """Statut d'un job d'impression"""
+    job = print_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job introuvable'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/admin/print_jobs/<job_id>/cancel', methods=['POST'])
+def cancel_print_job(job_id):
+    """Annuler un job d'impression en attente ou en cours"""
+    if print_queue.cancel(job_id):
+        return jsonify({'success': True})
+    return jsonify({'success': False, 'error': 'Job introuvable ou déjà terminé'}), 404
+
+
+# --- Logo d'impression (graphique résident dans l'imprimante) ---
+
+@app.route('/api/print_logo')
+def api_print_logo():
+    """Logo d'impression : réglages, octets chargés/imprimés et présence dans chaque imprimante"""
+    logo = _print_logo()
+    return jsonify({'exists': os.path.exists(_print_logo_path()),
+                    'enabled': config.get('print_logo_enabled', False),
+                    'logo': logo.to_dict() if logo else None,
+                    'printers': [{'port': p['port'], 'loaded': bool(logo and p['graphics'].get(logo.key.decode()) == logo.digest)}
+                                 for p in printer_pool().stats()]})
+
+@app.route('/admin/print_logo/image')
+def print_logo_image():
+    """Aperçu du logo envoyé"""
+    if not os.path.exists(_print_logo_path()):
+        abort(404)
+    return send_from_directory(ASSETS_FOLDER, PRINT_LOGO_FILE, max_age=0)
+
+@app.route('/admin/print_logo', methods=['POST'])
+def upload_print_logo():
+    """Envoyer le logo d'événement (chargé dans les imprimantes au prochain job)"""
+    global config
+    upload = request.files.get('logo')
+    if upload is None or not upload.filename:
+        return jsonify({'success': False, 'error': 'Aucun fichier'}), 400
+    if upload.filename.rsplit('.', 1)[-1].lower() not in ALLOWED_EXTENSIONS:
+        return jsonify({'success': False, 'error': 'Format accepté : PNG ou JPEG'}), 400
+    try:
+        with Image.open(upload.stream) as img:
+            img.load()
+            os.makedirs(ASSETS_FOLDER, exist_ok=True)
+            img.save(_print_logo_path(), 'PNG')
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Image illisible: {e}'}), 400
+    config['print_logo_enabled'] = True
+    save_config(config)
+    # Les rasters préparés n'ont pas ce logo ; l'empreinte change : rechargement dans les imprimantes
+    raster_cache.invalidate()
+    logo = _print_logo()
+    return jsonify({'success': True, 'logo': logo.to_dict() if logo else None})
+
+@app.route('/admin/print_logo/delete', methods=['POST'])
+def delete_print_logo():
+    """Supprimer le logo d'impression"""
+    global config
+    if os.path.exists(_print_logo_path()):
+        os.remove(_print_logo_path())
+    config['print_logo_enabled'] = False
+    save_config(config)
+    raster_cache.invalidate()
+    return jsonify({'success': True})
+
+@app.route('/admin/print_logo/reload', methods=['POST'])
+def reload_print_logo():
+    """Forcer le rechargement du logo dans les imprimantes (ex: imprimante remplacée)"""
+    printer_pool().forget_graphics()
+    return jsonify({'success': True})
+
 
 # --- Update depuis GitHub (admin) ---
 def _git_update_from_github(branch: str | None = None, repo_dir: str | None = None) -> str:
@@ -738,29 +954,36 @@ def admin_update_from_github():
 
 @app.route('/api/slideshow')
 def get_slideshow_data():
-    """API pour récupérer les données du diaporama"""
-    photos = []
-    
-    # Déterminer le dossier source selon la configuration
-    source_folder = EFFECT_FOLDER if config.get('slideshow_source', 'photos') == 'effet' else PHOTOS_FOLDER
-    
-    if os.path.exists(source_folder):
-        for filename in os.listdir(source_folder):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                photos.append(filename)
+    """API pour récupérer les données du diaporama
+    - sans paramètre : liste complète
+    - ?since=<curseur> : uniquement les photos ajoutées/supprimées depuis le curseur
+    """
+    source = config.get('slideshow_source', 'photos')
+    photo_type = 'effet' if source == 'effet' else 'photo'
+    changes = photo_catalog.changes_since(request.args.get('since'), photo_type)
     
-    photos.sort(reverse=True)  # Plus récentes en premier
+    try:
+        prefetch = int(SETTINGS.get('slideshow_prefetch', 3))
+    except (TypeError, ValueError):
+        prefetch = 3
     
     return jsonify({
         'enabled': config.get('slideshow_enabled', False),
         'delay': config.get('slideshow_delay', 60),
-        'source': config.get('slideshow_source', 'photos'),
-        'photos': photos
+        'source': source,
+        'cursor': changes['cursor'],
+        'reset': changes['reset'],
+        'photos': changes['added'],
+        'removed': changes['removed'],
+        'prefetch': prefetch,
+        'display_url': url_for('serve_display_photo', filename='')
     })
 
 @app.route('/api/printer_status')
 def get_printer_status():
-    """API pour vérifier l'état de l'imprimante"""
+    """API pour vérifier l'état de l'imprimante (refresh=1 : interroger maintenant)"""
+    if request.args.get('refresh') == '1':
+        return jsonify(printer_monitor.refresh())
     return jsonify(check_printer_status())
 
 @app.route('/photos/<filename>')
@@ -775,6 +998,23 @@ def serve_photo(filename):
     else:
         abort(404)
 
+@app.route('/photos/display/<filename>')
+def serve_display_photo(filename):
+    """Servir une version réduite (taille écran) de la photo, générée une seule fois"""
+    if os.path.exists(os.path.join(PHOTOS_FOLDER, filename)):
+        source_path = os.path.join(PHOTOS_FOLDER, filename)
+    elif os.path.exists(os.path.join(EFFECT_FOLDER, filename)):
+        source_path = os.path.join(EFFECT_FOLDER, filename)
+    else:
+        abort(404)
+    display_path = ensure_display_image(source_path, CACHE_FOLDER, DISPLAY_WIDTH)
+    if not display_path:
+        return serve_photo(filename)
+    response = send_from_directory(os.path.dirname(display_path), os.path.basename(display_path))
+    # Le nom de fichier est unique (horodaté) : le navigateur peut garder l'image en cache
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
 @app.route('/video_stream')
 def video_stream():
     """Flux vidéo MJPEG en temps réel"""
@@ -1164,11 +1404,25 @@ def cleanup():
     logger.info("[APP] Arrêt de l'application, nettoyage des ressources...")
     stop_camera_process()
     release_strip()
+    printer_monitor.stop()
+    print_queue.stop()
+    release_printer_pool()
+    effect_queue.stop()
+    runware_client.close()
+    local_effect_engine.close()
+    telegram_outbox.stop()
 
 def signal_handler(sig, frame):
     logger.info("[APP] Signal d'arrêt reçu, fermeture de l'application...")
     stop_camera_process()
     release_strip()
+    printer_monitor.stop()
+    print_queue.stop()
+    release_printer_pool()
+    effect_queue.stop()
+    runware_client.close()
+    local_effect_engine.close()
+    telegram_outbox.stop()
     exit(0)
 
 # === Ajout: endpoints pour la page start / vérification wifi / connexion via QR ===
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Benchmark des modes de tramage pour l'impression thermique.
+
+Mesure, pour chaque mode, le temps de préparation d'une photo à la largeur
+d'impression (384 px en HD, 192 px sinon) : réglage de tons + tramage.
+Le redimensionnement (optimize_image) est mesuré à part car commun à tous les modes.
+
+Usage:
+  python3 bench_dither.py --image photo.jpg
+  python3 bench_dither.py --image photo.jpg --runs 10 --contrast 1.2 --gamma 1.3
+  python3 bench_dither.py --save /tmp/dither   # écrit un PNG par mode pour comparer le rendu
+"""
+
+import os
+import time
+import argparse
+import statistics
+
+import numpy as np
+from PIL import Image
+
+from dither_utils import DITHER_MODES, apply_tone, dither_image
+from printer_service import optimize_image, print_width
+
+
+def synthetic_photo(path):
+    """Dégradé + disque : gris lisses et contours, sans dépendre d'une vraie photo"""
+    height, width = 1200, 1600
+    y, x = np.mgrid[0:height, 0:width]
+    gradient = x / width * 255
+    disk = ((x - width * 0.6) ** 2 + (y - height * 0.5) ** 2) < (height * 0.3) ** 2
+    img = np.where(disk, 255 - gradient, gradient).astype(np.uint8)
+    Image.fromarray(img, 'L').convert('RGB').save(path, quality=90)
+    return path
+
+
+def timed(func, runs):
+    durations = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - started) * 1000)
+    return result, durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark des modes de tramage')
+    parser.add_argument('--image', help='Photo de test (défaut: image synthétique)')
+    parser.add_argument('--runs', type=int, default=5, help='Répétitions par mode')
+    parser.add_argument('--sd', action='store_true', help='Basse densité (192 px) au lieu de 384 px')
+    parser.add_argument('--contrast', type=float, default=1.0)
+    parser.add_argument('--gamma', type=float, default=1.0)
+    parser.add_argument('--save', help='Dossier où écrire le rendu de chaque mode')
+    args = parser.parse_args()
+
+    image_path = args.image or synthetic_photo('/tmp/bench_dither_source.jpg')
+    high_density = not args.sd
+
+    img, resize_ms = timed(lambda: optimize_image(image_path, high_density), args.runs)
+    _, tone_ms = timed(lambda: apply_tone(np.asarray(img), args.contrast, args.gamma), args.runs)
+    print(f"Image {os.path.basename(image_path)} -> {img.size[0]}x{img.size[1]} px "
+          f"(largeur d'impression {print_width(high_density)} px)")
+    print(f"{'redimension':>16}: {statistics.median(resize_ms):7.1f} ms")
+    print(f"{'tons (LUT)':>16}: {statistics.median(tone_ms):7.2f} ms")
+
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+
+    for mode in DITHER_MODES:
+        if mode == 'escpos':
+            # Référence : conversion 1 bit faite par escpos/PIL
+            func = lambda: img.convert('1')
+        else:
+            func = lambda mode=mode: dither_image(img, mode, args.contrast, args.gamma)
+        result, durations = timed(func, args.runs)
+        print(f"{mode:>16}: médiane {statistics.median(durations):7.1f} ms | "
+              f"min {min(durations):7.1f} ms | max {max(durations):7.1f} ms")
+        if args.save:
+            result.save(os.path.join(args.save, f'{mode}.png'))
+
+
+if __name__ == '__main__':
+    main()
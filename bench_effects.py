@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Test de charge de la chaîne des effets IA (file EffectQueue, connexion Runware, téléchargement).
+
+Simule N bornes en parallèle : chacune capture une photo, attend un temps de réflexion
+aléatoire, demande un effet et attend le résultat, plusieurs fois de suite. Mesure pour
+chaque effet le temps de bout en bout vu par l'invité (demande -> image sur disque), l'attente
+dans la file et le temps d'inférence, puis affiche les percentiles et l'occupation de la file.
+
+Sans --url, un serveur Runware simulé (runware_mock.py) est lancé dans le processus : aucun
+crédit consommé, aucune connexion Internet nécessaire.
+
+Usage:
+  python3 bench_effects.py --image photo.jpg
+  python3 bench_effects.py --image photo.jpg --sessions 8 --effects 5 --concurrency 2 --latency 4
+  python3 bench_effects.py --image photo.jpg --sessions 6 --failure-rate 0.1 --max-concurrent 2
+  python3 bench_effects.py --image photo.jpg --url ws://192.168.1.20:8790/v1
+"""
+
+import os
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+
+from effect_service import DEFAULT_EFFECT_PROMPT, EFFECT_DONE, EffectQueue
+from runware_client import RunwareClient
+from runware_mock import RunwareMock
+
+_FINAL = ('done', 'error', 'cancelled')
+
+
+class LoadRun:
+    """Bornes simulées sur une même file d'effets ; résultats et occupation de la file relevés"""
+
+    def __init__(self, queue: EffectQueue, args, photos_dir: str):
+        self.queue = queue
+        self.args = args
+        self.photos_dir = photos_dir
+        self.results = []  # (statut, bout en bout ms, attente file ms, inférence ms)
+        self.refused = 0
+        self.depth = []  # (en attente, en cours) relevés pendant le test
+        self._finished = {}
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._stop = threading.Event()
+
+    def notify(self, payload: dict):
+        job = payload.get('job') or {}
+        if job.get('status') in _FINAL:
+            with self._done:
+                self._finished[job['id']] = job
+                self._done.notify_all()
+
+    def _wait(self, job_id: str, timeout: float) -> dict:
+        with self._done:
+            self._done.wait_for(lambda: job_id in self._finished, timeout)
+            return self._finished.get(job_id) or self.queue.get(job_id)
+
+    def _session(self, number: int):
+        rng = random.Random(number)
+        for n in range(self.args.effects):
+            # Nouvelle capture à chaque effet : nouvelle photo, donc nouvel envoi de la référence
+            photo = os.path.join(self.photos_dir, f'borne{number}_{n}.jpg')
+            shutil.copyfile(self.args.image, photo)
+            time.sleep(rng.expovariate(1 / self.args.think) if self.args.think > 0 else 0)
+            started = time.perf_counter()
+            job = self.queue.submit(photo, self.args.prompt, self.args.steps, self.args.api_key)
+            if job is None:
+                with self._lock:
+                    self.refused += 1
+                continue
+            job = self._wait(job.id, self.args.timeout)
+            elapsed = (time.perf_counter() - started) * 1000
+            queued = (job['started_at'] - job['created_at']) * 1000 if job.get('started_at') else None
+            with self._lock:
+                self.results.append((job['status'], elapsed, queued, job['timings'].get('inference_ms')))
+
+    def _sample(self):
+        while not self._stop.wait(0.1):
+            stats = self.queue.stats()
+            self.depth.append((stats['pending'], stats['running']))
+
+    def run(self) -> float:
+        sampler = threading.Thread(target=self._sample, daemon=True)
+        sampler.start()
+        sessions = [threading.Thread(target=self._session, args=(n,)) for n in range(self.args.sessions)]
+        started = time.perf_counter()
+        for session in sessions:
+            session.start()
+        for session in sessions:
+            session.join()
+        self._stop.set()
+        sampler.join()
+        return time.perf_counter() - started
+
+
+def percentiles(values):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    if len(values) == 1:
+        return {p: values[0] for p in (50, 90, 95, 99)}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {p: cuts[p - 1] for p in (50, 90, 95, 99)}
+
+
+def summary(name, values):
+    values = [v for v in values if v is not None]
+    cuts = percentiles(values)
+    if cuts is None:
+        print(f"{name:>12}: aucune mesure")
+        return
+    print(f"{name:>12}: p50 {cuts[50]:8.1f} ms | p90 {cuts[90]:8.1f} ms | p95 {cuts[95]:8.1f} ms | "
+          f"p99 {cuts[99]:8.1f} ms | max {max(values):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Test de charge des effets IA')
+    parser.add_argument('--image', required=True, help='Photo servant de capture')
+    parser.add_argument('--sessions', type=int, default=4, help='Bornes simulées en parallèle (défaut: 4)')
+    parser.add_argument('--effects', type=int, default=3, help='Effets demandés par borne (défaut: 3)')
+    parser.add_argument('--think', type=float, default=2.0, help='Temps de réflexion moyen avant chaque effet en s')
+    parser.add_argument('--concurrency', type=int, default=2, help='effect_max_concurrent (défaut: 2)')
+    parser.add_argument('--queue-limit', type=int, default=20, help='effect_queue_limit (défaut: 20)')
+    parser.add_argument('--steps', type=int, default=28)
+    parser.add_argument('--prompt', default=DEFAULT_EFFECT_PROMPT)
+    parser.add_argument('--timeout', type=float, default=300.0, help='Attente maximale d\'un effet en s')
+    parser.add_argument('--url', help='Serveur Runware (ou simulé) déjà lancé ; sinon simulé dans le processus')
+    parser.add_argument('--api-key', default='mock', help='Clé API (défaut: mock)')
+    mock = parser.add_argument_group('serveur simulé (sans --url)')
+    mock.add_argument('--latency', type=float, default=3.0, help='Durée moyenne d\'une inférence en s')
+    mock.add_argument('--jitter', type=float, default=0.2, help='Variation relative de la latence')
+    mock.add_argument('--failure-rate', type=float, default=0.0, help='Part des inférences en erreur (0-1)')
+    mock.add_argument('--disconnect-rate', type=float, default=0.0, help='Part des inférences coupant la connexion')
+    mock.add_argument('--max-concurrent', type=int, default=4, help='Inférences simultanées côté serveur')
+    mock.add_argument('--rate-limit', type=int, default=0, help='Inférences acceptées par minute (0 = illimité)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Journaux de la file et du client')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(message)s')
+    server = None
+    if not args.url:
+        server = RunwareMock(port=0, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                             disconnect_rate=args.disconnect_rate, max_concurrent=args.max_concurrent,
+                             rate_limit=args.rate_limit, seed=0).start()
+    client = RunwareClient(url=args.url or server.url)
+    workdir = tempfile.mkdtemp(prefix='bench_effects_')
+    photos_dir = os.path.join(workdir, 'photos')
+    os.makedirs(photos_dir)
+    run = None
+    queue = EffectQueue(client, os.path.join(workdir, 'effet'), concurrency=lambda: args.concurrency,
+                        notify=lambda payload: run.notify(payload), max_pending=args.queue_limit)
+    run = LoadRun(queue, args, photos_dir)
+    try:
+        # Connexion ouverte avant le test, comme au démarrage de l'application
+        client.run(client.connection(args.api_key), 30)
+        duration = run.run()
+    finally:
+        queue.stop()
+        if server is not None:
+            server.close()
+        client.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    done = [r for r in run.results if r[0] == EFFECT_DONE]
+    print(f"{args.sessions} borne(s) x {args.effects} effet(s), effect_max_concurrent={args.concurrency}, "
+          f"serveur {'simulé' if server else args.url}")
+    print(f"Terminés {len(done)} | erreurs {len(run.results) - len(done)} | refusés (file pleine) {run.refused} | "
+          f"durée {duration:.1f} s | débit {len(done) / duration * 60:.1f} effets/min")
+    summary('bout en bout', [r[1] for r in done])
+    summary('file', [r[2] for r in done])
+    summary('inférence', [r[3] for r in done])
+    if run.depth:
+        pending = [p for p, _ in run.depth]
+        print(f"{'file':>12}: en attente moyenne {statistics.mean(pending):.1f} | max {max(pending)} | "
+              f"en cours max {max(r for _, r in run.depth)}")
+    print(f"{'uploads':>12}: {queue.stats()['uploads']} | connexions Runware {client.connects}")
+    if server is not None:
+        print(f"{'serveur':>12}: {server.stats()}")
+
+
+if __name__ == '__main__':
+    main()
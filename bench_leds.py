@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Benchmark du moteur LED (framebuffer NumPy, cadence fixe).
+
+Mesure, pour chaque animation, le temps de rendu d'une frame et d'écriture sur le ruban pour
+--leds LEDs, puis joue chaque animation à --fps images par seconde et compte les échéances
+manquées et la part de CPU utilisée (temps CPU du processus / durée). Objectif : 300 LEDs et
+plus à 50 images/s sans occuper un cœur du Raspberry Pi.
+
+--load N ajoute N threads qui calculent en continu (comme l'encodage des photos ou les effets) pour
+vérifier que la cadence tient quand le processus est chargé.
+
+Sans ruban (PC de dev), les frames vont vers un ruban muet ; --hardware écrit sur le vrai ruban
+(réglages led_* de settings.json).
+
+Usage:
+  python3 bench_leds.py
+  python3 bench_leds.py --leds 600 --fps 60 --duration 5
+  python3 bench_leds.py --load 2
+"""
+
+import time
+import argparse
+import threading
+
+import numpy as np
+
+from led_utilities import _ANIMATIONS, LedEngine, get_strip, pack_frame, release_strip, write_frame
+
+
+class NullStrip:
+    """Ruban muet : garde la dernière frame, show() ne fait rien"""
+
+    def __init__(self, count):
+        self._frame = np.zeros(count, dtype=np.uint32)
+
+    def begin(self):
+        pass
+
+    def numPixels(self):
+        return len(self._frame)
+
+    def set_frame(self, packed):
+        self._frame[:len(packed)] = packed
+
+    def setBrightness(self, brightness):
+        pass
+
+    def show(self):
+        pass
+
+
+def cpu_load(stop_event):
+    """Charge CPU qui relâche le GIL par moments, comme un traitement d'image NumPy"""
+    data = np.random.default_rng(0).random((256, 256))
+    while not stop_event.is_set():
+        data = np.sqrt(data @ data.T) % 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark du moteur LED')
+    parser.add_argument('--leds', type=int, default=300, help='Nombre de LEDs (défaut: 300)')
+    parser.add_argument('--fps', type=float, default=50.0, help='Images par seconde (défaut: 50)')
+    parser.add_argument('--duration', type=float, default=3.0, help='Durée de lecture par animation en s')
+    parser.add_argument('--frames', type=int, default=500, help='Frames pour la mesure de rendu')
+    parser.add_argument('--load', type=int, default=0, help='Threads de charge CPU pendant la lecture')
+    parser.add_argument('--hardware', action='store_true', help='Écrire sur le ruban configuré')
+    args = parser.parse_args()
+
+    strip = get_strip() if args.hardware else NullStrip(args.leds)
+    leds = strip.numPixels()
+    rng = np.random.default_rng(0)
+    print(f"{leds} LEDs, {args.fps:.0f} images/s ({1000 / args.fps:.1f} ms par frame), "
+          f"{args.load} thread(s) de charge")
+    print(f"{'animation':<14} {'rendu µs':>9} {'écriture µs':>12} {'frames':>7} {'manquées':>9} "
+          f"{'retard p99 ms':>14} {'CPU %':>6}")
+
+    stop_load = threading.Event()
+    loaders = [threading.Thread(target=cpu_load, args=(stop_load,), daemon=True) for _ in range(args.load)]
+    for thread in loaders:
+        thread.start()
+    try:
+        for name, (render, _) in _ANIMATIONS.items():
+            fb = np.zeros((leds, 3), dtype=np.uint8)
+            started = time.perf_counter()
+            for step in range(args.frames):
+                render(fb, step, rng)
+            render_us = (time.perf_counter() - started) / args.frames * 1e6
+            packed = pack_frame(fb)
+            started = time.perf_counter()
+            for _ in range(args.frames):
+                write_frame(strip, packed)
+            write_us = (time.perf_counter() - started) / args.frames * 1e6
+
+            engine = LedEngine(strip)
+            stop_event = threading.Event()
+            timer = threading.Timer(args.duration, stop_event.set)
+            cpu_started, started = time.process_time(), time.perf_counter()
+            timer.start()
+            engine.play(name, 1 / args.fps, None, stop_event)
+            elapsed = time.perf_counter() - started
+            cpu = (time.process_time() - cpu_started) / elapsed * 100
+            stats = engine.stats()
+            p99 = stats.get('lateness_ms', {}).get('p99', 0.0)
+            # Avec --load, le temps CPU inclut celui des threads de charge
+            print(f"{name:<14} {render_us:>9.1f} {write_us:>12.1f} {stats['frames']:>7} {stats['missed']:>9} "
+                  f"{p99:>14.2f} {'-' if args.load else f'{cpu:.1f}':>6}")
+    finally:
+        stop_load.set()
+        if args.hardware:
+            release_strip()
+
+
+if __name__ == '__main__':
+    main()
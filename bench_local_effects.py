@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Benchmark des filtres d'effet locaux (secours hors ligne, styles « local:... »).
+
+Mesure, pour chaque filtre, le temps de calcul sur une image 720p (1280 px de grand côté),
+puis le temps complet vu par l'invité (décodage de la photo, filtre, encodage JPEG).
+Objectif : bien moins d'une seconde par photo sur Raspberry Pi 4.
+
+Usage:
+  python3 bench_local_effects.py
+  python3 bench_local_effects.py --image photo.jpg --runs 10
+  python3 bench_local_effects.py --image photo.jpg --save /tmp/filtres   # un JPEG par filtre
+"""
+
+import os
+import time
+import argparse
+import statistics
+
+import cv2
+import numpy as np
+
+from local_effects import LOCAL_FILTERS, LOCAL_MAX_SIDE, LocalEffectEngine, apply_local_filter, load_photo
+
+
+def synthetic_photo(path):
+    """Dégradés de couleur, disque et bandes : aplats, contours et détails fins sans vraie photo"""
+    height, width = 1080, 1920
+    y, x = np.mgrid[0:height, 0:width]
+    img = np.dstack(((x / width * 255), (y / height * 255), ((x + y) / (width + height) * 255))).astype(np.uint8)
+    disk = ((x - width * 0.6) ** 2 + (y - height * 0.5) ** 2) < (height * 0.3) ** 2
+    img[disk] = 255 - img[disk]
+    img[(x // 40) % 2 == 0] //= 2
+    cv2.imwrite(path, img, (cv2.IMWRITE_JPEG_QUALITY, 90))
+    return path
+
+
+def timed(func, runs):
+    durations = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - started) * 1000)
+    return result, durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark des filtres d\'effet locaux')
+    parser.add_argument('--image', help='Photo de test (défaut: image synthétique 1080p)')
+    parser.add_argument('--runs', type=int, default=5, help='Répétitions par filtre')
+    parser.add_argument('--max-side', type=int, default=LOCAL_MAX_SIDE, help='Grand côté traité (défaut: 1280)')
+    parser.add_argument('--save', help='Dossier où écrire le rendu de chaque filtre')
+    args = parser.parse_args()
+
+    image_path = args.image or synthetic_photo('/tmp/bench_local_effects_source.jpg')
+    img, decode_ms = timed(lambda: load_photo(image_path, args.max_side), args.runs)
+    print(f"Image {os.path.basename(image_path)} -> {img.shape[1]}x{img.shape[0]} px")
+    print(f"{'décodage':>10}: médiane {statistics.median(decode_ms):7.1f} ms")
+
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+    engine = LocalEffectEngine(workers=1, max_side=args.max_side)
+    folder = args.save or '/tmp'
+    for name in LOCAL_FILTERS:
+        apply_local_filter(img, name)  # premier appel : tables et masques mis en cache
+        result, durations = timed(lambda name=name: apply_local_filter(img, name), args.runs)
+        totals = []
+        for _ in range(args.runs):
+            tmp_path, timings = engine.render(image_path, name, folder)
+            totals.append(timings['local_ms'])
+            if args.save:
+                os.replace(tmp_path, os.path.join(args.save, f'{name}.jpg'))
+            else:
+                os.unlink(tmp_path)
+        print(f"{name:>10}: filtre médiane {statistics.median(durations):7.1f} ms | "
+              f"min {min(durations):7.1f} ms | max {max(durations):7.1f} ms | "
+              f"complet (décodage + encodage) {statistics.median(totals):7.1f} ms")
+    engine.close()
+
+
+if __name__ == '__main__':
+    main()
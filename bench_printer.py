@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Benchmark du temps jusqu'au premier octet (TTFB) sur la ligne série.
+
+Compare :
+- "subprocess" : l'ancien chemin, un `python3 ScriptPythonPOS.py` par impression
+- "service"    : PrinterService persistant (connexion et modules déjà chargés)
+- "séquentiel" / "streaming" : temps jusqu'au premier mouvement papier quand l'image
+  est entièrement rastérisée avant l'envoi, ou envoyée bande par bande pendant le tramage
+
+Sans imprimante, le script crée un pseudo-terminal et mesure l'instant où le
+premier octet arrive côté maître. Avec --port, on mesure côté client (métriques
+du service) sur une vraie imprimante. Avec --emulate, l'impression complète est
+chronométrée sur l'imprimante virtuelle (printer_emulator.py) au débit et à la
+vitesse de tête simulés.
+
+Usage:
+  python3 bench_printer.py --image photo.jpg
+  python3 bench_printer.py --image photo.jpg --runs 5 --hd
+  python3 bench_printer.py --image photo.jpg --hd --dither floyd_steinberg
+  python3 bench_printer.py --image photo.jpg --emulate --baudrate 9600 --speed 50
+"""
+
+import os
+import sys
+import time
+import tty
+import select
+import argparse
+import statistics
+import subprocess
+import threading
+
+from dither_utils import DITHER_MODES
+from printer_emulator import PrinterEmulator
+from printer_service import PrinterService
+
+
+class PtySink:
+    """
+    Côté maître d'un pty : lit tout ce qui arrive et horodate le premier octet.
+    Répond « papier présent » aux requêtes de statut (DLE EOT) comme une vraie imprimante.
+    """
+
+    def __init__(self):
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.slave_path = os.ttyname(self.slave_fd)
+        self.first_byte_at = None
+        self.bytes_received = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def reset(self):
+        self.first_byte_at = None
+        self.bytes_received = 0
+
+    def _reader(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master_fd, 65536)
+            except OSError:
+                break
+            if data and self.first_byte_at is None:
+                self.first_byte_at = time.perf_counter()
+            self.bytes_received += len(data)
+            for _ in range(data.count(b'\x10\x04')):
+                os.write(self.master_fd, b'\x12')
+
+    def wait_idle(self, idle: float = 0.5, timeout: float = 120.0):
+        deadline = time.perf_counter() + timeout
+        last = -1
+        while time.perf_counter() < deadline:
+            if self.bytes_received == last and self.first_byte_at is not None:
+                return
+            last = self.bytes_received
+            time.sleep(idle)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+
+def bench_subprocess(sink, args):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ScriptPythonPOS.py')
+    cmd = [sys.executable, script, '--image', args.image, '--port', sink.slave_path, '--baudrate', str(args.baudrate)]
+    if args.hd:
+        cmd.append('--hd')
+    sink.reset()
+    started = time.perf_counter()
+    subprocess.run(cmd, capture_output=True)
+    sink.wait_idle()
+    return (sink.first_byte_at - started) * 1000 if sink.first_byte_at else None
+
+
+def bench_service(sink, service, args):
+    sink.reset()
+    started = time.perf_counter()
+    service.print_photo(args.image, high_density=args.hd)
+    sink.wait_idle()
+    return (sink.first_byte_at - started) * 1000 if sink.first_byte_at else None
+
+
+def bench_pipeline(service, args, streamed):
+    """Temps jusqu'au premier mouvement papier, tramage compris (raster jamais en cache)"""
+    if streamed:
+        result = service.print_photo(args.image, high_density=args.hd, dither=args.dither)
+    else:
+        started = time.perf_counter()
+        payload, _ = service.render_job(args.image, high_density=args.hd, dither=args.dither)
+        result = service.send(payload, started_at=started)
+    return result.get('metrics', {}).get('first_motion_ms')
+
+
+def bench_emulated(args):
+    """Impressions complètes sur l'imprimante virtuelle : (premier mouvement, fin d'impression) en ms"""
+    results = []
+    with PrinterEmulator(args.baudrate, args.speed, args.save) as emulator:
+        service = PrinterService(emulator.device, args.baudrate)
+        for run in range(args.runs):
+            started = time.perf_counter()
+            service.print_photo(args.image, high_density=args.hd, dither=args.dither)
+            emulator.wait_for_jobs(run + 1)
+            job = emulator.jobs[-1]
+            results.append(((job.first_motion_at - started) * 1000 if job.first_motion_at else None,
+                            (job.finished_at - started) * 1000))
+        service.close()
+    return results
+
+
+def summary(name, values):
+    values = [v for v in values if v is not None]
+    if not values:
+        print(f"{name:>10}: aucune mesure")
+        return
+    print(f"{name:>10}: médiane {statistics.median(values):7.1f} ms | min {min(values):7.1f} ms | max {max(values):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TTFB impression thermique')
+    parser.add_argument('--image', required=True, help='Image à imprimer')
+    parser.add_argument('--runs', type=int, default=3, help='Nombre d\'impressions par méthode')
+    parser.add_argument('--hd', action='store_true', help='Haute densité')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--dither', default='escpos', choices=DITHER_MODES, help='Tramage (comparaison streaming)')
+    parser.add_argument('--port', help='Vraie imprimante (mesure côté client uniquement)')
+    parser.add_argument('--emulate', action='store_true', help='Imprimante virtuelle à débit et vitesse simulés')
+    parser.add_argument('--speed', type=float, default=50.0, help='Vitesse de tête simulée en mm/s (--emulate)')
+    parser.add_argument('--save', help='Dossier des rendus PNG de l\'imprimante virtuelle (--emulate)')
+    args = parser.parse_args()
+
+    if args.emulate:
+        results = bench_emulated(args)
+        print(f"Imprimante virtuelle {args.baudrate} bps, {args.speed:.0f} mm/s (tramage {args.dither})")
+        summary('1er mvt', [first for first, _ in results])
+        summary('total', [total for _, total in results])
+        return
+
+    if args.port:
+        service = PrinterService(args.port, args.baudrate)
+        ttfbs = []
+        for _ in range(args.runs):
+            result = service.print_photo(args.image, high_density=args.hd)
+            ttfbs.append(result.get('metrics', {}).get('ttfb_ms'))
+        service.close()
+        summary('service', ttfbs)
+        return
+
+    sink = PtySink()
+    try:
+        before = [bench_subprocess(sink, args) for _ in range(args.runs)]
+        service = PrinterService(sink.slave_path, args.baudrate)
+        # Première impression : ouverture du port (non comptée, comme au démarrage de l'app)
+        bench_service(sink, service, args)
+        after = [bench_service(sink, service, args) for _ in range(args.runs)]
+        sequential = [bench_pipeline(service, args, streamed=False) for _ in range(args.runs)]
+        streamed = [bench_pipeline(service, args, streamed=True) for _ in range(args.runs)]
+        service.close()
+    finally:
+        sink.close()
+
+    print(f"TTFB sur {args.runs} impression(s) ({os.path.basename(args.image)}, pty sans limitation de débit)")
+    summary('subprocess', before)
+    summary('service', after)
+    print(f"Premier mouvement papier (tramage {args.dither})")
+    summary('séquentiel', sequential)
+    summary('streaming', streamed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Test de charge des envois Telegram (file TelegramOutbox, limite de débit par chat, albums).
+
+Simule un pic de captures : une photo toutes les --interval secondes, envoyée selon --send-type
+(photos, effet ou both, comme telegram_send_type ; l'effet arrive --effect-delay secondes après
+la photo). Mesure le délai de livraison (ajout à la file -> reçu par Telegram), les albums
+formés, les attentes de budget, les 429 reçus et les octets envoyés par photo livrée (photos
+réduites, file_id réutilisés pour les autres chats).
+
+Sans --url, une Bot API simulée (telegram_mock.py) est lancée dans le processus, avec la limite
+de groupe de Telegram (20 envois par minute) ; --window la raccourcit pour un test rapide.
+
+Usage:
+  python3 bench_telegram.py --image photo.jpg
+  python3 bench_telegram.py --image photo.jpg --photos 60 --interval 1 --send-type both
+  python3 bench_telegram.py --image photo.jpg --window 10 --no-limiter   # sans budget : 429 et retry_after
+"""
+
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+from telegram_mock import TelegramMock
+from telegram_utils import OUTBOX_FAILED, OUTBOX_SENT, ChatRateLimiter, TelegramOutbox, chat_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Test de charge des envois Telegram')
+    parser.add_argument('--image', required=True, help='Photo servant de capture')
+    parser.add_argument('--photos', type=int, default=40, help='Captures simulées (défaut: 40)')
+    parser.add_argument('--interval', type=float, default=1.0, help='Secondes entre deux captures (défaut: 1)')
+    parser.add_argument('--send-type', choices=('photos', 'effet', 'both'), default='photos')
+    parser.add_argument('--effect-delay', type=float, default=5.0, help='Délai de l\'effet après la photo en s')
+    parser.add_argument('--chat-id', default='-1001234567890',
+                        help='Chat(s) de destination, séparés par des virgules (défaut: un groupe)')
+    parser.add_argument('--group-rate', type=int, default=20, help='Envois par fenêtre dans un groupe (défaut: 20)')
+    parser.add_argument('--window', type=float, default=60.0, help='Fenêtre de la limite de groupe en s (défaut: 60)')
+    parser.add_argument('--no-limiter', action='store_true', help='Sans budget par chat : seulement les 429')
+    parser.add_argument('--timeout', type=float, default=900.0, help='Attente maximale des envois en s')
+    parser.add_argument('--url', help='Bot API déjà lancée (ex: http://127.0.0.1:8791/bot) ; sinon simulée')
+    parser.add_argument('--token', default='4242:mock', help='Token du bot (défaut: mock)')
+    mock = parser.add_argument_group('Bot API simulée (sans --url)')
+    mock.add_argument('--latency', type=float, default=0.1, help='Délai par requête en s')
+    mock.add_argument('--uplink-kbps', type=float, default=0.0, help='Débit montant simulé (0 = illimité)')
+    mock.add_argument('--failure-rate', type=float, default=0.0, help='Part des envois en erreur 502 (0-1)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Journaux de la file d\'envoi')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(message)s')
+    server = None
+    if not args.url:
+        server = TelegramMock(port=0, group_rate=args.group_rate, window=args.window, latency=args.latency,
+                              uplink_kbps=args.uplink_kbps, failure_rate=args.failure_rate, seed=0).start()
+    unlimited = (10 ** 6, 1.0)
+    limiter = ChatRateLimiter(unlimited, unlimited) if args.no_limiter else \
+        ChatRateLimiter(group_rate=(args.group_rate, args.window))
+    workdir = tempfile.mkdtemp(prefix='bench_telegram_')
+    config = {'telegram_enabled': True, 'telegram_bot_token': args.token, 'telegram_chat_id': args.chat_id}
+    outbox = TelegramOutbox(os.path.join(workdir, 'telegram_outbox.json'), config=lambda: config,
+                            api_url=args.url or server.url, limiter=limiter)
+    outbox.start()
+    timers = []
+    try:
+        started = time.perf_counter()
+        for n in range(args.photos):
+            photo = os.path.join(workdir, f'photo_{n:04d}.jpg')
+            shutil.copyfile(args.image, photo)
+            if args.send_type in ('photos', 'both'):
+                outbox.enqueue(photo, 'photo')
+            if args.send_type in ('effet', 'both'):
+                effect = os.path.join(workdir, f'effet_{n:04d}.jpg')
+                shutil.copyfile(args.image, effect)
+                timer = threading.Timer(args.effect_delay, outbox.enqueue, args=(effect, 'effet'))
+                timer.start()
+                timers.append(timer)
+            time.sleep(args.interval)
+        for timer in timers:
+            timer.join()
+        expected = args.photos * (2 if args.send_type == 'both' else 1) * len(chat_ids(args.chat_id))
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            finished = [e for e in outbox.list_entries() if e['status'] in (OUTBOX_SENT, OUTBOX_FAILED)]
+            if len(finished) >= expected:
+                break
+            time.sleep(0.2)
+        duration = time.perf_counter() - started
+        stats = outbox.stats()
+    finally:
+        for timer in timers:
+            timer.cancel()
+        outbox.stop()
+        if server is not None:
+            server.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.photos} capture(s) toutes les {args.interval} s ({args.send_type}) vers {args.chat_id}, "
+          f"limite {args.group_rate} envois/{args.window:.0f} s, budget par chat "
+          f"{'désactivé' if args.no_limiter else 'actif'}")
+    print(f"Envoyées {stats['sent']} | abandonnées {stats['failed']} | en attente {stats['pending']} | "
+          f"durée {duration:.1f} s")
+    print(f"Albums {stats['albums']} | attentes de budget {stats['throttle_waits']} | 429 reçus {stats['throttled']} | "
+          f"nouveaux essais {stats['retries']}")
+    latency = stats['latency_s']
+    if latency:
+        print(f"Délai de livraison : p50 {latency['p50']:.1f} s | p90 {latency['p90']:.1f} s | "
+              f"p95 {latency['p95']:.1f} s | p99 {latency['p99']:.1f} s")
+    upload = stats['upload']
+    if upload['uploads']:
+        print(f"Débit montant : {upload['uploads']} photo(s) envoyée(s), {upload['original_bytes'] / 1e6:.1f} Mo "
+              f"d'originaux -> {upload['uploaded_bytes'] / 1e6:.1f} Mo envoyés | {upload['bytes_per_photo'] / 1e3:.0f} ko "
+              f"par photo livrée | file_id réutilisés {upload['file_id_reuses']}")
+    if server is not None:
+        print(f"Serveur : {server.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Nombre de suppressions mémorisées pour le flux incrémental
+_MAX_TOMBSTONES = 1000
+
+
+class PhotoCatalog:
+    """
+    Index en mémoire des photos (originales et effets).
+
+    Chaque ajout/suppression reçoit un numéro de séquence croissant : un client
+    qui connaît son dernier curseur peut demander uniquement les changements
+    depuis ce curseur au lieu de relister les dossiers.
+    Le curseur contient un identifiant d'époque (change à chaque redémarrage) :
+    un curseur d'une époque précédente provoque un renvoi complet.
+    """
+
+    def __init__(self, folders: Dict[str, str]):
+        """folders : type de photo ('photo', 'effet') -> dossier disque"""
+        self.folders = folders
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._entries: Dict[str, dict] = {}
+        self._tombstones: List[Tuple[int, str, str]] = []  # (seq, filename, type)
+        self._tombstone_floor = 0  # curseurs plus anciens : suppressions oubliées -> renvoi complet
+        self._listeners: List[Callable[[str, dict], None]] = []
+
+    # --- Construction ---
+
+    def scan(self):
+        """(Re)charger le catalogue depuis les dossiers (ordre chronologique)."""
+        found = []
+        for photo_type, folder in self.folders.items():
+            if not os.path.isdir(folder):
+                continue
+            for filename in os.listdir(folder):
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                try:
+                    mtime = os.path.getmtime(os.path.join(folder, filename))
+                except OSError:
+                    continue
+                found.append((mtime, filename, photo_type))
+        found.sort()
+        with self._lock:
+            self._entries = {}
+            self._tombstones = []
+            self._tombstone_floor = self._seq
+            for mtime, filename, photo_type in found:
+                self._seq += 1
+                self._entries[filename] = self._make_entry(filename, photo_type, mtime)
+        logger.info(f"[CATALOG] {len(found)} photo(s) indexée(s)")
+
+    def _make_entry(self, filename: str, photo_type: str, mtime: float, source: Optional[str] = None) -> dict:
+        return {
+            'seq': self._seq,
+            'filename': filename,
+            'type': photo_type,
+            'mtime': mtime,
+            'source': source,
+            'effects': [],
+        }
+
+    def add_listener(self, callback: Callable[[str, dict], None]):
+        """callback(action, entry) appelé après chaque ajout ('added') ou suppression ('removed')."""
+        self._listeners.append(callback)
+
+    def _notify(self, action: str, entry: dict):
+        for callback in list(self._listeners):
+            try:
+                callback(action, entry)
+            except Exception as e:
+                logger.info(f"[CATALOG] Erreur listener {action}: {e}")
+
+    # --- Mutations ---
+
+    def add(self, filename: str, photo_type: str, source: Optional[str] = None) -> dict:
+        """Enregistrer une nouvelle photo. source : photo originale pour un effet."""
+        folder = self.folders.get(photo_type)
+        try:
+            mtime = os.path.getmtime(os.path.join(folder, filename)) if folder else time.time()
+        except OSError:
+            mtime = time.time()
+        with self._lock:
+            self._seq += 1
+            entry = self._make_entry(filename, photo_type, mtime, source)
+            self._entries[filename] = entry
+            if source and source in self._entries and filename not in self._entries[source]['effects']:
+                self._entries[source]['effects'].append(filename)
+            snapshot = dict(entry)
+        self._notify('added', snapshot)
+        return snapshot
+
+    def remove(self, filename: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.pop(filename, None)
+            if entry is None:
+                return None
+            self._seq += 1
+            self._tombstones.append((self._seq, filename, entry['type']))
+            self._trim_tombstones()
+            source = entry.get('source')
+            if source and source in self._entries:
+                try:
+                    self._entries[source]['effects'].remove(filename)
+                except ValueError:
+                    pass
+            snapshot = dict(entry)
+        self._notify('removed', snapshot)
+        return snapshot
+
+    # --- Lecture ---
+
+    def get(self, filename: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(filename)
+            return dict(entry, effects=list(entry['effects'])) if entry else None
+
+    def cursor(self) -> str:
+        with self._lock:
+            return f"{self.epoch}:{self._seq}"
+
+    def _parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        if not cursor:
+            return None
+        epoch, _, seq = cursor.partition(':')
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(seq)
+        except ValueError:
+            return None
+
+    def list_photos(self, photo_type: Optional[str] = None) -> List[str]:
+        """Noms de fichiers, plus récents en premier."""
+        with self._lock:
+            entries = [e for e in self._entries.values() if photo_type is None or e['type'] == photo_type]
+        entries.sort(key=lambda e: e['filename'], reverse=True)
+        return [e['filename'] for e in entries]
+
+    def changes_since(self, cursor: Optional[str], photo_type: Optional[str] = None) -> dict:
+        """
+        Changements depuis un curseur.
+        Retourne {'reset', 'cursor', 'added', 'removed'} ; reset=True signifie que
+        'added' contient la liste complète (curseur absent ou d'une autre époque).
+        """
+        since = self._parse_cursor(cursor)
+        with self._lock:
+            current = f"{self.epoch}:{self._seq}"
+            if since is None or since < self._tombstone_floor or since > self._seq:
+                entries = [e for e in self._entries.values() if photo_type is None or e['type'] == photo_type]
+                entries.sort(key=lambda e: e['filename'], reverse=True)
+                return {'reset': True, 'cursor': current, 'added': [e['filename'] for e in entries], 'removed': []}
+            added = [e for e in self._entries.values()
+                     if e['seq'] > since and (photo_type is None or e['type'] == photo_type)]
+            removed = [name for seq, name, t in self._tombstones
+                       if seq > since and (photo_type is None or t == photo_type)]
+        added.sort(key=lambda e: e['filename'], reverse=True)
+        return {'reset': False, 'cursor': current, 'added': [e['filename'] for e in added], 'removed': removed}
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                self._seq += 1
+                self._tombstones.append((self._seq, entry['filename'], entry['type']))
+            self._trim_tombstones()
+            self._entries = {}
+
+    def _trim_tombstones(self):
+        if len(self._tombstones) > _MAX_TOMBSTONES:
+            dropped = self._tombstones[:-_MAX_TOMBSTONES]
+            self._tombstone_floor = dropped[-1][0]
+            self._tombstones = self._tombstones[-_MAX_TOMBSTONES:]
+
+
+def _display_path(filename: str, cache_folder: str, max_width: int) -> str:
+    return os.path.join(cache_folder, f'display_{max_width}', os.path.splitext(filename)[0] + '.jpg')
+
+
+def remove_display_image(filename: str, cache_folder: str, max_width: int = 1280):
+    """Supprimer la version réduite d'une photo supprimée"""
+    try:
+        os.remove(_display_path(filename, cache_folder, max_width))
+    except OSError:
+        pass
+
+
+def ensure_display_image(source_path: str, cache_folder: str, max_width: int = 1280) -> Optional[str]:
+    """
+    Générer (une seule fois) une version réduite de la photo pour l'affichage écran.
+    Retourne le chemin de l'image réduite, ou None si la génération échoue.
+    """
+    filename = os.path.basename(source_path)
+    target_path = _display_path(filename, cache_folder, max_width)
+    target_dir = os.path.dirname(target_path)
+    try:
+        if os.path.exists(target_path) and os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+            return target_path
+        os.makedirs(target_dir, exist_ok=True)
+        with Image.open(source_path) as img:
+            # draft() laisse le décodeur JPEG réduire directement (beaucoup plus rapide sur Pi)
+            img.draft('RGB', (max_width, max_width))
+            img = img.convert('RGB')
+            if img.width > max_width:
+                ratio = max_width / img.width
+                img = img.resize((max_width, int(img.height * ratio)), Image.Resampling.BILINEAR)
+            tmp_path = target_path + '.tmp'
+            img.save(tmp_path, 'JPEG', quality=85, optimize=True)
+        os.replace(tmp_path, target_path)
+        return target_path
+    except Exception as e:
+        logger.info(f"[CATALOG] Impossible de générer l'image d'affichage pour {filename}: {e}")
+        return None
@@ -4,6 +4,8 @@ import logging
 
 PHOTOS_FOLDER = ''
 EFFECT_FOLDER = ''
+CACHE_FOLDER = ''
+ASSETS_FOLDER = ''
 CONFIG_FILE = ''
 SETTINGS_FILE = 'settings.json'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
@@ -18,6 +20,12 @@ DEFAULT_CONFIG = {
     'effect_enabled': False,
     'effect_prompt': 'Transform this photo into a beautiful ghibli style',
     'effect_steps': 5,
+    'effect_styles': [],
+    'effect_max_concurrent': 2,
+    'effect_speculative': False,
+    'effect_speculative_max': 1,
+    'effect_speculative_budget': 100,
+    'effect_local_fallback': 'cartoon',
     'runware_api_key': '',
     'telegram_enabled': False,
     'telegram_bot_token': '',
@@ -28,7 +36,15 @@ DEFAULT_CONFIG = {
     'printer_enabled': True,
     'printer_port': '/dev/ttyAMA0',
     'printer_baudrate': 9600,
+    'printer_pool_ports': [],
     'print_resolution': 384, 
+    'print_dither_mode': 'escpos',
+    'print_contrast': 1.0,
+    'print_gamma': 1.0,
+    'printer_buffer_bytes': 4096,
+    'print_logo_enabled': False,
+    'print_logo_position': 'header',
+    'print_logo_resident': True,
     'led_annimation': 'color_wipe', 
     'led_delay_transition': 1
 }
@@ -41,6 +57,9 @@ def ensure_directories():
     os.makedirs(PHOTOS_FOLDER, exist_ok=True)
     logger.info(f"[DEBUG] Création du dossier effet: {EFFECT_FOLDER}")
     os.makedirs(EFFECT_FOLDER, exist_ok=True)
+    logger.info(f"[DEBUG] Création du dossier cache: {CACHE_FOLDER}")
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    os.makedirs(ASSETS_FOLDER, exist_ok=True)
     logger.info(
         f"[DEBUG] Dossiers créés - Photos: {os.path.exists(PHOTOS_FOLDER)}, Effet: {os.path.exists(EFFECT_FOLDER)}"
     )
@@ -57,7 +76,7 @@ def load_config():
 
 def load_settings():
     """Load settings from JSON"""
-    global PHOTOS_FOLDER, EFFECT_FOLDER, CONFIG_FILE
+    global PHOTOS_FOLDER, EFFECT_FOLDER, CACHE_FOLDER, ASSETS_FOLDER, CONFIG_FILE
     logger.info(f"Chargement des settings : {SETTINGS_FILE}")
     result = {}
     if os.path.exists(SETTINGS_FILE):
@@ -68,6 +87,8 @@ def load_settings():
             pass
     PHOTOS_FOLDER = result.get('photos_folder', 'photos')
     EFFECT_FOLDER = result.get('effect_folder', 'effet')
+    CACHE_FOLDER = result.get('cache_folder', 'cache')
+    ASSETS_FOLDER = result.get('assets_folder', 'assets')
     CONFIG_FILE = result.get('config_file', 'config.json')
 
     return result
@@ -0,0 +1,150 @@
+import logging
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Modes de tramage disponibles pour l'impression thermique
+#   escpos          : conversion interne d'escpos (Floyd-Steinberg de PIL), comportement historique
+#   threshold       : seuil simple, le plus rapide, rendu "affiche"
+#   bayer           : tramage ordonné 8x8, rapide, motif régulier
+#   atkinson        : diffusion d'erreur partielle, contrastée (style Mac classique)
+#   floyd_steinberg : diffusion d'erreur complète, le plus fidèle
+DITHER_MODES = ('escpos', 'threshold', 'bayer', 'atkinson', 'floyd_steinberg')
+
+# Noyaux de diffusion : (dy, dx, poids)
+_KERNELS = {
+    'floyd_steinberg': ((0, 1, 7 / 16), (1, -1, 3 / 16), (1, 0, 5 / 16), (1, 1, 1 / 16)),
+    'atkinson': ((0, 1, 1 / 8), (0, 2, 1 / 8), (1, -1, 1 / 8), (1, 0, 1 / 8), (1, 1, 1 / 8), (2, 0, 1 / 8)),
+}
+# Marges du tampon d'erreur : aucun test de bord dans la boucle
+_PAD = 2
+
+
+def _bayer_matrix(n: int = 8) -> np.ndarray:
+    matrix = np.array([[0, 2], [3, 1]], dtype=np.float32)
+    while matrix.shape[0] < n:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    # Seuils centrés dans ]0, 255[
+    return (matrix + 0.5) * (255.0 / matrix.size)
+
+
+_BAYER_8 = _bayer_matrix(8)
+
+
+def build_tone_lut(contrast: float = 1.0, gamma: float = 1.0) -> np.ndarray:
+    """
+    Table de correspondance 256 niveaux : contraste (autour du gris moyen) puis gamma.
+    gamma > 1 éclaircit les tons moyens (utile : le papier thermique bouche les gris).
+    """
+    levels = np.arange(256, dtype=np.float32) / 255.0
+    levels = (levels - 0.5) * float(contrast) + 0.5
+    levels = np.clip(levels, 0.0, 1.0) ** (1.0 / max(float(gamma), 0.01))
+    return np.round(levels * 255.0).astype(np.uint8)
+
+
+def apply_tone(gray: np.ndarray, contrast: float = 1.0, gamma: float = 1.0) -> np.ndarray:
+    """Appliquer contraste/gamma par LUT (une indexation, pas de calcul par pixel)"""
+    if contrast == 1.0 and gamma == 1.0:
+        return gray
+    return build_tone_lut(contrast, gamma)[gray]
+
+
+class BandDitherer:
+    """
+    Tramage d'une image en niveaux de gris, bande par bande.
+
+    Les bandes doivent être fournies dans l'ordre et avoir toutes la même largeur.
+    Pour la diffusion d'erreur, les lignes d'erreur qui débordent sous une bande
+    sont reportées sur la suivante : le résultat est identique à un tramage de
+    l'image entière.
+
+    Diffusion vectorisée par fronts d'onde : le pixel (y, x) ne dépend que de
+    pixels de front t = x + 2y plus petit (gauche, et ligne du dessus jusqu'à x+1),
+    donc tous les pixels d'un même front se traitent en une seule opération NumPy.
+    """
+
+    def __init__(self, mode: str, width: int):
+        if mode not in DITHER_MODES or mode == 'escpos':
+            raise ValueError(f"Mode de tramage non géré par NumPy: {mode}")
+        self.mode = mode
+        self.width = width
+        self._y = 0  # ligne absolue du haut de la prochaine bande (phase Bayer)
+        self._carry = np.zeros((_PAD, width + 2 * _PAD), dtype=np.float32)
+
+    def process(self, band: np.ndarray) -> np.ndarray:
+        """band : uint8 (h, width). Retourne un tableau booléen (True = point noir)."""
+        if band.ndim != 2 or band.shape[1] != self.width:
+            raise ValueError(f"Bande de largeur {band.shape[-1]} au lieu de {self.width}")
+        height = band.shape[0]
+        if self.mode == 'threshold':
+            result = band < 128
+        elif self.mode == 'bayer':
+            rows = (np.arange(height) + self._y) % 8
+            thresholds = _BAYER_8[rows][:, np.arange(self.width) % 8]
+            result = band < thresholds
+        else:
+            result = self._diffuse(band)
+        self._y += height
+        return result
+
+    def _diffuse(self, band: np.ndarray) -> np.ndarray:
+        height, width = band.shape
+        kernel = _KERNELS[self.mode]
+        buf = np.zeros((height + _PAD, width + 2 * _PAD), dtype=np.float32)
+        buf[:height, _PAD:_PAD + width] = band
+        buf[:_PAD] += self._carry  # erreurs reçues de la bande précédente
+        out = np.zeros((height, width), dtype=bool)
+
+        all_rows = np.arange(height)
+        for t in range(width + 2 * (height - 1)):
+            # Pixels du front t : x = t - 2y, 0 <= x < width
+            y_min = max(0, (t - width) // 2 + 1)
+            y_max = min(height - 1, t // 2)
+            if y_min > y_max:
+                continue
+            ys = all_rows[y_min:y_max + 1]
+            xs = t - 2 * ys + _PAD
+            values = buf[ys, xs]
+            black = values < 128.0
+            out[ys, xs - _PAD] = black
+            errors = values - np.where(black, 0.0, 255.0).astype(np.float32)
+            # Une opération par coefficient : dans un même coefficient les cibles sont distinctes
+            for dy, dx, weight in kernel:
+                buf[ys + dy, xs + dx] += errors * weight
+
+        # Erreurs diffusées sous la bande : reportées sur la suivante
+        self._carry = buf[height:height + _PAD].copy()
+        return out
+
+
+def iter_dither_bands(gray: np.ndarray, mode: str, band_height: int = 24) -> Iterator[Tuple[int, np.ndarray]]:
+    """Générateur (y, bande booléenne) pour streamer l'impression pendant le tramage."""
+    ditherer = BandDitherer(mode, gray.shape[1])
+    for y in range(0, gray.shape[0], band_height):
+        yield y, ditherer.process(gray[y:y + band_height])
+
+
+def dither_array(gray: np.ndarray, mode: str) -> np.ndarray:
+    """Tramer une image complète. Retourne un tableau booléen (True = point noir)."""
+    return BandDitherer(mode, gray.shape[1]).process(gray)
+
+
+def dither_image(img: Image.Image, mode: str = 'escpos', contrast: float = 1.0, gamma: float = 1.0) -> Image.Image:
+    """
+    Préparer une image 'L' pour l'imprimante.
+    Retourne une image 'L' en noir/blanc pur (0/255) : la conversion 1 bit d'escpos
+    la laisse alors intacte. En mode 'escpos', seul le réglage de tons est appliqué.
+    """
+    gray = apply_tone(np.asarray(img.convert('L')), contrast, gamma)
+    if mode == 'escpos':
+        return Image.fromarray(gray, 'L')
+    black = dither_array(gray, mode)
+    return Image.fromarray(np.where(black, 0, 255).astype(np.uint8), 'L')
+
+
+def normalize_dither_mode(mode: Optional[str]) -> str:
+    """Mode connu ou 'escpos' par défaut"""
+    return mode if mode in DITHER_MODES else 'escpos'
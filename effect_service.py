@@ -0,0 +1,821 @@
+import io
+import os
+import json
+import time
+import uuid
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image, ImageOps
+from runware import IImageInference
+
+from local_effects import LocalEffectEngine, local_filter_name
+from runware_client import RunwareClient
+
+logger = logging.getLogger(__name__)
+
+EFFECT_MODEL = 'runware:106@1'
+EFFECT_WIDTH = 1392
+EFFECT_HEIGHT = 752
+EFFECT_CFG_SCALE = 2.5
+DEFAULT_EFFECT_PROMPT = 'Transform this photo into a beautiful ghibli style'
+# Qualité JPEG de l'image de référence envoyée (réduite à la taille de travail du modèle)
+REFERENCE_QUALITY = 85
+# Images de référence déjà envoyées (imageUUID Runware) gardées pour les effets suivants
+_MAX_REFERENCES = 50
+
+EFFECT_QUEUED = 'queued'
+EFFECT_RUNNING = 'running'
+EFFECT_READY = 'ready'  # effet anticipé terminé, en attente de l'appui de l'invité
+EFFECT_DONE = 'done'
+EFFECT_ERROR = 'error'
+EFFECT_CANCELLED = 'cancelled'
+_FINAL_STATUSES = (EFFECT_DONE, EFFECT_ERROR, EFFECT_CANCELLED)
+
+# Effet lancé dès la capture, avant que l'invité ne le demande (priorité basse)
+ORIGIN_SPECULATIVE = 'speculative'
+# Résultat anticipé gardé à part jusqu'à l'appui (extension ignorée par la galerie et le catalogue)
+HELD_SUFFIX = '.held'
+
+# Jobs terminés gardés pour /api/effect_jobs
+_MAX_FINISHED_JOBS = 30
+# Réveil périodique des workers (changement de la limite de concurrence)
+_WORKER_WAIT_S = 1.0
+
+
+def prepare_reference(photo_path: str, width: int = EFFECT_WIDTH, height: int = EFFECT_HEIGHT,
+                      quality: int = REFERENCE_QUALITY) -> bytes:
+    """
+    Photo réduite juste assez pour couvrir la taille de sortie du modèle puis réencodée en JPEG :
+    le modèle travaille à cette taille, les pixels en plus ne font qu'alourdir l'envoi.
+    """
+    with Image.open(photo_path) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        scale = max(width / img.width, height / img.height)
+        if scale < 1:
+            img = img.resize((round(img.width * scale), round(img.height * scale)), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def data_uri(jpeg: bytes) -> str:
+    return f"data:image/jpeg;base64,{base64.b64encode(jpeg).decode('utf-8')}"
+
+
+def parse_effect_styles(text: str) -> List[dict]:
+    """Styles de l'admin, un par ligne « Nom | prompt » (sans nom : « Style N »)."""
+    styles = []
+    for line in (text or '').splitlines():
+        name, sep, prompt = line.partition('|')
+        if not sep:
+            name, prompt = '', name
+        name, prompt = name.strip(), prompt.strip()
+        if prompt:
+            styles.append({'name': name or f'Style {len(styles) + 1}', 'prompt': prompt})
+    return styles
+
+
+def build_effect_request(reference: str, prompt: str, steps: int) -> IImageInference:
+    """Requête d'inférence Runware ; reference : imageUUID déjà envoyé ou image en data URI"""
+    # referenceImages est requis pour ce modèle
+    return IImageInference(
+        positivePrompt=prompt,
+        referenceImages=[reference],
+        model=EFFECT_MODEL,
+        height=EFFECT_HEIGHT,
+        width=EFFECT_WIDTH,
+        steps=steps,
+        CFGScale=EFFECT_CFG_SCALE,
+        numberResults=1
+    )
+
+
+class EffectCache:
+    """
+    Index persistant contenu -> image d'effet déjà produite : empreinte de la photo source et paramètres
+    de génération (prompt, modèle, étapes, CFG, dimensions). Un même effet redemandé sur la même photo
+    est servi sans nouvelle inférence Runware.
+    Taille bornée (max_entries, éviction LRU) : seule l'entrée d'index disparaît, l'image reste dans la galerie.
+    """
+
+    def __init__(self, index_path: str, folder: str, max_entries: int = 200):
+        self.index_path = index_path
+        self.folder = folder
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._digests: "OrderedDict[tuple, str]" = OrderedDict()  # (chemin, taille, mtime) -> sha256
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self._entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self._entries = OrderedDict()
+
+    def _save(self):
+        """Écriture atomique de l'index (verrou tenu)."""
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self._entries.items()), f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.info(f"[EFFECT] Index du cache d'effets non sauvegardé: {e}")
+
+    def _digest(self, photo_path: str) -> str:
+        stat = os.stat(photo_path)
+        file_key = (os.path.abspath(photo_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(file_key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(photo_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._digests[file_key] = digest
+                while len(self._digests) > self.max_entries:
+                    self._digests.popitem(last=False)
+        return digest
+
+    def key(self, photo_path: str, prompt: str, steps: int) -> str:
+        params = json.dumps([self._digest(photo_path), prompt, EFFECT_MODEL, steps, EFFECT_CFG_SCALE,
+                             EFFECT_WIDTH, EFFECT_HEIGHT])
+        return hashlib.sha256(params.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Nom du fichier d'effet pour cette clé (None si absent ou supprimé depuis)."""
+        with self._lock:
+            filename = self._entries.get(key)
+            if filename is not None and not os.path.exists(os.path.join(self.folder, filename)):
+                del self._entries[key]
+                self._save()
+                filename = None
+            if filename is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return filename
+
+    def contains(self, key: str) -> bool:
+        """Présent sans compter de succès/échec (effets anticipés)."""
+        with self._lock:
+            filename = self._entries.get(key)
+        return filename is not None and os.path.exists(os.path.join(self.folder, filename))
+
+    def put(self, key: str, filename: str):
+        with self._lock:
+            self._entries[key] = filename
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': round(self.hits / lookups, 3) if lookups else None}
+
+
+class EffectBudget:
+    """
+    Nombre d'effets anticipés lancés pour l'événement en cours (dépense API), gardé sur disque.
+    limit() <= 0 : pas de limite. reset() depuis l'admin au début d'un nouvel événement.
+    """
+
+    def __init__(self, path: str, limit: Callable[[], int]):
+        self.path = path
+        self._limit = limit
+        self._lock = threading.Lock()
+        self.used = 0
+        self.since = time.time()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.used, self.since = int(data.get('used', 0)), float(data.get('since', self.since))
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def limit(self) -> int:
+        try:
+            return int(self._limit())
+        except (TypeError, ValueError):
+            return 0
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({'used': self.used, 'since': self.since}, f)
+        except OSError as e:
+            logger.info(f"[EFFECT] Budget d'effets non sauvegardé: {e}")
+
+    def available(self) -> bool:
+        limit = self.limit()
+        with self._lock:
+            return limit <= 0 or self.used < limit
+
+    def try_spend(self) -> bool:
+        limit = self.limit()
+        with self._lock:
+            if 0 < limit <= self.used:
+                return False
+            self.used += 1
+            self._save()
+            return True
+
+    def reset(self):
+        with self._lock:
+            self.used = 0
+            self.since = time.time()
+            self._save()
+
+    def to_dict(self) -> dict:
+        limit = self.limit()
+        with self._lock:
+            return {'used': self.used, 'limit': limit, 'since': self.since,
+                    'remaining': max(limit - self.used, 0) if limit > 0 else None}
+
+
+class EffectJob:
+    """Une demande d'effet IA sur une photo."""
+
+    def __init__(self, photo_path: str, prompt: str, steps: int, api_key: str, origin: str = 'guest',
+                 style: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.photo_path = photo_path
+        self.source = os.path.basename(photo_path)
+        self.style = style  # nom du style choisi dans l'admin
+        self.prompt = prompt
+        self.steps = steps
+        self.api_key = api_key
+        self.origin = origin
+        self.status = EFFECT_QUEUED
+        self.stage: Optional[str] = None  # prepare, inference, download
+        self.result: Optional[str] = None  # nom du fichier produit
+        self.cache_key: Optional[str] = None
+        self.cached = False  # résultat servi par le cache, sans inférence
+        self.speculated = origin == ORIGIN_SPECULATIVE  # lancé avant la demande de l'invité
+        self.engine = 'local' if local_filter_name(prompt) else 'runware'
+        self.held_path: Optional[str] = None  # résultat anticipé pas encore réclamé
+        self.claimed_at = None
+        self.error = None
+        self.timings: dict = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINAL_STATUSES
+
+    @property
+    def speculative(self) -> bool:
+        """Anticipé et pas (encore) demandé par l'invité"""
+        return self.origin == ORIGIN_SPECULATIVE
+
+    def same_request(self, photo_path: str, prompt: str, steps: int) -> bool:
+        return (self.photo_path, self.prompt, self.steps) == (photo_path, prompt, steps)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'source': self.source,
+            'style': self.style,
+            'origin': self.origin,
+            'status': self.status,
+            'stage': self.stage,
+            'result': self.result,
+            'cached': self.cached,
+            'speculated': self.speculated,
+            'engine': self.engine,
+            'error': self.error,
+            'timings': self.timings,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class EffectQueue:
+    """
+    Effets IA en arrière-plan : la requête HTTP rend la main tout de suite avec un id de job,
+    l'avancement et le résultat partent via notify(payload) (ex: SSE /events).
+    Au plus concurrency() effets à la fois (inférences Runware simultanées) et max_pending en attente.
+    on_done(job, path) reçoit chaque image produite (catalogue, Telegram...) ou servie par le cache
+    (job.cached : image déjà dans le catalogue).
+
+    Effets anticipés (origin=ORIGIN_SPECULATIVE) : lancés dès la capture, ils passent après les demandes
+    des invités, au plus speculative_limit() à la fois et dans la limite du budget. Leur résultat est
+    gardé à part (statut ready) et n'est publié (catalogue, on_done) que si l'invité demande l'effet.
+
+    Styles « local:<filtre> » : calculés sur place par local_engine (OpenCV), sans Runware. Si une inférence
+    Runware échoue (réseau coupé, clé absente...), fallback_filter() donne le filtre local appliqué à la place
+    (None : l'effet échoue) ; ce résultat de secours n'entre pas dans le cache.
+    """
+
+    def __init__(self, client: RunwareClient, output_folder: str, concurrency: Callable[[], int],
+                 notify: Optional[Callable[[dict], None]] = None,
+                 on_done: Optional[Callable[[EffectJob, str], None]] = None, max_pending: int = 20,
+                 cache: Optional[EffectCache] = None, speculative_limit: Callable[[], int] = lambda: 1,
+                 budget: Optional[EffectBudget] = None, local_engine: Optional[LocalEffectEngine] = None,
+                 fallback_filter: Callable[[], Optional[str]] = lambda: None):
+        self._client = client
+        self.local_engine = local_engine
+        self._fallback_filter = fallback_filter
+        self.output_folder = output_folder
+        self.cache = cache
+        self.budget = budget
+        self._speculative_limit = speculative_limit
+        self._concurrency = concurrency
+        self._notify = notify or (lambda payload: None)
+        self._on_done = on_done or (lambda job, path: None)
+        self.max_pending = max_pending
+        self._pending: "deque[EffectJob]" = deque()
+        self._jobs: "OrderedDict[str, EffectJob]" = OrderedDict()
+        self._active: List[EffectJob] = []  # jobs en cours de traitement
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._workers: List[threading.Thread] = []
+        self._stop = threading.Event()
+        # (photo, clé API) -> imageUUID : une photo n'est envoyée qu'une fois pour tous ses effets
+        self._references: "OrderedDict[tuple, str]" = OrderedDict()
+        self._reference_locks: Dict[tuple, threading.Lock] = {}
+        self.upload_stats = {'uploads': 0, 'reused': 0, 'inline': 0, 'original_bytes': 0, 'uploaded_bytes': 0}
+        self._turnarounds: "deque[float]" = deque(maxlen=20)  # durée totale des derniers effets (ms)
+        self.speculative_stats = {'submitted': 0, 'claimed': 0, 'cancelled': 0, 'over_budget': 0}
+        self.fallbacks = 0  # effets Runware remplacés par un filtre local
+        self._discard_held_files()
+
+    def concurrency(self) -> int:
+        try:
+            return max(1, int(self._concurrency()))
+        except (TypeError, ValueError):
+            return 1
+
+    def speculative_limit(self) -> int:
+        try:
+            return max(0, int(self._speculative_limit()))
+        except (TypeError, ValueError):
+            return 0
+
+    def stop(self):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    # --- API ---
+
+    def submit(self, photo_path: str, prompt: str, steps: int, api_key: str,
+               origin: str = 'guest', style: Optional[str] = None) -> Optional[EffectJob]:
+        """
+        Job ajouté (ou celui déjà en cours pour la même photo et le même effet) ; None si la file est pleine.
+        Effet déjà produit (cache) : job terminé immédiatement avec l'image existante.
+        Effet anticipé pour cette demande : réclamé (terminé immédiatement s'il est prêt).
+        """
+        speculative = origin == ORIGIN_SPECULATIVE
+        if speculative and (self.speculative_limit() == 0 or (self.budget and not self.budget.available())):
+            return None
+        cache_key = self.cache.key(photo_path, prompt, steps) if self.cache else None
+        if speculative and cache_key and self.cache.contains(cache_key):
+            return None  # déjà produit : rien à anticiper
+        # Effet anticipé : pas de lecture du cache, un échec compté fausserait le taux de succès des invités
+        cached = self.cache.get(cache_key) if cache_key and not speculative else None
+        if cached is not None:
+            return self._cached_job(photo_path, prompt, steps, api_key, origin, style, cache_key, cached)
+        with self._wakeup:
+            for job in self._jobs.values():
+                if not job.finished and job.same_request(photo_path, prompt, steps):
+                    held_path = self._claim(job) if job.speculative and not speculative else None
+                    break
+            else:
+                job = None
+        if job is not None:
+            if held_path:
+                self._complete(job, held_path)  # déjà prêt : publié avant de répondre
+            return job
+        with self._wakeup:
+            if len(self._pending) >= self.max_pending:
+                logger.info(f"[EFFECT] File pleine ({len(self._pending)} en attente), effet refusé")
+                return None
+            job = EffectJob(photo_path, prompt, steps, api_key, origin, style)
+            job.cache_key = cache_key
+            self._jobs[job.id] = job
+            self._prune()
+            self._pending.append(job)
+            if speculative:
+                self.speculative_stats['submitted'] += 1
+            self._sync_workers()
+            self._wakeup.notify_all()
+        logger.info(f"[EFFECT] Job {job.id} ajouté: {job.source} ({origin})")
+        self._publish(job)
+        return job
+
+    def _claim(self, job: EffectJob) -> Optional[str]:
+        """
+        L'invité demande un effet déjà anticipé (verrou tenu) : il devient prioritaire.
+        Retourne le fichier du résultat s'il est déjà prêt (à publier hors verrou).
+        """
+        job.origin = 'guest'
+        job.claimed_at = time.time()
+        self.speculative_stats['claimed'] += 1
+        logger.info(f"[EFFECT] Effet anticipé {job.id} réclamé ({job.status})")
+        self._wakeup.notify_all()
+        if job.status != EFFECT_READY:
+            return None
+        job.status = EFFECT_RUNNING
+        return job.held_path
+
+    def _cached_job(self, photo_path: str, prompt: str, steps: int, api_key: str, origin: str,
+                    style: Optional[str], cache_key: str, filename: str) -> EffectJob:
+        job = EffectJob(photo_path, prompt, steps, api_key, origin, style)
+        job.cache_key = cache_key
+        job.cached = True
+        job.result = filename
+        job.started_at = job.created_at
+        job.timings = {'cache': 'hit', 'total_ms': 0.0}
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            self._on_done(job, os.path.join(self.output_folder, filename))
+        except Exception as e:
+            logger.info(f"[EFFECT] Erreur après l'effet {job.id}: {e}")
+        logger.info(f"[EFFECT] Job {job.id}: effet déjà produit pour {job.source} -> {filename} (cache)")
+        self._finish(job, EFFECT_DONE)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Annuler un effet : en attente il ne partira pas, en cours son résultat est ignoré."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        with self._lock:
+            held_path = job.held_path if job.status == EFFECT_READY else None
+            final = job.status in (EFFECT_QUEUED, EFFECT_READY)
+            if job.speculative:
+                self.speculative_stats['cancelled'] += 1
+        if held_path:
+            self._remove(held_path)
+        if final:
+            self._finish(job, EFFECT_CANCELLED, 'Effet annulé')
+        logger.info(f"[EFFECT] Annulation demandée pour le job {job_id}")
+        return True
+
+    def cancel_source(self, source: str) -> int:
+        """Annuler les effets d'une photo (photo supprimée)."""
+        with self._lock:
+            job_ids = [job.id for job in self._jobs.values() if job.source == source and not job.finished]
+        return sum(self.cancel(job_id) for job_id in job_ids)
+
+    def cancel_speculative(self, keep_source: Optional[str] = None) -> int:
+        """Annuler les effets anticipés non réclamés (nouvelle capture : l'invité est passé à autre chose)."""
+        with self._lock:
+            job_ids = [job.id for job in self._jobs.values()
+                       if job.speculative and not job.finished and job.source != keep_source]
+        return sum(self.cancel(job_id) for job_id in job_ids)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list_jobs(self) -> List[dict]:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            speculative = dict(self.speculative_stats,
+                               running=sum(1 for job in self._active if job.speculative),
+                               ready=sum(1 for job in self._jobs.values() if job.status == EFFECT_READY),
+                               limit=self.speculative_limit(),
+                               budget=self.budget.to_dict() if self.budget else None)
+            return {'pending': len(self._pending), 'running': len(self._active), 'concurrency': self.concurrency(),
+                    'max_pending': self.max_pending, 'uploads': dict(self.upload_stats),
+                    'turnaround_ms_avg': round(sum(self._turnarounds) / len(self._turnarounds), 1)
+                    if self._turnarounds else None,
+                    'cache': self.cache.stats() if self.cache else None, 'speculative': speculative,
+                    'local': self.local_engine.stats() if self.local_engine else None, 'fallbacks': self.fallbacks}
+
+    # --- Workers ---
+
+    def _sync_workers(self):
+        """Autant de workers que la limite de concurrence (verrou tenu)."""
+        self._workers = [w for w in self._workers if w.is_alive()]
+        self._stop.clear()
+        while len(self._workers) < self.concurrency():
+            worker = threading.Thread(target=self._run, daemon=True, name=f'effect-worker-{len(self._workers)}')
+            self._workers.append(worker)
+            worker.start()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:-_MAX_FINISHED_JOBS] if len(finished) > _MAX_FINISHED_JOBS else []:
+            del self._jobs[job_id]
+
+    def _publish(self, job: EffectJob):
+        try:
+            self._notify({'event': 'effect_job', 'job': job.to_dict()})
+        except Exception as e:
+            logger.info(f"[EFFECT] Erreur notification: {e}")
+
+    def _finish(self, job: EffectJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        self._publish(job)
+
+    def _next_job(self) -> Optional[EffectJob]:
+        """Prochain job à lancer (verrou tenu) : demandes des invités d'abord, anticipés ensuite."""
+        for job in [job for job in self._pending if job.finished]:
+            self._pending.remove(job)  # annulé pendant l'attente
+        # Limites relues à chaque fois : une baisse dans l'admin s'applique aux jobs suivants
+        if len(self._active) >= self.concurrency():
+            return None
+        for job in self._pending:
+            if not job.speculative:
+                return job
+        if sum(1 for job in self._active if job.speculative) >= self.speculative_limit():
+            return None
+        for job in self._pending:
+            if self.budget is None or self.budget.try_spend():
+                return job
+            # Budget de l'événement épuisé : les effets anticipés restants ne partiront pas
+            self.speculative_stats['over_budget'] += 1
+            job.status = EFFECT_CANCELLED
+            job.error = 'Budget d\'effets anticipés épuisé'
+            job.finished_at = time.time()
+            self._publish(job)
+        return None
+
+    def _take(self) -> Optional[EffectJob]:
+        with self._wakeup:
+            job = self._next_job()
+            if job is not None:
+                self._pending.remove(job)
+                self._active.append(job)
+                # En cours dès la sortie de la file (verrou tenu) : cancel() ne peut plus le clore à la place du worker
+                job.status = EFFECT_RUNNING
+                job.started_at = time.time()
+                return job
+            self._wakeup.wait(_WORKER_WAIT_S)
+            return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self._take()
+            if job is None:
+                continue
+            try:
+                self._process(job)
+            except Exception as e:
+                if job.cancel_event.is_set():
+                    # Annulé pendant l'inférence : l'échec qui suit n'est pas une erreur IA
+                    logger.info(f"[EFFECT] Job {job.id} annulé ({e})")
+                    self._finish(job, EFFECT_CANCELLED)
+                else:
+                    logger.info(f"[EFFECT] Erreur job {job.id}: {e}")
+                    self._finish(job, EFFECT_ERROR, f'Erreur IA: {e}')
+            finally:
+                with self._wakeup:
+                    self._active.remove(job)
+                    self._wakeup.notify_all()
+
+    def _stage(self, job: EffectJob, stage: str):
+        job.stage = stage
+        self._publish(job)
+
+    def _process(self, job: EffectJob):
+        if job.cancel_event.is_set():
+            # Annulé juste après sa sortie de la file : pas d'appel Runware
+            self._finish(job, EFFECT_CANCELLED, 'Effet annulé')
+            return
+        filter_name = local_filter_name(job.prompt)
+        if filter_name is None:
+            try:
+                self._process_runware(job)
+                return
+            except Exception as e:
+                filter_name = self._fallback()
+                if filter_name is None or job.cancel_event.is_set():
+                    raise
+                # Pas d'IA (réseau, clé, service) : l'invité repart quand même avec un effet
+                logger.info(f"[EFFECT] Job {job.id}: Runware indisponible ({e}), filtre local {filter_name}")
+                job.engine = 'local'
+                job.cache_key = None  # le vrai effet IA reste à produire pour cette photo
+                job.timings['fallback'] = str(e)[:200]
+                with self._lock:
+                    self.fallbacks += 1
+        self._process_local(job, filter_name)
+
+    def _fallback(self) -> Optional[str]:
+        if self.local_engine is None:
+            return None
+        try:
+            return self._fallback_filter() or None
+        except Exception:
+            return None
+
+    def _process_local(self, job: EffectJob, filter_name: str):
+        if self.local_engine is None:
+            raise ValueError('Effets locaux indisponibles')
+        self._stage(job, 'local')
+        os.makedirs(self.output_folder, exist_ok=True)
+        tmp_path, timings = self.local_engine.render(job.photo_path, filter_name, self.output_folder)
+        job.timings.update(timings)
+        self._deliver(job, tmp_path)
+
+    def _process_runware(self, job: EffectJob):
+        if not job.api_key:
+            raise ValueError('Clé API Runware manquante')
+        self._stage(job, 'prepare')
+        reference = self._reference(job)
+
+        self._stage(job, 'inference')
+        try:
+            images, timings = self._client.image_inference(
+                job.api_key, build_effect_request(reference, job.prompt, job.steps))
+        except Exception as e:
+            if job.timings.get('reference') != 'reused':
+                raise
+            # Image envoyée plus tôt peut-être expirée côté Runware : renvoyer la photo une fois
+            logger.info(f"[EFFECT] Référence {reference} refusée ({e}), nouvel envoi")
+            self._forget_reference(job)
+            reference = self._reference(job)
+            images, timings = self._client.image_inference(
+                job.api_key, build_effect_request(reference, job.prompt, job.steps))
+        job.timings.update(timings)
+        logger.info(f"[EFFECT] Job {job.id}: {len(images) if images else 0} image(s), connexion "
+                    f"{timings['connect_ms']} ms ({'réutilisée' if timings['reused'] else 'nouvelle'}), "
+                    f"inférence {timings['inference_ms']} ms")
+        if job.cancel_event.is_set():
+            self._finish(job, EFFECT_CANCELLED)
+            return
+        if not images:
+            self._finish(job, EFFECT_ERROR, 'Aucune image générée par l\'IA')
+            return
+
+        self._stage(job, 'download')
+        os.makedirs(self.output_folder, exist_ok=True)
+        try:
+            tmp_path, timings = self._client.download_to(images[0].imageURL, self.output_folder)
+        except Exception as e:
+            # Remonté à _process : CDN injoignable, l'effet local prend le relais s'il est activé
+            raise RuntimeError(f'Erreur lors du téléchargement de l\'image transformée ({e})') from e
+        job.timings.update(timings)
+        self._deliver(job, tmp_path)
+
+    def _deliver(self, job: EffectJob, tmp_path: str):
+        """Image produite (fichier temporaire) : gardée de côté si anticipée, sinon publiée."""
+        if job.cancel_event.is_set():
+            os.unlink(tmp_path)
+            self._finish(job, EFFECT_CANCELLED, 'Effet annulé')
+            return
+
+        with self._lock:
+            if job.speculative:
+                # Personne ne l'a encore demandé : résultat gardé de côté jusqu'à l'appui
+                job.held_path = os.path.join(self.output_folder, f'.{job.id}{HELD_SUFFIX}')
+                os.replace(tmp_path, job.held_path)
+                job.status = EFFECT_READY
+                job.timings['total_ms'] = round((time.time() - job.started_at) * 1000, 1)
+        if job.status == EFFECT_READY:
+            logger.info(f"[EFFECT] Effet anticipé {job.id} prêt pour {job.source} {job.timings}")
+            self._publish(job)
+            return
+        self._complete(job, tmp_path)
+
+    def _complete(self, job: EffectJob, tmp_path: str):
+        """Image définitive : place dans le dossier des effets, cache, on_done puis statut done."""
+        try:
+            path = self._commit(job, tmp_path)
+        except OSError as e:
+            self._finish(job, EFFECT_ERROR, f'Erreur lors de l\'enregistrement de l\'effet ({e})')
+            return
+        job.held_path = None
+        job.result = os.path.basename(path)
+        if self.cache is not None and job.cache_key:
+            self.cache.put(job.cache_key, job.result)
+        try:
+            self._on_done(job, path)
+        except Exception as e:
+            logger.info(f"[EFFECT] Erreur après l'effet {job.id}: {e}")
+        if job.claimed_at is not None:
+            # Effet anticipé : attente vue par l'invité depuis son appui
+            job.timings['wait_ms'] = turnaround = round((time.time() - job.claimed_at) * 1000, 1)
+        else:
+            job.timings['total_ms'] = turnaround = round((time.time() - job.started_at) * 1000, 1)
+        with self._lock:
+            self._turnarounds.append(turnaround)
+        logger.info(f"[EFFECT] Job {job.id} terminé: {job.result} {job.timings}")
+        self._finish(job, EFFECT_DONE)
+
+    def _reference_key(self, job: EffectJob) -> tuple:
+        stat = os.stat(job.photo_path)
+        api_key_hash = hashlib.sha1(job.api_key.encode()).hexdigest()[:8]  # UUID valable pour ce compte
+        return os.path.abspath(job.photo_path), stat.st_size, stat.st_mtime_ns, api_key_hash
+
+    def _forget_reference(self, job: EffectJob):
+        with self._lock:
+            self._references.pop(self._reference_key(job), None)
+
+    def _reference(self, job: EffectJob) -> str:
+        """imageUUID de la photo (envoyée une seule fois) ou, à défaut, data URI de la photo réduite."""
+        key = self._reference_key(job)
+        with self._lock:
+            lock = self._reference_locks.setdefault(key, threading.Lock())
+        # Plusieurs styles de la même photo lancés ensemble : un seul envoi, les autres attendent son imageUUID
+        with lock:
+            return self._upload_reference(job, key)
+
+    def _upload_reference(self, job: EffectJob, key: tuple) -> str:
+        with self._lock:
+            image_uuid = self._references.get(key)
+            if image_uuid is not None:
+                self._references.move_to_end(key)
+                self.upload_stats['reused'] += 1
+        if image_uuid is not None:
+            job.timings.update({'reference': 'reused', 'upload_bytes': 0, 'upload_ms': 0.0})
+            return image_uuid
+
+        started = time.perf_counter()
+        jpeg = prepare_reference(job.photo_path)
+        job.timings['prepare_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        job.timings['original_bytes'] = key[1]
+        job.timings['upload_bytes'] = len(jpeg)
+        reference = data_uri(jpeg)
+        started = time.perf_counter()
+        try:
+            image_uuid, upload_timings = self._client.upload_image(job.api_key, reference)
+            job.timings['upload_connect_ms'] = upload_timings['connect_ms']
+        except Exception as e:
+            logger.info(f"[EFFECT] Envoi préalable impossible ({e}), image intégrée à la requête")
+            image_uuid = None
+        with self._lock:
+            self.upload_stats['original_bytes'] += key[1]
+            self.upload_stats['uploaded_bytes'] += len(jpeg)
+            if image_uuid is None:
+                self.upload_stats['inline'] += 1
+            else:
+                self.upload_stats['uploads'] += 1
+                self._references[key] = image_uuid
+                while len(self._references) > _MAX_REFERENCES:
+                    self._references.popitem(last=False)
+            if len(self._reference_locks) > _MAX_REFERENCES:
+                for stale in [k for k, l in self._reference_locks.items() if k != key and not l.locked()]:
+                    del self._reference_locks[stale]
+        if image_uuid is None:
+            job.timings['reference'] = 'inline'
+            logger.info(f"[EFFECT] Référence intégrée: {len(jpeg)} octets (original {key[1]})")
+            return reference
+        job.timings['upload_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        job.timings['reference'] = 'uploaded'
+        logger.info(f"[EFFECT] Référence envoyée: {len(jpeg)} octets (original {key[1]}) "
+                    f"en {job.timings['upload_ms']} ms -> {image_uuid}")
+        return image_uuid
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _discard_held_files(self):
+        """Résultats anticipés jamais réclamés avant un redémarrage"""
+        try:
+            names = os.listdir(self.output_folder)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith(HELD_SUFFIX):
+                self._remove(os.path.join(self.output_folder, name))
+
+    def _commit(self, job: EffectJob, tmp_path: str) -> str:
+        """Fichier téléchargé renommé à sa place définitive : jamais d'image à moitié écrite visible."""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(self.output_folder, f'effect_{timestamp}.jpg')
+        with self._lock:
+            if os.path.exists(path):
+                # Plusieurs effets terminés dans la même seconde
+                path = os.path.join(self.output_folder, f'effect_{timestamp}_{job.id[:6]}.jpg')
+            os.replace(tmp_path, path)
+        return path
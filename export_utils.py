@@ -0,0 +1,314 @@
+import os
+import struct
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, date
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Taille des blocs lus sur la carte SD : la mémoire utilisée reste constante
+# quelle que soit la taille de l'export.
+CHUNK_SIZE = 64 * 1024
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+_ZIP64_MARKER = 0xFFFFFFFF
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_VERSION_DEFAULT = 20
+_VERSION_ZIP64 = 45
+
+# Cache des CRC32 déjà calculés : (chemin, taille, mtime_ns) -> crc
+# Permet de reprendre un téléchargement (Range) sans relire tous les fichiers précédents.
+# Plein : les CRC les moins récemment utilisés sont oubliés (ceux de l'export en cours restent).
+_crc_cache: "OrderedDict[tuple, int]" = OrderedDict()
+_crc_cache_lock = threading.Lock()
+_CRC_CACHE_MAX = 20000
+
+
+class ExportEntry:
+    """Un fichier de l'archive : chemin disque, nom dans le ZIP et métadonnées figées au début de l'export."""
+
+    __slots__ = ('path', 'arcname', 'size', 'mtime', 'mtime_ns', 'name_bytes')
+
+    def __init__(self, path: str, arcname: str):
+        st = os.stat(path)
+        self.path = path
+        self.arcname = arcname
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.name_bytes = arcname.encode('utf-8')
+
+    @property
+    def zip64(self) -> bool:
+        return self.size >= ZIP64_LIMIT
+
+    def cache_key(self):
+        return (self.path, self.size, self.mtime_ns)
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    dt = datetime.fromtimestamp(timestamp)
+    if dt.year < 1980:
+        dt = datetime(1980, 1, 1)
+    dos_time = (dt.hour << 11) | (dt.minute << 5) | (dt.second // 2)
+    dos_date = ((dt.year - 1980) << 9) | (dt.month << 5) | dt.day
+    return dos_time, dos_date
+
+
+def _cached_crc(entry: ExportEntry) -> Optional[int]:
+    key = entry.cache_key()
+    with _crc_cache_lock:
+        crc = _crc_cache.get(key)
+        if crc is not None:
+            _crc_cache.move_to_end(key)
+        return crc
+
+
+def _store_crc(entry: ExportEntry, crc: int):
+    with _crc_cache_lock:
+        _crc_cache[entry.cache_key()] = crc
+        _crc_cache.move_to_end(entry.cache_key())
+        while len(_crc_cache) > _CRC_CACHE_MAX:
+            _crc_cache.popitem(last=False)
+
+
+def _compute_crc(entry: ExportEntry) -> int:
+    crc = _cached_crc(entry)
+    if crc is not None:
+        return crc
+    crc = 0
+    with open(entry.path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+    _store_crc(entry, crc)
+    return crc
+
+
+def collect_export_entries(folders: List[Tuple[str, str]],
+                           date_from: Optional[date] = None,
+                           date_to: Optional[date] = None) -> List[ExportEntry]:
+    """
+    Construire la liste des fichiers à exporter.
+    - folders : liste de (dossier disque, préfixe dans l'archive)
+    - date_from / date_to : bornes incluses sur la date de modification du fichier
+    """
+    entries = []
+    for folder, prefix in folders:
+        if not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+                continue
+            path = os.path.join(folder, filename)
+            try:
+                entry = ExportEntry(path, f"{prefix}/{filename}")
+            except OSError:
+                continue
+            file_day = datetime.fromtimestamp(entry.mtime).date()
+            if date_from and file_day < date_from:
+                continue
+            if date_to and file_day > date_to:
+                continue
+            entries.append(entry)
+    return entries
+
+
+class ZipStream:
+    """
+    Archive ZIP "stored" (sans recompression) générée à la volée.
+
+    La taille totale et la position de chaque octet sont connues à l'avance
+    (seules les tailles des fichiers sont nécessaires), ce qui permet :
+    - d'annoncer un Content-Length exact
+    - de servir n'importe quelle plage d'octets (reprise de téléchargement)
+    Les CRC32 sont calculés pendant l'envoi et placés dans les data descriptors
+    et le répertoire central, en fin d'archive. ZIP64 est utilisé automatiquement
+    au-delà de 4 Go.
+    """
+
+    def __init__(self, entries: List[ExportEntry]):
+        self.entries = entries
+        self._segments = []  # (offset, longueur, type, index entrée)
+        self._offsets = []   # offset du header local de chaque entrée
+        offset = 0
+        for i, entry in enumerate(entries):
+            self._offsets.append(offset)
+            header_len = len(self._local_header(entry))
+            self._segments.append((offset, header_len, 'header', i))
+            offset += header_len
+            self._segments.append((offset, entry.size, 'data', i))
+            offset += entry.size
+            descriptor_len = 24 if entry.zip64 else 16
+            self._segments.append((offset, descriptor_len, 'descriptor', i))
+            offset += descriptor_len
+        self._cd_offset = offset
+        for i, entry in enumerate(entries):
+            cd_len = len(self._central_header(entry, i, 0))
+            self._segments.append((offset, cd_len, 'central', i))
+            offset += cd_len
+        self._cd_size = offset - self._cd_offset
+        end_len = len(self._end_records())
+        self._segments.append((offset, end_len, 'end', -1))
+        offset += end_len
+        self.total_size = offset
+
+    # --- Structures ZIP ---
+
+    def _local_header(self, entry: ExportEntry) -> bytes:
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        extra = b''
+        size_field = entry.size
+        version = _VERSION_DEFAULT
+        if entry.zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, entry.size, entry.size)
+            size_field = _ZIP64_MARKER
+            version = _VERSION_ZIP64
+        # Les tailles sont renseignées dès le header local (utile aux décompresseurs en flux),
+        # le CRC arrive dans le data descriptor.
+        return struct.pack(
+            '<IHHHHHIIIHH',
+            0x04034b50, version, _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8, 0,
+            dos_time, dos_date, 0, size_field, size_field,
+            len(entry.name_bytes), len(extra)
+        ) + entry.name_bytes + extra
+
+    def _descriptor(self, entry: ExportEntry, crc: int) -> bytes:
+        if entry.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, crc, entry.size, entry.size)
+        return struct.pack('<IIII', 0x08074b50, crc, entry.size, entry.size)
+
+    def _central_header(self, entry: ExportEntry, index: int, crc: int) -> bytes:
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        offset = self._offsets[index]
+        zip64_fields = []
+        size_field = entry.size
+        offset_field = offset
+        if entry.zip64:
+            zip64_fields += [entry.size, entry.size]
+            size_field = _ZIP64_MARKER
+        if offset >= ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset_field = _ZIP64_MARKER
+        extra = b''
+        version = _VERSION_DEFAULT
+        if zip64_fields:
+            extra = struct.pack('<HH', 0x0001, 8 * len(zip64_fields)) + struct.pack(f'<{len(zip64_fields)}Q', *zip64_fields)
+            version = _VERSION_ZIP64
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII',
+            0x02014b50, version, version, _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8, 0,
+            dos_time, dos_date, crc, size_field, size_field,
+            len(entry.name_bytes), len(extra), 0, 0, 0, 0o100644 << 16, offset_field
+        ) + entry.name_bytes + extra
+
+    def _end_records(self) -> bytes:
+        count = len(self.entries)
+        cd_offset = self._cd_offset
+        cd_size = self._cd_size
+        records = b''
+        if count >= ZIP_FILECOUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            zip64_end_offset = cd_offset + cd_size
+            records += struct.pack(
+                '<IQHHIIQQQQ',
+                0x06064b50, 44, _VERSION_ZIP64, _VERSION_ZIP64, 0, 0,
+                count, count, cd_size, cd_offset
+            )
+            records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+            count = min(count, 0xFFFF)
+            cd_offset = min(cd_offset, _ZIP64_MARKER)
+            cd_size = min(cd_size, _ZIP64_MARKER)
+        records += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0)
+        return records
+
+    # --- Génération ---
+
+    def etag(self) -> str:
+        """Identifiant stable du contenu (pour If-Range)."""
+        h = hashlib.sha1()
+        for entry in self.entries:
+            h.update(entry.name_bytes)
+            h.update(struct.pack('<QQ', entry.size, entry.mtime_ns))
+        return h.hexdigest()
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Générer les octets [start, end] (bornes incluses) de l'archive."""
+        if end is None or end >= self.total_size:
+            end = self.total_size - 1
+        for seg_offset, seg_len, kind, index in self._segments:
+            seg_end = seg_offset + seg_len - 1
+            if seg_len == 0 or seg_end < start:
+                continue
+            if seg_offset > end:
+                break
+            lo = max(start, seg_offset) - seg_offset
+            hi = min(end, seg_end) - seg_offset + 1
+            if kind == 'data':
+                yield from self._iter_file(self.entries[index], lo, hi)
+                continue
+            if kind == 'header':
+                data = self._local_header(self.entries[index])
+            elif kind == 'descriptor':
+                entry = self.entries[index]
+                data = self._descriptor(entry, _compute_crc(entry))
+            elif kind == 'central':
+                entry = self.entries[index]
+                data = self._central_header(entry, index, _compute_crc(entry))
+            else:
+                data = self._end_records()
+            yield data[lo:hi]
+
+    def _iter_file(self, entry: ExportEntry, lo: int, hi: int) -> Iterator[bytes]:
+        # Lecture complète du fichier : on calcule le CRC au passage
+        full_read = lo == 0 and hi == entry.size and _cached_crc(entry) is None
+        crc = 0
+        remaining = hi - lo
+        with open(entry.path, 'rb') as f:
+            if lo:
+                f.seek(lo)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"Fichier tronqué pendant l'export: {entry.path}")
+                if full_read:
+                    crc = zlib.crc32(chunk, crc)
+                remaining -= len(chunk)
+                yield chunk
+        if full_read:
+            _store_crc(entry, crc)
+
+
+def parse_range_header(range_header: Optional[str], total_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Analyser un en-tête Range à plage unique ("bytes=a-b", "bytes=a-", "bytes=-n").
+    Retourne (début, fin) inclus, None si absent/non supporté.
+    Lève ValueError si la plage n'est pas satisfiable.
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    spec = range_header[len('bytes='):].strip()
+    if ',' in spec or '-' not in spec:
+        return None
+    first, last = spec.split('-', 1)
+    try:
+        if first == '':
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError("Plage vide")
+            return max(0, total_size - suffix), total_size - 1
+        start = int(first)
+        end = int(last) if last else total_size - 1
+    except (TypeError, ValueError):
+        raise ValueError(f"Plage invalide: {range_header}")
+    if start >= total_size or start > end:
+        raise ValueError(f"Plage non satisfiable: {range_header}")
+    return start, min(end, total_size - 1)
@@ -36,6 +36,10 @@ except Exception:
         def setPixelColor(self, i: int, color):
             self._pixels[int(i)] = int(color)
 
+        def set_frame(self, packed):
+            """Écriture d'une frame entière (uint32 0x00RRGGBB par LED), comme le memmove du vrai ruban"""
+            self._pixels[:len(packed)] = [int(v) for v in packed]
+
         def getPixelColor(self, i: int) -> int:
             return int(self._pixels[int(i)])
 
@@ -54,11 +58,15 @@ except Exception:
             print("".join(out))
 
 import time
+import ctypes
 import threading
-import random
 import math
+from collections import deque
+from functools import lru_cache
 from config_utils import SETTINGS
-from typing import Optional, List, Union, Dict, Any
+from typing import Optional, List, Union, Dict, Any, Tuple
+
+import numpy as np
 
 
 # couleurs différentes sur chaque LED
@@ -144,9 +152,7 @@ def release_strip():
         if _strip_singleton is None:
             return
         try:
-            for i in range(_strip_singleton.numPixels()):
-                _strip_singleton.setPixelColor(i, Color(0, 0, 0))
-            _strip_singleton.show()
+            clear_strip(_strip_singleton)
         except Exception:
             pass
         _strip_singleton = None
@@ -167,8 +173,6 @@ def _ensure_strip(use_strip):
     return strip, created
 
 
-# === Nouveaux effets d'animation ===
-
 def wheel(pos: int) -> Color:
     """Generate rainbow Color from 0-255."""
     pos = pos % 256
@@ -180,202 +184,285 @@ def wheel(pos: int) -> Color:
     pos -= 170
     return Color(0, pos * 3, 255 - pos * 3)
 
-def animation_color_wipe(strip, delay, iterations, stop_event):
-    """Color wipe: each LED takes next color of provided palette (cyclic)."""
-    palette = colors.copy()
-    step = 0
-    while not stop_event.is_set() and (iterations is None or step < iterations):
-        for i in range(strip.numPixels()):
-            strip.setPixelColor(i, palette[i % len(palette)])
-        strip.show()
-        if stop_event.wait(delay):
-            break
-        palette = rotate_colors_right(palette, 1)
-        step += 1
-
-def animation_chase(strip, delay, iterations, stop_event):
-    """Chase: une LED allumée se déplace le long du ruban, couleur cyclique."""
-    palette = colors.copy()
-    length = strip.numPixels()
-    step = 0
-    offset = 0
-    while not stop_event.is_set() and (iterations is None or step < iterations):
-        for i in range(length):
-            color = palette[(i + offset) % len(palette)]
-            strip.setPixelColor(i, color if (i % 3) == (offset % 3) else Color(0,0,0))
-        strip.show()
-        if stop_event.wait(delay):
-            break
-        offset = (offset + 1) % len(palette)
-        step += 1
-
-def animation_theater_chase(strip, delay, iterations, stop_event):
-    """Theater chase: groupe de LEDs allumé puis décalé (cinéma)."""
-    palette = colors.copy()
-    q = 0
-    step = 0
-    length = strip.numPixels()
-    while not stop_event.is_set() and (iterations is None or step < iterations):
-        for i in range(length):
-            strip.setPixelColor(i, palette[(i + q) % len(palette)] if (i % 3) == 0 else Color(0,0,0))
-        strip.show()
-        if stop_event.wait(delay):
-            break
-        q = (q + 1) % 3
-        step += 1
-
-def animation_rainbow_cycle(strip, delay, iterations, stop_event):
-    """Rainbow cycle sur tout le ruban (utilise wheel)."""
-    length = strip.numPixels()
-    j = 0
-    step = 0
-    while not stop_event.is_set() and (iterations is None or step < iterations):
-        for i in range(length):
-            strip.setPixelColor(i, wheel((int((i * 256 / length) + j)) & 255))
-        strip.show()
-        if stop_event.wait(delay):
-            break
-        j = (j + 1) % 256
-        step += 1
-
-def animation_scanner(strip, delay, iterations, stop_event):
-    """Scanner / Larson: une LED brillante va et vient (effet 'Cylon')."""
-    color = colors[0] if colors else Color(255, 0, 0)
-    length = strip.numPixels()
-    pos = 0
-    direction = 1
-    step = 0
-    while not stop_event.is_set() and (iterations is None or step < iterations):
-        for i in range(length):
-            # gradient trail
-            dist = abs(i - pos)
-            if dist == 0:
-                strip.setPixelColor(i, color)
-            elif dist == 1:
-                strip.setPixelColor(i, Color(int((color >> 16) * 0.4), int(((color >> 8) & 0xFF) * 0.4), int((color & 0xFF) * 0.4)))
-            else:
-                strip.setPixelColor(i, Color(0,0,0))
-        strip.show()
-        if stop_event.wait(delay):
-            break
-        pos += direction
-        if pos >= length - 1 or pos <= 0:
-            direction *= -1
-        step += 1
-
-def animation_pulse(strip, delay, iterations, stop_event):
-    """Pulse (respiration) : intensité de la palette varie."""
-    palette = colors.copy()
-    length = strip.numPixels()
-    step = 0
-    # compute brightness multiplier from 0.2 to 1.0
-    while not stop_event.is_set() and (iterations is None or step < iterations):
-        for t in range(0, 100):
-            if stop_event.is_set():
-                break
-            factor = 0.2 + 0.8 * (0.5 * (1 + math.sin(2 * math.pi * t / 100)))
-            for i in range(length):
-                c = palette[i % len(palette)]
-                r = int(((c >> 16) & 0xFF) * factor)
-                g = int(((c >> 8) & 0xFF) * factor)
-                b = int((c & 0xFF) * factor)
-                strip.setPixelColor(i, Color(r, g, b))
-            strip.show()
-            if stop_event.wait(delay):
-                break
-        step += 1
-
-def animation_twinkle(strip, delay, iterations, stop_event):
-    """Twinkle aléatoire : LEDs clignotent avec couleurs aléatoires."""
-    length = strip.numPixels()
-    step = 0
-    while not stop_event.is_set() and (iterations is None or step < iterations):
-        # random subset
-        for _ in range(max(1, length // 3)):
-            i = random.randrange(0, length)
-            c = random.choice(colors)
-            strip.setPixelColor(i, c)
-        strip.show()
-        if stop_event.wait(delay):
-            break
-        # fade out a little
-        for i in range(length):
-            # small fade towards off
-            c = strip.getPixelColor(i)
-            r = max(0, ((c >> 16) & 0xFF) - 20)
-            g = max(0, ((c >> 8) & 0xFF) - 20)
-            b = max(0, (c & 0xFF) - 20)
-            strip.setPixelColor(i, Color(r, g, b))
-        strip.show()
-        if stop_event.wait(delay):
-            break
-        step += 1
-
-def _animation_all_color(strip, delay, iterations, stop_event, color, brightness=255):
-    """Met toutes les LEDs en blanc. Reste ainsi en boucle si iterations=None."""
-    length = strip.numPixels()
-    step = 0
+
+# === Écriture d'une frame complète sur le ruban ===
+
+def pack_frame(fb: np.ndarray) -> np.ndarray:
+    """Framebuffer (N, 3) uint8 RGB -> (N,) uint32 0x00RRGGBB (format de Color / rpi_ws281x)"""
+    fb = fb.astype(np.uint32)
+    return (fb[:, 0] << 16) | (fb[:, 1] << 8) | fb[:, 2]
+
+
+def _led_buffer_address(strip) -> Optional[int]:
+    """Adresse du tableau ws2811_led_t du ruban rpi_ws281x (None : pas d'accès direct, ex: mock)"""
+    if LED_MOCK:
+        return None
     try:
-        while not stop_event.is_set() and (iterations is None or step < iterations):
-            for i in range(length):
-                strip.setPixelColor(i, color)
-            strip.setBrightness(brightness)
-            strip.show()
-            # attend de façon interruptible
-            if stop_event.wait(delay):
-                break
-            step += 1
-    finally:
-        # si on a été arrêté et qu'on doit éteindre, ne rien faire (caller gère l'état)
-        pass
-def animation_all_white(strip, delay, iterations, stop_event):
-    white = Color(255, 255, 255)
-    _animation_all_color(strip, delay, iterations, stop_event, white)
-
-def animation_all_red(strip, delay, iterations, stop_event):
-    red = Color(255, 0, 0)
-    _animation_all_color(strip, delay, iterations, stop_event, red)
-
-# mapping name -> function
+        from rpi_ws281x import ws
+        address = int(ws.ws2811_channel_t_leds_get(strip._channel))
+    except Exception:
+        return None
+    return address or None
+
+
+def write_frame(strip, packed: np.ndarray):
+    """
+    Copier une frame entière dans le ruban (sans show()) : un memmove dans le tableau du pilote
+    rpi_ws281x, set_frame() du mock, ou setPixelColor() LED par LED en dernier recours.
+    """
+    count = min(len(packed), strip.numPixels())
+    packed = np.ascontiguousarray(packed[:count], dtype=np.uint32)
+    address = _led_buffer_address(strip)
+    if address is not None:
+        ctypes.memmove(address, packed.ctypes.data, packed.nbytes)
+    elif hasattr(strip, 'set_frame'):
+        strip.set_frame(packed)
+    else:
+        for i, value in enumerate(packed.tolist()):
+            strip.setPixelColor(i, value)
+
+
+def clear_strip(strip):
+    """Éteindre toutes les LEDs du ruban"""
+    write_frame(strip, np.zeros(strip.numPixels(), dtype=np.uint32))
+    strip.show()
+
+
+# === Rendu des animations dans le framebuffer ===
+# Chaque rendu écrit la frame n° step dans fb (N, 3) uint8, qui garde la frame précédente
+# (twinkle s'en sert pour le fondu) ; aucune boucle Python par LED.
+
+def _rgb(color: int) -> Tuple[int, int, int]:
+    return (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF
+
+
+PALETTE = np.array([_rgb(c) for c in colors], dtype=np.uint8)
+# Table de wheel() : couleur de l'arc-en-ciel pour chaque position 0-255
+WHEEL = np.array([_rgb(wheel(pos)) for pos in range(256)], dtype=np.uint8)
+
+
+@lru_cache(maxsize=8)
+def _indices(length: int) -> np.ndarray:
+    return np.arange(length)
+
+
+def render_color_wipe(fb: np.ndarray, step: int, rng: np.random.Generator):
+    """Color wipe : chaque LED prend la couleur suivante de la palette, décalée d'un cran par frame."""
+    fb[:] = PALETTE[(_indices(len(fb)) - step) % len(PALETTE)]
+
+
+def render_chase(fb: np.ndarray, step: int, rng: np.random.Generator):
+    """Chase : une LED sur trois allumée, le motif avance avec une couleur cyclique."""
+    offset = step % len(PALETTE)
+    idx = _indices(len(fb))
+    fb[:] = PALETTE[(idx + offset) % len(PALETTE)]
+    fb[idx % 3 != offset % 3] = 0
+
+
+def render_theater_chase(fb: np.ndarray, step: int, rng: np.random.Generator):
+    """Theater chase : groupe de LEDs allumé puis décalé (cinéma)."""
+    idx = _indices(len(fb))
+    fb[:] = PALETTE[(idx + step % 3) % len(PALETTE)]
+    fb[idx % 3 != 0] = 0
+
+
+def render_rainbow_cycle(fb: np.ndarray, step: int, rng: np.random.Generator):
+    """Rainbow cycle sur tout le ruban (table WHEEL)."""
+    length = len(fb)
+    fb[:] = WHEEL[((_indices(length) * 256 // length) + step) & 255]
+
+
+def render_scanner(fb: np.ndarray, step: int, rng: np.random.Generator):
+    """Scanner / Larson : une LED brillante va et vient (effet 'Cylon'), voisines à 40 %."""
+    length = len(fb)
+    span = max(length - 1, 1)
+    pos = step % (2 * span)
+    pos = pos if pos <= span else 2 * span - pos
+    color = PALETTE[ROUGE]
+    fb[:] = 0
+    fb[max(pos - 1, 0):pos + 2] = (color * 0.4).astype(np.uint8)
+    fb[min(pos, length - 1)] = color
+
+
+def render_pulse(fb: np.ndarray, step: int, rng: np.random.Generator):
+    """Pulse (respiration) : intensité de la palette entre 20 % et 100 %, un cycle toutes les 100 frames."""
+    factor = 0.2 + 0.8 * (0.5 * (1 + math.sin(2 * math.pi * (step % 100) / 100)))
+    fb[:] = (PALETTE[_indices(len(fb)) % len(PALETTE)] * factor).astype(np.uint8)
+
+
+def render_twinkle(fb: np.ndarray, step: int, rng: np.random.Generator):
+    """Twinkle : un tiers des LEDs prennent une couleur au hasard, puis fondu vers le noir."""
+    if step % 2 == 0:
+        length = len(fb)
+        fb[rng.integers(0, length, max(1, length // 3))] = PALETTE[rng.integers(0, len(PALETTE), max(1, length // 3))]
+    else:
+        np.subtract(fb, np.minimum(fb, 20), out=fb)
+
+
+def _render_all_color(color: int):
+    rgb = np.array(_rgb(color), dtype=np.uint8)
+
+    def render(fb: np.ndarray, step: int, rng: np.random.Generator):
+        fb[:] = rgb
+    return render
+
+
+# nom -> (rendu d'une frame, frames par itération) : iterations compte les itérations d'origine
+# (pulse : un cycle de 100 frames, twinkle : scintillement puis fondu)
 _ANIMATIONS = {
-    "color_wipe": animation_color_wipe,
-    "chase": animation_chase,
-    "theater_chase": animation_theater_chase,
-    "rainbow_cycle": animation_rainbow_cycle,
-    "scanner": animation_scanner,
-    "pulse": animation_pulse,
-    "twinkle": animation_twinkle,
-    "all_white": animation_all_white,  # ajouté : toutes les LEDs en blanc
-    "all_red": animation_all_red,  # ajouté : toutes les LEDs en rouge
+    "color_wipe": (render_color_wipe, 1),
+    "chase": (render_chase, 1),
+    "theater_chase": (render_theater_chase, 1),
+    "rainbow_cycle": (render_rainbow_cycle, 1),
+    "scanner": (render_scanner, 1),
+    "pulse": (render_pulse, 100),
+    "twinkle": (render_twinkle, 2),
+    "all_white": (_render_all_color(Color(255, 255, 255)), 1),  # ajouté : toutes les LEDs en blanc
+    "all_red": (_render_all_color(Color(255, 0, 0)), 1),  # ajouté : toutes les LEDs en rouge
 }
+
+
+# === Moteur : cadence fixe ===
+
+# Écarts à l'échéance gardés pour les percentiles de gigue
+_LATENESS_SAMPLES = 500
+
+
+class LedEngine:
+    """
+    Pousse les frames d'une animation au ruban à cadence fixe (une frame toutes les period secondes).
+
+    Les échéances sont absolues : le temps de rendu et d'écriture est déduit de l'attente, la cadence
+    ne dérive pas. Une frame en retard de plus d'une période (thread caméra occupé...) compte comme
+    échéance manquée : les frames dépassées sont sautées et l'animation garde sa vitesse au lieu de
+    rattraper en rafale. Une frame identique à la précédente n'est pas renvoyée (couleurs fixes).
+    """
+
+    def __init__(self, strip):
+        self.strip = strip
+        self.framebuffer = np.zeros((strip.numPixels(), 3), dtype=np.uint8)
+        self._last: Optional[np.ndarray] = None
+        self._rng = np.random.default_rng()
+        self._lock = threading.Lock()
+        self._lateness: "deque[float]" = deque(maxlen=_LATENESS_SAMPLES)
+        self.counters = {'frames': 0, 'shown': 0, 'unchanged': 0, 'missed': 0}
+        self._render_s = 0.0
+        self._write_s = 0.0
+        self.period: Optional[float] = None
+        self.animation: Optional[str] = None
+
+    def push(self):
+        """Envoyer le framebuffer au ruban (écriture en bloc puis show()) s'il a changé."""
+        packed = pack_frame(self.framebuffer)
+        if self._last is not None and np.array_equal(packed, self._last):
+            self.counters['unchanged'] += 1
+            return
+        write_frame(self.strip, packed)
+        self.strip.show()
+        self._last = packed
+        self.counters['shown'] += 1
+
+    def invalidate(self):
+        """La prochaine frame est renvoyée même identique (ruban modifié hors du moteur)."""
+        self._last = None
+
+    def play(self, name: str, period: float, frames: Optional[int], stop_event: threading.Event):
+        """Jouer l'animation name (frames frames au plus, None : jusqu'à stop_event) dans le thread appelant."""
+        render, _ = _ANIMATIONS[name]
+        period = max(0.001, float(period))
+        self.period, self.animation = period, name
+        step = 0
+        deadline = time.perf_counter()
+        while not stop_event.is_set() and (frames is None or step < frames):
+            started = time.perf_counter()
+            render(self.framebuffer, step, self._rng)
+            rendered = time.perf_counter()
+            self.push()
+            written = time.perf_counter()
+            with self._lock:
+                self.counters['frames'] += 1
+                self._render_s += rendered - started
+                self._write_s += written - rendered
+                self._lateness.append(max(started - deadline, 0.0))
+            deadline += period
+            step += 1
+            late = time.perf_counter() - deadline
+            if late > 0:
+                # Échéance(s) dépassée(s) : frames sautées, l'animation reste à l'heure
+                skipped = int(late // period) + 1
+                with self._lock:
+                    self.counters['missed'] += skipped
+                deadline += skipped * period
+                step += skipped
+            if stop_event.wait(max(deadline - time.perf_counter(), 0.0)):
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            frames = self.counters['frames']
+            lateness = sorted(self._lateness)
+            stats = dict(self.counters, leds=len(self.framebuffer), animation=self.animation,
+                         fps=round(1 / self.period, 1) if self.period else None,
+                         render_us=round(self._render_s / frames * 1e6, 1) if frames else None,
+                         write_us=round(self._write_s / frames * 1e6, 1) if frames else None)
+        if lateness:
+            stats['lateness_ms'] = {'p50': round(lateness[len(lateness) // 2] * 1000, 2),
+                                    'p99': round(lateness[min(len(lateness) - 1, int(len(lateness) * 0.99))] * 1000, 2),
+                                    'max': round(lateness[-1] * 1000, 2)}
+        return stats
+
+
+_engine: Optional[LedEngine] = None
+_engine_lock = threading.Lock()
+
+
+def _get_engine(strip) -> LedEngine:
+    """Moteur du ruban (recréé si le ruban change, ex: après release_strip())"""
+    global _engine
+    with _engine_lock:
+        if _engine is None or _engine.strip is not strip:
+            _engine = LedEngine(strip)
+        return _engine
+
+
+def led_engine_stats() -> Optional[dict]:
+    """Frames envoyées, échéances manquées, temps de rendu et gigue du moteur LED (None avant la 1re animation)"""
+    with _engine_lock:
+        engine = _engine
+    return engine.stats() if engine is not None else None
+
+
 # Mode controller (indépendant du LEDAnimator précédent)
 _led_mode_thread = None
 _led_mode_stop = None
 
 def start_led_animation_mode(name: str = "color_wipe", delay: float = 0.5, brightness:int = 255 , iterations: int | None = None, use_strip: PixelStrip | None = None):
-    """Start a named animation in background (interruptible)."""
+    """Start a named animation in background (interruptible). delay : durée d'une frame (cadence fixe)."""
     global _led_mode_thread, _led_mode_stop
     stop_led_animation_mode()
-    func = _ANIMATIONS.get(name)
-    if func is None:
+    animation = _ANIMATIONS.get(name)
+    if animation is None:
         raise ValueError(f"Animation inconnue: {name}")
     strip, created = _ensure_strip(use_strip)
     strip.setBrightness(brightness)
+    engine = _get_engine(strip)
+    engine.invalidate()
+    frames = None if iterations is None else iterations * animation[1]
     _led_mode_stop = threading.Event()
+    stop_event = _led_mode_stop
 
     def _runner():
         try:
-            func(strip, delay, iterations, _led_mode_stop)
+            engine.play(name, delay, frames, stop_event)
         finally:
             if created:
-                for i in range(strip.numPixels()):
-                    strip.setPixelColor(i, Color(0,0,0))
                 try:
-                    strip.show()
+                    clear_strip(strip)
                 except Exception:
                     pass
+                engine.invalidate()
 
-    _led_mode_thread = threading.Thread(target=_runner, daemon=True)
+    _led_mode_thread = threading.Thread(target=_runner, name='led-animation', daemon=True)
     _led_mode_thread.start()
 
 def start_led_multiple_animation_mode(
@@ -396,7 +483,7 @@ def start_led_multiple_animation_mode(
     - switch_pause : pause entre deux animations
     - use_strip : PixelStrip optionnel à réutiliser
     """
-    global _led_mode_thread, _led_mode_stop, _led_multi_stop
+    global _led_mode_thread, _led_mode_stop
 
     stop_led_animation_mode()
 
@@ -430,43 +517,41 @@ def start_led_multiple_animation_mode(
             raise ValueError(f"Animation inconnue: {item['name']}")
 
     strip, created = _ensure_strip(use_strip)
+    engine = _get_engine(strip)
+    engine.invalidate()
     _led_mode_stop = threading.Event()
+    stop_event = _led_mode_stop
 
     def _runner():
         try:
-            while not _led_mode_stop.is_set():
+            while not stop_event.is_set():
                 for item in normalized:
-                    if _led_mode_stop.is_set():
+                    if stop_event.is_set():
                         break
-                    func = _ANIMATIONS.get(item['name'])
-                    if func is None:
-                        continue
                     delay = max(0.001, float(item.get('delay', per_frame_delay)))
                     duration = item.get('duration', default_mode_duration)
                     brightness = int(item.get('brightness', 255))
                     strip.setBrightness(brightness)
-                    if duration is None:
-                        iterations = None
-                    else:
-                        iterations = int(max(1, duration / delay))
+                    engine.invalidate()  # luminosité changée : la frame suivante est renvoyée
+                    # durée -> nombre de frames à cadence fixe
+                    frames = None if duration is None else int(max(1, duration / delay))
                     try:
-                        func(strip, delay, iterations, _led_mode_stop)
-                    except Exception:
-                        pass
-                    if _led_mode_stop.is_set():
+                        engine.play(item['name'], delay, frames, stop_event)
+                    except Exception as e:
+                        logger.info(f"[LED] Erreur animation {item['name']}: {e}")
+                    if stop_event.is_set():
                         break
-                    if _led_mode_stop.wait(switch_pause):
+                    if stop_event.wait(switch_pause):
                         break
         finally:
             if created:
                 try:
-                    for i in range(strip.numPixels()):
-                        strip.setPixelColor(i, Color(0, 0, 0))
-                    strip.show()
+                    clear_strip(strip)
                 except Exception:
                     pass
+                engine.invalidate()
 
-    _led_mode_thread = threading.Thread(target=_runner, daemon=True)
+    _led_mode_thread = threading.Thread(target=_runner, name='led-animation', daemon=True)
     _led_mode_thread.start()
 
     return True
@@ -490,9 +575,11 @@ def stop_led_animation_mode(wait: bool = True):
 '''
 Courte explication — ce que fait le paramètre delay
 
-C'est le temps d'attente entre deux "frames" / étapes de l'animation, exprimé en secondes (float).
-Concrètement, chaque boucle d'animation appelle stop_event.wait(delay) — donc delay contrôle la cadence et rend l'arrêt interruptible.
-Pour les fonctions qui convertissent une durée en nombre d'itérations (iterations = duration / delay), delay fixe la granularité temporelle : plus petit → plus d'itérations pour une même durée.
+C'est la durée d'une "frame" / étape de l'animation, exprimée en secondes (float).
+Concrètement, LedEngine envoie une frame toutes les delay secondes à échéance fixe : le temps de rendu et d'écriture est
+déduit de l'attente (stop_event.wait jusqu'à l'échéance suivante, donc l'arrêt reste interruptible). Une frame en retard
+de plus d'un delay est sautée et comptée comme échéance manquée (led_engine_stats()).
+Pour start_led_multiple_animation_mode, la durée d'une animation devient un nombre de frames (duration / delay).
 Conséquences pratiques
 
 Petite valeur (ex. 0.01–0.05) → animation fluide/rapide, plus de charge CPU / update LED.
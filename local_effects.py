@@ -0,0 +1,221 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Style calculé sur place plutôt que par l'IA : prompt « local:<filtre> » (ex: « Croquis | local:sketch »)
+LOCAL_PREFIX = 'local:'
+
+# Grand côté de l'image traitée (720p) ; la photo est décodée directement réduite quand c'est possible
+LOCAL_MAX_SIDE = 1280
+LOCAL_QUALITY = 90
+
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                  (2, cv2.IMREAD_REDUCED_COLOR_2))
+# Couleurs (BGR) du duotone : ombres, hautes lumières
+_DUOTONE = ((92, 26, 38), (130, 220, 255))
+# Taille d'une cellule de la trame BD (px)
+_HALFTONE_CELL = 8
+# Niveaux par canal des aplats (cartoon, halftone)
+_QUANT_STEP = 40
+
+
+def local_filter_name(prompt: Optional[str]) -> Optional[str]:
+    """Nom du filtre local d'un style (« local:sketch » -> « sketch »), None pour un prompt IA"""
+    if prompt and prompt.strip().lower().startswith(LOCAL_PREFIX):
+        return prompt.strip()[len(LOCAL_PREFIX):].strip().lower()
+    return None
+
+
+def load_photo(path: str, max_side: int = LOCAL_MAX_SIDE) -> np.ndarray:
+    """
+    Photo BGR dont le grand côté vaut au plus max_side.
+    Un JPEG 12 Mpx est décodé à 1/2, 1/4 ou 1/8 par libjpeg (sans passer par la pleine taille).
+    """
+    with Image.open(path) as probe:
+        long_side = max(probe.size)
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced in _REDUCED_FLAGS:
+        if long_side // factor >= max_side:
+            flag = reduced
+            break
+    img = cv2.imread(path, flag)
+    if img is None:
+        raise ValueError(f"Photo illisible: {os.path.basename(path)}")
+    height, width = img.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        img = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _quantize_lut() -> np.ndarray:
+    levels = np.arange(256)
+    return np.clip(levels // _QUANT_STEP * _QUANT_STEP + _QUANT_STEP // 2, 0, 255).astype(np.uint8)
+
+
+_QUANT_LUT = _quantize_lut()
+
+
+def _flat_colors(img: np.ndarray) -> np.ndarray:
+    """Aplats : lissage bilatéral à mi-résolution (4x moins de pixels) puis niveaux réduits"""
+    small = cv2.pyrDown(img)
+    for _ in range(2):
+        small = cv2.bilateralFilter(small, 7, 50, 7)
+    return cv2.LUT(cv2.resize(small, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_LINEAR), _QUANT_LUT)
+
+
+def cartoon(img: np.ndarray) -> np.ndarray:
+    gray = cv2.medianBlur(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), 5)
+    edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 5)
+    color = _flat_colors(img)
+    return cv2.bitwise_and(color, color, mask=edges)
+
+
+def sketch(img: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(255 - gray, (0, 0), 8)
+    drawing = cv2.divide(gray, 255 - blurred, scale=256)
+    return cv2.cvtColor(drawing, cv2.COLOR_GRAY2BGR)
+
+
+def _duotone_lut() -> np.ndarray:
+    t = np.linspace(0.0, 1.0, 256)[:, None]
+    shadow, highlight = (np.array(color, dtype=np.float64) for color in _DUOTONE)
+    return np.round(shadow + (highlight - shadow) * t).astype(np.uint8).reshape(1, 256, 3)
+
+
+_DUOTONE_LUT = _duotone_lut()
+
+
+def duotone(img: np.ndarray) -> np.ndarray:
+    gray = cv2.equalizeHist(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+    return cv2.LUT(cv2.merge((gray, gray, gray)), _DUOTONE_LUT)
+
+
+def _vintage_lut() -> np.ndarray:
+    """Courbes par canal : noirs relevés (délavé), bleus atténués, rouges réchauffés"""
+    x = np.arange(256)
+    curves = (np.interp(x, (0, 128, 255), (40, 118, 215)),  # B
+              np.interp(x, (0, 128, 255), (25, 135, 235)),  # G
+              np.interp(x, (0, 128, 255), (35, 150, 250)))  # R
+    return np.stack(curves, axis=-1).round().astype(np.uint8).reshape(1, 256, 3)
+
+
+_VINTAGE_LUT = _vintage_lut()
+
+
+@lru_cache(maxsize=4)
+def _vignette(height: int, width: int) -> np.ndarray:
+    """Masque de vignettage (0.35 dans les coins -> 1 au centre), calculé une fois par taille"""
+    mask = cv2.getGaussianKernel(height, height * 0.6) @ cv2.getGaussianKernel(width, width * 0.6).T
+    mask = 0.35 + 0.65 * mask / mask.max()
+    return cv2.merge((mask, mask, mask)).astype(np.float32)
+
+
+def vintage(img: np.ndarray) -> np.ndarray:
+    toned = cv2.LUT(img, _VINTAGE_LUT)
+    return cv2.multiply(toned, _vignette(*img.shape[:2]), dtype=cv2.CV_8U)
+
+
+@lru_cache(maxsize=4)
+def _dot_distance(height: int, width: int, cell: int) -> np.ndarray:
+    """Distance de chaque pixel au centre de sa cellule de trame"""
+    y, x = np.indices((cell, cell), dtype=np.float32) - (cell - 1) / 2
+    tile = np.sqrt(x * x + y * y)
+    return np.tile(tile, (height // cell, width // cell))
+
+
+def halftone(img: np.ndarray) -> np.ndarray:
+    height, width = img.shape[:2]
+    cell = _HALFTONE_CELL
+    rows, cols = -(-height // cell), -(-width // cell)
+    # Un rayon de point par cellule, proportionnel à l'obscurité moyenne de la cellule
+    gray = cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (cols, rows), interpolation=cv2.INTER_AREA)
+    radius = (1.0 - gray.astype(np.float32) / 255.0) * (cell * 0.62)
+    radius = cv2.resize(radius, (cols * cell, rows * cell), interpolation=cv2.INTER_NEAREST)
+    dots = (_dot_distance(rows * cell, cols * cell, cell) < radius)[:height, :width]
+    color = cv2.LUT(cv2.convertScaleAbs(img, alpha=1.15, beta=30), _QUANT_LUT)
+    color[dots] = (color[dots] >> 2)
+    return color
+
+
+# Effets calculés sur place, sans API ni Internet (style local ou secours quand Runware échoue)
+#   cartoon  : aplats lissés (bilatéral) et contours encrés
+#   sketch   : dessin au crayon (densité divisée par le flou du négatif)
+#   duotone  : deux couleurs, des ombres aux hautes lumières
+#   vintage  : courbes par canal (tons chauds délavés) et vignettage
+#   halftone : trame de points BD sur couleurs postérisées
+LOCAL_FILTERS = {'cartoon': cartoon, 'sketch': sketch, 'duotone': duotone, 'vintage': vintage, 'halftone': halftone}
+
+
+def apply_local_filter(img: np.ndarray, name: str) -> np.ndarray:
+    local_filter = LOCAL_FILTERS.get(name)
+    if local_filter is None:
+        raise ValueError(f"Filtre local inconnu: {name}")
+    return local_filter(img)
+
+
+class LocalEffectEngine:
+    """
+    Filtres locaux dans un pool de threads (OpenCV et NumPy libèrent le GIL) : au plus workers
+    photos traitées à la fois, pour garder du CPU à l'aperçu caméra.
+    """
+
+    def __init__(self, workers: int = 2, max_side: int = LOCAL_MAX_SIDE, quality: int = LOCAL_QUALITY):
+        self.max_side = max_side
+        self.quality = quality
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='local-effect')
+        self._lock = threading.Lock()
+        self._stats = {name: {'count': 0, 'total_ms': 0.0} for name in LOCAL_FILTERS}
+
+    def render(self, photo_path: str, name: str, folder: str) -> Tuple[str, dict]:
+        """
+        Appliquer le filtre name à la photo, dans un fichier temporaire de folder (à renommer par l'appelant).
+        Retourne (chemin temporaire, {'decode_ms', 'filter_ms', 'encode_ms', 'local_ms'}).
+        """
+        if name not in LOCAL_FILTERS:
+            raise ValueError(f"Filtre local inconnu: {name}")
+        return self._pool.submit(self._render, photo_path, name, folder).result()
+
+    def _render(self, photo_path: str, name: str, folder: str) -> Tuple[str, dict]:
+        started = time.perf_counter()
+        img = load_photo(photo_path, self.max_side)
+        decoded = time.perf_counter()
+        result = apply_local_filter(img, name)
+        filtered = time.perf_counter()
+        ok, encoded = cv2.imencode('.jpg', result, (cv2.IMWRITE_JPEG_QUALITY, self.quality))
+        if not ok:
+            raise ValueError('Encodage JPEG impossible')
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.effect_', suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encoded.tobytes())
+        finished = time.perf_counter()
+        timings = {'decode_ms': round((decoded - started) * 1000, 1),
+                   'filter_ms': round((filtered - decoded) * 1000, 1),
+                   'encode_ms': round((finished - filtered) * 1000, 1),
+                   'local_ms': round((finished - started) * 1000, 1)}
+        with self._lock:
+            self._stats[name]['count'] += 1
+            self._stats[name]['total_ms'] += timings['local_ms']
+        logger.info(f"[LOCAL-EFFECT] {name} sur {os.path.basename(photo_path)} ({img.shape[1]}x{img.shape[0]}): "
+                    f"{timings}")
+        return tmp_path, timings
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: {'count': s['count'], 'avg_ms': round(s['total_ms'] / s['count'], 1) if s['count'] else None}
+                    for name, s in self._stats.items()}
+
+    def close(self):
+        self._pool.shutdown(wait=False)
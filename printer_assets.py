@@ -0,0 +1,102 @@
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from dither_utils import dither_array
+from printer_service import print_width
+from raster_utils import define_graphic, print_graphic, to_bitmap
+
+logger = logging.getLogger(__name__)
+
+# Logo d'événement : une seule image, imprimée en tête ou en pied de chaque photo
+PRINT_LOGO_FILE = 'print_logo.png'
+LOGO_KEY = b'LG'
+LOGO_POSITIONS = ('header', 'footer')
+# Hauteur maximale imprimée (points à 8 points/mm) : limite aussi la RAM occupée dans l'imprimante
+MAX_LOGO_DOTS = 160
+
+
+class PrintAsset:
+    """
+    Graphique prêt pour l'imprimante : bitmap à la largeur d'impression et empreinte du contenu.
+    resident=True : chargé une fois dans l'imprimante puis imprimé par sa clé (GS ( L) ;
+    sinon envoyé en raster avec chaque photo.
+    """
+
+    def __init__(self, key: bytes, bitmap: np.ndarray, high_density: bool, position: str = 'header',
+                 resident: bool = True):
+        self.key = key
+        self.bitmap = bitmap
+        self.high_density = high_density
+        self.position = position if position in LOGO_POSITIONS else 'header'
+        self.resident = resident
+        self.digest = hashlib.sha1(np.packbits(bitmap, axis=1).tobytes() +
+                                   repr(bitmap.shape).encode()).hexdigest()[:12]
+
+    @property
+    def cache_token(self) -> tuple:
+        """Ce qui change les octets d'une impression (clé du cache raster)"""
+        return self.key, self.digest, self.position, self.resident
+
+    def define_command(self) -> bytes:
+        return define_graphic(self.key, self.bitmap)
+
+    def print_command(self) -> bytes:
+        # Même taille imprimée que la photo : double en basse densité
+        return print_graphic(self.key, 1 if self.high_density else 2)
+
+    def to_dict(self) -> dict:
+        height, width = self.bitmap.shape
+        return {'key': self.key.decode('ascii'), 'digest': self.digest, 'width': width, 'height': height,
+                'position': self.position, 'resident': self.resident,
+                'upload_bytes': len(self.define_command()), 'print_bytes': len(self.print_command())}
+
+
+def prepare_logo_bitmap(path: str, width: int, max_rows: int, dither: str = 'escpos') -> np.ndarray:
+    """Logo réduit dans (width, max_rows), centré sur fond blanc et tramé. True = point noir."""
+    with Image.open(path) as img:
+        img.load()
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # Transparence : fond blanc (le papier)
+            img = img.convert('RGBA')
+            background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img)
+        img = img.convert('L')
+        img.thumbnail((width, max_rows), Image.Resampling.LANCZOS)
+    canvas = Image.new('L', (width, img.height), 255)
+    canvas.paste(img, ((width - img.width) // 2, 0))
+    if dither == 'escpos':
+        return to_bitmap(canvas)
+    return dither_array(np.asarray(canvas), dither)
+
+
+_assets: Dict[tuple, PrintAsset] = {}
+_assets_lock = threading.Lock()
+
+
+def load_print_asset(path: str, high_density: bool = False, dither: str = 'escpos', position: str = 'header',
+                     resident: bool = True) -> Optional[PrintAsset]:
+    """Logo préparé pour ces réglages (gardé en mémoire tant que le fichier ne change pas)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, bool(high_density), dither, position, resident)
+    with _assets_lock:
+        asset = _assets.get(key)
+    if asset is not None:
+        return asset
+    # Largeur de la photo imprimée (doublée à l'impression en basse densité)
+    width = print_width(high_density)
+    max_rows = MAX_LOGO_DOTS if high_density else MAX_LOGO_DOTS // 2
+    asset = PrintAsset(LOGO_KEY, prepare_logo_bitmap(path, width, max_rows, dither), high_density, position, resident)
+    with _assets_lock:
+        _assets.clear()  # un seul logo utile à la fois
+        _assets[key] = asset
+    logger.info(f"[PRINTER] Logo préparé: {asset.to_dict()}")
+    return asset
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Imprimante thermique ESC/POS virtuelle sur pseudo-terminal.
+
+Permet de tester et chronométrer toute la chaîne d'impression (file, raster,
+tramage, statut) sans l'imprimante 57 mm :
+- expose un pty (option --link pour un chemin stable, ex: /tmp/ttyPRINTER)
+- simule le débit série (baudrate) et la vitesse de la tête (mm/s) :
+  l'émulateur arrête de lire quand sa mémoire tampon est pleine, comme la vraie
+- comprend le raster GS v 0, le texte, les avances papier, la coupe et les
+  requêtes de statut DLE EOT 1/2/4 (papier presque fini / épuisé simulé)
+- garde les graphiques GS ( L (RAM, perdue à l'extinction simulée ; NV, conservée)
+- rend chaque impression reçue en PNG
+
+Usage:
+  python3 printer_emulator.py --link /tmp/ttyPRINTER --out /tmp/impressions
+  python3 printer_emulator.py --baudrate 9600 --speed 50 --paper-mm 2000
+  (puis printer_port = /tmp/ttyPRINTER dans l'administration)
+
+Signaux : SIGUSR1 bascule papier épuisé / papier présent,
+          SIGUSR2 simule un redémarrage (RAM des graphiques vidée).
+"""
+
+import os
+import time
+import tty
+import select
+import signal
+import logging
+import argparse
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+DOTS_PER_MM = 8  # 203 dpi
+PAPER_WIDTH_DOTS = 384  # 48 mm imprimables sur papier 57 mm
+LINE_HEIGHT_DOTS = 30  # interligne par défaut (ESC 2)
+# Au-delà de ce retard de la tête sur la réception, l'imprimante cesse de lire (tampon plein)
+_MAX_BACKLOG_S = 0.5
+# Sans données pendant ce délai, le travail en cours est considéré terminé
+_JOB_IDLE_S = 1.5
+
+FONT_SIZE = 20  # police A : 12x24 points
+ESC, GS, DLE = 0x1B, 0x1D, 0x10
+
+
+def _font(size: int):
+    """Police à chasse fixe proche de la police A (DejaVu, présente sur Raspberry Pi OS), sinon celle de Pillow"""
+    try:
+        return ImageFont.truetype('DejaVuSansMono.ttf', size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            return ImageFont.load_default()
+
+
+class EmulatedJob:
+    """Une impression reçue : lignes de points, statistiques et rendu"""
+
+    def __init__(self, number: int):
+        self.number = number
+        self.rows: List[np.ndarray] = []  # lignes de PAPER_WIDTH_DOTS booléens (True = noir)
+        self.bytes_received = 0
+        self.started_at = time.perf_counter()
+        self.first_motion_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cut = False
+        self.paper_out = False
+        self.png_path: Optional[str] = None
+
+    @property
+    def height_dots(self) -> int:
+        return len(self.rows)
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.perf_counter()
+        return {
+            'number': self.number,
+            'bytes_received': self.bytes_received,
+            'height_mm': round(self.height_dots / DOTS_PER_MM, 1),
+            'duration_ms': round((end - self.started_at) * 1000, 1),
+            'first_motion_ms': round((self.first_motion_at - self.started_at) * 1000, 1) if self.first_motion_at else None,
+            'cut': self.cut,
+            'paper_out': self.paper_out,
+            'png': self.png_path,
+        }
+
+
+class PrinterEmulator:
+    """Imprimante ESC/POS virtuelle : un thread lit le pty, interprète et rend les impressions"""
+
+    def __init__(self, baudrate: int = 9600, speed_mm_s: float = 50.0, output_dir: Optional[str] = None,
+                 link: Optional[str] = None, paper_mm: Optional[float] = None):
+        self.baudrate = int(baudrate)
+        self.speed_mm_s = float(speed_mm_s)
+        self.output_dir = output_dir
+        self.link = link
+        self.paper_mm = paper_mm  # longueur du rouleau (None = infinie)
+        self.paper_used_mm = 0.0
+        self.paper_forced_out = False
+        self.cover_open = False
+        self.offline = False
+        # Graphiques résidents (GS ( L) : clé -> bitmap booléen
+        self.ram_graphics: Dict[bytes, np.ndarray] = {}
+        self.nv_graphics: Dict[bytes, np.ndarray] = {}
+
+        self.jobs: List[EmulatedJob] = []
+        self._job: Optional[EmulatedJob] = None
+        self._buffer = bytearray()
+        self._align = 0
+        self._bold = False
+        self._double = (False, False)  # (largeur, hauteur)
+        self._line_height = LINE_HEIGHT_DOTS
+        self._text = bytearray()
+        self._line_align = 0  # alignement pris en compte en début de ligne (comme ESC a)
+        self._line_bold = False
+        self._head_busy_until = 0.0
+        self._last_data_at = 0.0
+        self._idle_bytes = 0  # octets reçus hors travail (requêtes, chargement de graphiques)
+        self._idle_since = 0.0
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._job_done = threading.Condition(self._lock)
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.device = os.ttyname(self.slave_fd)
+        if link:
+            if os.path.islink(link):
+                os.remove(link)
+            os.symlink(self.device, link)
+        self._thread = threading.Thread(target=self._run, name='printer-emulator', daemon=True)
+
+    # --- Cycle de vie ---
+
+    def start(self) -> 'PrinterEmulator':
+        self._thread.start()
+        logger.info(f"[EMULATOR] Imprimante virtuelle sur {self.link or self.device} "
+                    f"({self.baudrate} bps, {self.speed_mm_s:.0f} mm/s)")
+        return self
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2.0)
+        self._finish_job()
+        for fd in (self.master_fd, self.slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- État papier ---
+
+    @property
+    def paper_state(self) -> str:
+        if self.paper_forced_out:
+            return 'out'
+        if self.paper_mm is None:
+            return 'ok'
+        remaining = self.paper_mm - self.paper_used_mm
+        if remaining <= 0:
+            return 'out'
+        return 'low' if remaining < self.paper_mm * 0.1 else 'ok'
+
+    def set_paper_out(self, out: bool = True):
+        self.paper_forced_out = out
+        if not out and self.paper_mm is not None and self.paper_used_mm >= self.paper_mm:
+            self.paper_used_mm = 0.0  # nouveau rouleau
+
+    def power_cycle(self):
+        """Extinction/rallumage : RAM (graphiques téléchargés) et réglages perdus."""
+        self.ram_graphics.clear()
+        self._align, self._bold, self._double = 0, False, (False, False)
+        self._line_height = LINE_HEIGHT_DOTS
+        logger.info("[EMULATOR] Redémarrage simulé : graphiques en RAM effacés")
+
+    def status_byte(self, n: int) -> int:
+        """Réponse à DLE EOT n (bits 1 et 4 toujours à 1)"""
+        value = 0x12
+        paper = self.paper_state
+        if n == 1 and (self.offline or self.cover_open or paper == 'out'):
+            value |= 0x08
+        elif n == 2:
+            if self.cover_open:
+                value |= 0x04
+            if paper == 'out':
+                value |= 0x20
+        elif n == 4:
+            if paper == 'out':
+                value |= 0x60
+            elif paper == 'low':
+                value |= 0x0C
+        return value
+
+    def wait_for_jobs(self, count: int, timeout: float = 60.0) -> bool:
+        """Attendre que `count` impressions soient terminées (coupe ou inactivité)."""
+        deadline = time.monotonic() + timeout
+        with self._job_done:
+            while sum(1 for job in self.jobs if job.finished_at) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._job_done.wait(remaining)
+        return True
+
+    # --- Réception (débit série simulé) ---
+
+    def _run(self):
+        bytes_per_s = self.baudrate / 10.0  # 8N1 : 10 bits par octet
+        next_read = time.perf_counter()
+        last_data = time.perf_counter()
+        while not self._stop.is_set():
+            # Tête en retard : le tampon est plein, on ne lit plus (l'hôte est bloqué)
+            backlog = self._head_busy_until - time.perf_counter()
+            if backlog > _MAX_BACKLOG_S:
+                time.sleep(min(backlog - _MAX_BACKLOG_S, 0.05))
+                continue
+            ready, _, _ = select.select([self.master_fd], [], [], 0.05)
+            now = time.perf_counter()
+            if not ready:
+                if now - last_data > _JOB_IDLE_S and now >= self._head_busy_until:
+                    if self._job:
+                        self._finish_job()
+                    self._idle_bytes = 0  # requêtes isolées (surveillance) : pas un travail
+                continue
+            try:
+                # Petits blocs pour lisser le débit simulé
+                data = os.read(self.master_fd, max(1, int(bytes_per_s / 100)))
+            except OSError:
+                break
+            if not data:
+                continue
+            next_read = max(next_read, now) + len(data) / bytes_per_s
+            last_data = self._last_data_at = now
+            self._receive(data)
+            delay = next_read - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _receive(self, data: bytes):
+        # Le travail ne commence qu'à la première ligne imprimée : les requêtes (statut,
+        # graphiques) et chargements qui la précèdent lui sont rattachés à ce moment-là
+        if self._job is not None:
+            self._job.bytes_received += len(data)
+        else:
+            if not self._idle_bytes:
+                self._idle_since = time.perf_counter()
+            self._idle_bytes += len(data)
+        self._buffer += data
+        while self._buffer:
+            consumed = self._parse(self._buffer)
+            if consumed == 0:
+                break  # commande incomplète : attendre la suite
+            del self._buffer[:consumed]
+
+    # --- Interprétation ESC/POS ---
+
+    def _parse(self, buf: bytearray) -> int:
+        """Interpréter une commande en tête de tampon. Retourne les octets consommés (0 = incomplet)."""
+        b = buf[0]
+        if b == DLE:
+            if len(buf) < 3:
+                return 0
+            if buf[1] == 0x04:
+                os.write(self.master_fd, bytes((self.status_byte(buf[2]),)))
+            return 3
+        if b == ESC:
+            return self._parse_esc(buf)
+        if b == GS:
+            return self._parse_gs(buf)
+        if b == 0x0A:  # LF : imprimer la ligne de texte
+            self._print_text_line()
+            return 1
+        if b in (0x0D, 0x00):
+            return 1
+        self._ensure_job()
+        if not self._text:
+            self._line_align = self._align
+        self._line_bold = self._line_bold or self._bold
+        self._text.append(b)
+        return 1
+
+    def _parse_esc(self, buf: bytearray) -> int:
+        if len(buf) < 2:
+            return 0
+        cmd = buf[1]
+        if cmd == ord('@'):  # initialisation
+            self._align, self._bold, self._double = 0, False, (False, False)
+            self._line_height = LINE_HEIGHT_DOTS
+            return 2
+        if cmd == ord('2'):
+            self._line_height = LINE_HEIGHT_DOTS
+            return 2
+        if len(buf) < 3:
+            return 0
+        arg = buf[2]
+        if cmd == ord('a'):
+            self._align = arg % 48 if arg >= 48 else arg
+        elif cmd == ord('E'):
+            self._bold = bool(arg & 1)
+        elif cmd == ord('!'):
+            self._bold = bool(arg & 0x08)
+            self._double = (bool(arg & 0x20), bool(arg & 0x10))
+        elif cmd == ord('3'):
+            self._line_height = arg
+        elif cmd == ord('J'):  # avance de n points
+            self._feed(arg)
+        elif cmd == ord('d'):  # avance de n lignes
+            self._print_text_line()
+            self._feed(arg * self._line_height)
+        # ESC t, ESC -, ESC M, ESC G... : sans effet sur le rendu
+        return 3
+
+    def _parse_gs(self, buf: bytearray) -> int:
+        if len(buf) < 2:
+            return 0
+        cmd = buf[1]
+        if cmd == ord('v'):  # GS v 0 m xL xH yL yH d1...dk
+            if len(buf) < 8:
+                return 0
+            mode = buf[3]
+            width_bytes = buf[4] | (buf[5] << 8)
+            height = buf[6] | (buf[7] << 8)
+            size = 8 + width_bytes * height
+            if len(buf) < size:
+                return 0
+            band = np.frombuffer(bytes(buf[8:size]), dtype=np.uint8).reshape(height, width_bytes)
+            self._print_raster(np.unpackbits(band, axis=1).astype(bool), mode)
+            return size
+        if cmd == ord('V'):  # coupe
+            if len(buf) < 3:
+                return 0
+            consumed = 4 if buf[2] in (65, 66, 97, 98) else 3
+            if len(buf) < consumed:
+                return 0
+            self._print_text_line()
+            if self._job:
+                self._job.cut = True
+            self._finish_job()
+            return consumed
+        if cmd in (ord('('), ord('8')):  # fonctions étendues : GS ( x pL pH ... / GS 8 L p1..p4 ...
+            length_bytes = 2 if cmd == ord('(') else 4
+            if len(buf) < 3 + length_bytes:
+                return 0
+            size = 3 + length_bytes + int.from_bytes(buf[3:3 + length_bytes], 'little')
+            if len(buf) < size:
+                return 0
+            if buf[2] == ord('L'):
+                self._graphics_function(bytes(buf[3 + length_bytes:size]))
+            return size
+        if len(buf) < 3:
+            return 0
+        if cmd == ord('!'):
+            self._double = (bool(buf[2] & 0xF0), bool(buf[2] & 0x0F))
+        return 3
+
+    def _graphics_function(self, body: bytes):
+        """GS ( L : m fn paramètres (m = 48)"""
+        if len(body) < 2:
+            return
+        fn, params = body[1], body[2:]
+        if fn in (67, 83) and len(params) >= 9:  # définir (NV / RAM), format raster
+            key = params[1:3]
+            width = params[4] | (params[5] << 8)
+            height = params[6] | (params[7] << 8)
+            data = np.frombuffer(params[9:9 + height * ((width + 7) // 8)], dtype=np.uint8)
+            bits = np.unpackbits(data.reshape(height, -1), axis=1)[:, :width].astype(bool)
+            (self.nv_graphics if fn == 67 else self.ram_graphics)[key] = bits
+            logger.info(f"[EMULATOR] Graphique {key!r} défini ({width}x{height}, {'NV' if fn == 67 else 'RAM'})")
+        elif fn in (69, 85) and len(params) >= 4:  # imprimer (NV / RAM)
+            bits = (self.nv_graphics if fn == 69 else self.ram_graphics).get(params[0:2])
+            if bits is None:
+                logger.info(f"[EMULATOR] Graphique {params[0:2]!r} inconnu : rien n'est imprimé")
+                return
+            self._print_raster(bits, (1 if params[2] == 2 else 0) | (2 if params[3] == 2 else 0))
+        elif fn in (66, 82) and len(params) >= 2:  # effacer une clé
+            (self.nv_graphics if fn == 66 else self.ram_graphics).pop(params[0:2], None)
+        elif fn in (64, 80):  # liste des clés : 37h, identifiant, statut (40h = fin), clés, NUL
+            graphics = self.nv_graphics if fn == 64 else self.ram_graphics
+            os.write(self.master_fd, b'\x37' + (b'\x72' if fn == 64 else b'\x73') + b'\x40' +
+                     b''.join(sorted(graphics)) + b'\x00')
+
+    # --- Rendu ---
+
+    def _start_job(self):
+        with self._lock:
+            self._job = EmulatedJob(len(self.jobs) + 1)
+            if self._idle_bytes:
+                self._job.started_at = self._idle_since
+                self._job.bytes_received = self._idle_bytes
+                self._idle_bytes = 0
+            self.jobs.append(self._job)
+
+    def _ensure_job(self):
+        if self._job is None:
+            self._start_job()
+
+    def _advance_head(self, dots: int):
+        """La tête met dots / (vitesse) secondes à imprimer/avancer ces lignes"""
+        now = time.perf_counter()
+        job = self._job
+        if job is not None and job.first_motion_at is None:
+            job.first_motion_at = now
+        start = max(now, self._head_busy_until)
+        self._head_busy_until = start + dots / (self.speed_mm_s * DOTS_PER_MM)
+        if self.paper_state == 'out':
+            if job is not None:
+                job.paper_out = True
+            return False
+        self.paper_used_mm += dots / DOTS_PER_MM
+        return True
+
+    def _feed(self, dots: int):
+        self._ensure_job()
+        if self._advance_head(dots):
+            self._job.rows.extend(np.zeros(PAPER_WIDTH_DOTS, dtype=bool) for _ in range(dots))
+
+    def _print_raster(self, bits: np.ndarray, mode: int):
+        self._ensure_job()
+        if mode & 1:  # double largeur
+            bits = np.repeat(bits, 2, axis=1)
+        if mode & 2:  # double hauteur
+            bits = np.repeat(bits, 2, axis=0)
+        rows = np.zeros((bits.shape[0], PAPER_WIDTH_DOTS), dtype=bool)
+        width = min(bits.shape[1], PAPER_WIDTH_DOTS)
+        rows[:, :width] = bits[:, :width]
+        if self._advance_head(rows.shape[0]):
+            self._job.rows.extend(rows)
+
+    def _print_text_line(self):
+        if not self._text and self._job is None:
+            return
+        self._ensure_job()
+        text = self._text.decode('cp437', errors='replace')
+        self._text.clear()
+        scale = 2 if self._double[1] else 1
+        canvas = Image.new('1', (PAPER_WIDTH_DOTS, self._line_height * scale), 1)
+        if text:
+            font = _font(FONT_SIZE * scale)
+            draw = ImageDraw.Draw(canvas)
+            text_width = draw.textlength(text, font=font)
+            x = {1: (PAPER_WIDTH_DOTS - text_width) / 2, 2: PAPER_WIDTH_DOTS - text_width}.get(self._line_align, 0)
+            for dx in ((0, 1) if self._line_bold else (0,)):
+                draw.text((max(0, x) + dx, 2), text, font=font, fill=0)
+        self._line_align = self._align
+        self._line_bold = False
+        rows = ~np.asarray(canvas, dtype=bool)
+        if self._advance_head(rows.shape[0]):
+            self._job.rows.extend(rows)
+
+    def _finish_job(self):
+        job = self._job
+        if job is None:
+            return
+        if self._text:
+            self._print_text_line()
+        self._job = None
+        # Fin réelle : dernier octet reçu ou dernière ligne imprimée (pas le délai d'inactivité)
+        job.finished_at = max(self._last_data_at, self._head_busy_until)
+        if self.output_dir and job.rows:
+            os.makedirs(self.output_dir, exist_ok=True)
+            job.png_path = os.path.join(self.output_dir, f'job_{job.number:04d}.png')
+            Image.fromarray(np.where(np.array(job.rows), 0, 255).astype(np.uint8), 'L').save(job.png_path)
+        logger.info(f"[EMULATOR] Impression {job.number} : {job.to_dict()}")
+        with self._job_done:
+            self._job_done.notify_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Imprimante ESC/POS virtuelle (pty)')
+    parser.add_argument('--baudrate', type=int, default=9600, help='Débit série simulé (défaut: 9600)')
+    parser.add_argument('--speed', type=float, default=50.0, help='Vitesse de la tête en mm/s (défaut: 50)')
+    parser.add_argument('--out', default='emulator_output', help='Dossier des rendus PNG')
+    parser.add_argument('--link', default='/tmp/ttyPRINTER', help='Lien symbolique vers le pty')
+    parser.add_argument('--paper-mm', type=float, help='Longueur du rouleau (papier épuisé simulé)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    emulator = PrinterEmulator(args.baudrate, args.speed, args.out, args.link, args.paper_mm)
+
+    def toggle_paper(signum, frame):
+        emulator.set_paper_out(emulator.paper_state != 'out')
+        logger.info(f"[EMULATOR] Papier : {emulator.paper_state}")
+
+    signal.signal(signal.SIGUSR1, toggle_paper)
+    signal.signal(signal.SIGUSR2, lambda signum, frame: emulator.power_cycle())
+    emulator.start()
+    print(f"Imprimante virtuelle prête : {args.link} -> {emulator.device} (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.close()
+
+
+if __name__ == '__main__':
+    main()
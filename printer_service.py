@@ -0,0 +1,1392 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Service d'impression thermique persistant (imprimante 57mm ESC/POS).
+
+Remplace le lancement d'un `python3 ScriptPythonPOS.py` par impression :
+- l'interpréteur, escpos et PIL sont déjà chargés
+- une seule connexion série reste ouverte entre deux impressions
+- chaque impression mesure le temps jusqu'au premier octet envoyé (TTFB)
+- plusieurs imprimantes peuvent former un pool (gros événements) : la file répartit
+  les jobs et bascule sur une autre imprimante en cas de papier épuisé
+
+ScriptPythonPOS.py reste disponible comme wrapper en ligne de commande.
+"""
+
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+
+import numpy as np
+
+from dither_utils import apply_tone, iter_dither_bands
+from raster_utils import (GRAPHIC_KEY_LIST_QUERY, PRINTER_PROFILES, RasterEncoder, iter_command_blocks,
+                          parse_graphic_keys, to_bitmap)
+
+logger = logging.getLogger(__name__)
+
+ESCPOS_MISSING_MESSAGE = 'Module escpos manquant. Installez-le avec: pip install python-escpos'
+
+# Tramage par défaut : conversion 1 bit faite par escpos (Floyd-Steinberg de PIL), voir dither_utils.py
+DEFAULT_DITHER = 'escpos'
+
+# Tampon de réception de l'imprimante : dimensionne les bandes raster envoyées
+DEFAULT_BUFFER_BYTES = PRINTER_PROFILES['generic']['buffer_bytes']
+
+# Taille des blocs envoyés au port : granularité de la progression et de l'annulation
+SEND_CHUNK_SIZE = 1024
+
+
+# Requêtes de statut temps réel (DLE EOT n) et masques des réponses
+STATUS_PRINTER_QUERY = b'\x10\x04\x01'  # bit 3 : hors ligne
+STATUS_OFFLINE_QUERY = b'\x10\x04\x02'  # cause : capot ouvert, fin de papier, erreur
+STATUS_PAPER_QUERY = b'\x10\x04\x04'  # capteurs papier : presque fini / fini
+_MASK_OFFLINE = 0x08
+_MASK_COVER_OPEN = 0x04
+_MASK_STOPPED_PAPER_END = 0x20
+_MASK_ERROR = 0x40
+_MASK_NO_PAPER = 0x60
+_MASK_LOW_PAPER = 0x0C
+
+
+def read_status_byte(printer, query):
+    """
+    Envoyer une requête DLE EOT et lire l'octet de réponse.
+    On lit exactement un octet : escpos lit 16 octets et attend donc tout le
+    timeout série (1 s) à chaque vérification, avant le premier mouvement papier.
+    Retourne l'octet (int) ou None sans réponse.
+    """
+    device = getattr(printer, 'device', None)
+    if device is None or not hasattr(device, 'read'):
+        return None
+    if hasattr(device, 'reset_input_buffer'):
+        device.reset_input_buffer()  # ignorer une réponse tardive d'une requête précédente
+    printer._raw(query)
+    data = device.read(1)
+    return data[0] if data else None
+
+
+def read_graphic_keys(printer):
+    """
+    Clés des graphiques présents dans la RAM de l'imprimante (GS ( L fonction 80).
+    Retourne un ensemble de clés, ou None si l'imprimante ne répond pas à cette requête.
+    """
+    device = getattr(printer, 'device', None)
+    if device is None or not hasattr(device, 'read'):
+        return None
+    if hasattr(device, 'reset_input_buffer'):
+        device.reset_input_buffer()
+    printer._raw(GRAPHIC_KEY_LIST_QUERY)
+    response = bytearray()
+    while len(response) < 512:
+        data = device.read(1)
+        if not data:
+            return None
+        response += data
+        if len(response) >= 4 and data == b'\x00':
+            break
+    return parse_graphic_keys(bytes(response))
+
+
+def parse_status(printer_byte, offline_byte, paper_byte):
+    """Interpréter les réponses DLE EOT 1/2/4 (None = pas de réponse)"""
+    if printer_byte is None:
+        return {'status': 'error', 'message': 'Aucune réponse de l\'imprimante (éteinte ou déconnectée ?)',
+                'paper_status': 'unknown', 'online': None, 'cover_open': None}
+
+    online = not printer_byte & _MASK_OFFLINE
+    cover_open = bool(offline_byte is not None and offline_byte & _MASK_COVER_OPEN)
+    error = bool(offline_byte is not None and offline_byte & _MASK_ERROR)
+    if paper_byte is None:
+        paper = 'unknown'
+    elif paper_byte & _MASK_NO_PAPER == _MASK_NO_PAPER:
+        paper = 'out'
+    elif paper_byte & _MASK_LOW_PAPER == _MASK_LOW_PAPER:
+        paper = 'low'
+    else:
+        paper = 'ok'
+    if paper == 'unknown' and offline_byte is not None and offline_byte & _MASK_STOPPED_PAPER_END:
+        paper = 'out'
+
+    if cover_open:
+        status, message = 'error', 'Capot de l\'imprimante ouvert'
+    elif paper == 'out':
+        status, message = 'error', 'Plus de papier dans l\'imprimante'
+    elif error:
+        status, message = 'error', 'Imprimante en erreur'
+    elif not online:
+        status, message = 'error', 'Imprimante hors ligne'
+    elif paper == 'low':
+        status, message = 'ok', 'Imprimante connectée - papier bientôt épuisé'
+    else:
+        status, message = 'ok', 'Imprimante connectée'
+    return {'status': status, 'message': message, 'paper_status': paper,
+            'online': online, 'cover_open': cover_open}
+
+
+def check_paper_status(printer):
+    """Vérifier le statut du papier selon les codes de votre imprimante"""
+    try:
+        device = getattr(printer, 'device', None)
+        if device is not None and hasattr(device, 'read'):
+            status = read_status_byte(printer, STATUS_PAPER_QUERY)
+            if status is None:
+                return None, "Pas de réponse au statut papier"
+            if status & _MASK_NO_PAPER == _MASK_NO_PAPER:
+                return False, f"Plus de papier (status: {status:#04x})"
+            elif status & _MASK_LOW_PAPER == _MASK_LOW_PAPER:
+                return True, f"Papier bientôt épuisé (status: {status:#04x})"
+            return True, f"Papier présent (status: {status:#04x})"
+
+        if hasattr(printer, 'paper_status'):
+            status = printer.paper_status()
+
+            if status == 0:
+                return False, "Plus de papier (status: 0)"
+            elif status == 2:
+                return True, "Papier présent (status: 2)"
+            else:
+                return None, f"Status inconnu: {status}"
+        else:
+            return None, "Méthode paper_status non disponible"
+
+    except Exception as e:
+        return None, f"Erreur vérification papier: {e}"
+
+
+def print_width(high_density=False):
+    """Largeur d'impression en pixels selon la densité"""
+    return 384 if high_density else 192
+
+
+def optimize_image(img_path, high_density=False):
+    """Optimiser l'image avec compensation pour la haute densité"""
+    # Largeur maximale selon la densité
+    max_width = print_width(high_density)
+    if high_density:
+        height_compensation = 1.0  # Compensation ajustée pour l'écrasement en HD
+    else:
+        height_compensation = 1.0  # Pas de compensation en basse densité
+
+    # Charger et convertir en gris ; draft() laisse le décodeur JPEG réduire directement
+    img = Image.open(img_path)
+    img.draft('L', (max_width, max_width))
+    img = img.convert('L')
+    original_width, original_height = img.size
+
+    # Redimensionner SEULEMENT si l'image est plus large que la limite
+    if original_width > max_width:
+        # Calculer le ratio pour préserver les proportions
+        ratio = max_width / original_width
+        new_height = int(original_height * ratio * height_compensation)
+        img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
+    elif high_density:
+        # Même si l'image est plus petite, appliquer la compensation en HD
+        new_height = int(original_height * height_compensation)
+        img = img.resize((original_width, new_height), Image.Resampling.LANCZOS)
+
+    return img
+
+
+def print_text_bottom(printer, text):
+    """Imprimer du texte en bas, pleine largeur"""
+    if not text:
+        return
+
+    # Petit saut de ligne après l'image
+    printer.text("\n")
+
+    # Texte centré et en gras pour plus de visibilité
+    printer.set(align='center')
+    printer.set(bold=True)
+
+    # Imprimer le texte
+    printer.text(text)
+
+    # Remettre les paramètres par défaut
+    printer.set(align='left')
+    printer.set(bold=False)
+
+
+def iter_print_chunks(image_path, high_density=False, footer_text='', dither=DEFAULT_DITHER,
+                      contrast=1.0, gamma=1.0, buffer_bytes=DEFAULT_BUFFER_BYTES, logo=None, stats=None):
+    """
+    Produire les octets ESC/POS d'une impression bande par bande :
+    chaque bande est tramée puis encodée et sort aussitôt, le pied de page suit l'image.
+    logo (PrintAsset, printer_assets.py) : en tête ou en pied, appelé par sa clé s'il est
+    résident dans l'imprimante, sinon encodé en raster avec la photo.
+    stats (dict) reçoit 'expected_bytes' dès l'image chargée, puis les statistiques raster.
+    """
+    try:
+        from escpos.printer import Dummy
+    except ImportError:
+        raise RuntimeError(ESCPOS_MISSING_MESSAGE)
+    stats = stats if stats is not None else {}
+
+    gray = apply_tone(np.asarray(optimize_image(image_path, high_density)), contrast, gamma)
+    encoder = RasterEncoder(gray.shape[1], high_density, buffer_bytes)
+    stats['expected_bytes'] = gray.shape[0] * encoder.full_width_bytes
+
+    if logo is not None and logo.position == 'header':
+        head = logo.print_command() if logo.resident else encoder.feed(logo.bitmap)
+        if head:
+            yield head
+
+    if dither == DEFAULT_DITHER:
+        # Floyd-Steinberg de PIL (C) sur l'image entière, découpé ensuite en bandes
+        bitmap = to_bitmap(Image.fromarray(gray, 'L'))
+        bands = (bitmap[y:y + encoder.band_rows] for y in range(0, bitmap.shape[0], encoder.band_rows))
+    else:
+        bands = (band for _, band in iter_dither_bands(gray, dither, encoder.band_rows))
+    for band in bands:
+        chunk = encoder.feed(band)
+        if chunk:
+            yield chunk
+
+    # Pied de page mis en file derrière l'image
+    dummy = Dummy()
+    print_text_bottom(dummy, footer_text)
+    dummy.text("\n\n\n\n")  # 4 retours pour plus d'espace
+    if logo is not None and logo.position == 'footer':
+        if logo.resident:
+            tail = encoder.finish() + logo.print_command()
+        else:
+            tail = encoder.feed(logo.bitmap) + encoder.finish()
+    else:
+        tail = encoder.finish()
+    yield tail + dummy.output
+    stats.update(encoder.stats())
+    if logo is not None:
+        stats['logo'] = 'resident' if logo.resident else 'raster'
+
+
+def _iter_send_blocks(payload):
+    """
+    Découper octets ou flux en blocs de SEND_CHUNK_SIZE (progression/annulation) :
+    (bloc, octets d'image du bloc GS v 0 en cours restant à envoyer après lui)
+    """
+    source = (payload,) if isinstance(payload, bytes) else payload
+    return iter_command_blocks(source, SEND_CHUNK_SIZE)
+
+
+def resident_graphics(logo) -> tuple:
+    """Graphiques que l'imprimante doit détenir pour ce job"""
+    return (logo,) if logo is not None and logo.resident else ()
+
+
+class RasterError(RuntimeError):
+    """Échec de préparation de l'image pendant un envoi en streaming"""
+
+
+class RasterStream:
+    """
+    Pipeline producteur/consommateur : un thread trame et encode les bandes pendant
+    que l'envoi série consomme les précédentes. Sur une liaison lente, le traitement
+    de l'image est presque entièrement masqué par la transmission.
+    """
+
+    _END = object()
+
+    def __init__(self, chunks: Iterator[bytes], stats: Optional[dict] = None, max_pending: int = 8,
+                 on_complete: Optional[Callable[[bytes, dict], None]] = None,
+                 on_close: Optional[Callable[[], None]] = None):
+        self._chunks = chunks
+        self.stats = stats if stats is not None else {}
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._error: Optional[Exception] = None
+        self._data: List[bytes] = []
+        self._on_complete = on_complete
+        self._on_close = on_close
+        self._started = False
+        self._iterated = False
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self.payload: Optional[bytes] = None  # impression complète, une fois le flux terminé
+
+    @property
+    def expected_bytes(self) -> Optional[int]:
+        return self.stats.get('expected_bytes')
+
+    def start(self):
+        """Lancer la production (idempotent) : peut commencer avant l'ouverture de l'envoi."""
+        with self._close_lock:
+            if self._started or self._closed:
+                return
+            self._started = True
+        threading.Thread(target=self._produce, name='raster-stream', daemon=True).start()
+
+    def __iter__(self):
+        with self._close_lock:
+            if self._iterated:
+                raise RuntimeError('RasterStream ne peut être parcouru qu\'une fois')
+            self._iterated = True
+        self.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._END:
+                    break
+                yield item
+        finally:
+            # Consommateur arrêté (fin, annulation, erreur série) : libérer le producteur
+            self._stop.set()
+        if self._error is not None:
+            raise RasterError(f'Erreur de préparation de l\'image: {self._error}')
+
+    def close(self):
+        """Abandonner le flux (le producteur s'arrête à la bande suivante)."""
+        self._stop.set()
+        with self._close_lock:
+            never_started = not self._started and not self._closed
+            self._closed = True
+        if never_started:
+            # Jamais parcouru (ex: plus de papier) : le générateur ne tournera pas
+            close = getattr(self._chunks, 'close', None)
+            if close:
+                close()
+            if self._on_close:
+                self._on_close()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        completed = False
+        try:
+            for chunk in self._chunks:
+                self._data.append(chunk)
+                if not self._put(chunk):
+                    break
+            else:
+                completed = True
+        except Exception as e:
+            self._error = e
+        finally:
+            close = getattr(self._chunks, 'close', None)
+            if close:
+                close()
+            if completed:
+                self.payload = b''.join(self._data)
+                if self._on_complete:
+                    self._on_complete(self.payload, self.stats)
+            self._data = []
+            if self._on_close:
+                self._on_close()
+            self._put(self._END)
+
+
+class MeteredDevice:
+    """
+    Enveloppe du port série (pyserial) utilisé par escpos :
+    compte les octets écrits et l'instant du premier octet de chaque job.
+    """
+
+    def __init__(self, device):
+        self._device = device
+        self.reset()
+
+    def reset(self):
+        self.job_started_at = time.perf_counter()
+        self.first_write_at = None
+        self.bytes_written = 0
+
+    def write(self, data):
+        if self.first_write_at is None:
+            self.first_write_at = time.perf_counter()
+        self.bytes_written += len(data)
+        return self._device.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+
+class PrinterService:
+    """
+    Imprimante ESC/POS série gardée ouverte entre les impressions.
+    Thread-safe : un verrou sérialise tous les accès au port.
+    """
+
+    def __init__(self, port: str = '/dev/ttyAMA0', baudrate: int = 9600):
+        self.port = port
+        self.baudrate = int(baudrate)
+        self._printer = None
+        self._device: Optional[MeteredDevice] = None
+        self._lock = threading.RLock()
+        self.last_job: dict = {}
+        self.jobs_printed = 0
+        # Graphiques chargés dans la RAM de l'imprimante : clé -> empreinte du contenu
+        self._graphics: Dict[bytes, str] = {}
+        self._graphics_listing = True  # l'imprimante sait lister ses graphiques (vérification)
+
+    # --- Connexion ---
+
+    def configure(self, port: str, baudrate: int):
+        """Changer de port/baudrate (la connexion est rouverte au prochain usage)."""
+        with self._lock:
+            if port != self.port or int(baudrate) != self.baudrate:
+                logger.info(f"[PRINTER] Nouvelle configuration: {port} @ {baudrate} bps")
+                self.close()
+                self.port = port
+                self.baudrate = int(baudrate)
+
+    def _ensure_connected(self):
+        if self._printer is not None:
+            return self._printer
+        try:
+            from escpos.printer import Serial
+        except ImportError:
+            raise RuntimeError(ESCPOS_MISSING_MESSAGE)
+        started = time.perf_counter()
+        printer = Serial(devfile=self.port, baudrate=self.baudrate, timeout=1)
+        # escpos >= 3 ouvre le port à la demande
+        if getattr(printer, 'device', None) is None and hasattr(printer, 'open'):
+            printer.open()
+        self._device = MeteredDevice(printer.device)
+        printer.device = self._device
+        self._printer = printer
+        logger.info(f"[PRINTER] Connexion ouverte sur {self.port} @ {self.baudrate} bps "
+                    f"en {(time.perf_counter() - started) * 1000:.0f} ms")
+        return printer
+
+    def close(self):
+        with self._lock:
+            if self._printer is not None:
+                try:
+                    self._printer.close()
+                except Exception:
+                    pass
+            self._printer = None
+            self._device = None
+            # Reconnexion : l'imprimante a pu être éteinte entre-temps, on rechargera les graphiques
+            self._graphics.clear()
+
+    # --- Graphiques résidents ---
+
+    @property
+    def resident_graphics(self) -> Dict[str, str]:
+        return {key.decode('ascii', 'replace'): digest for key, digest in self._graphics.items()}
+
+    def forget_graphics(self):
+        """Considérer la RAM de l'imprimante vide : les graphiques seront rechargés au prochain job."""
+        with self._lock:
+            self._graphics.clear()
+
+    def _load_graphics(self, printer, graphics) -> int:
+        """Charger les graphiques absents (ou modifiés) avant le job. Retourne les octets envoyés."""
+        sent = 0
+        for graphic in graphics:
+            if self._graphics.get(graphic.key) == graphic.digest:
+                continue
+            command = graphic.define_command()
+            printer._raw(command)
+            self._graphics[graphic.key] = graphic.digest
+            sent += len(command)
+            logger.info(f"[PRINTER] Graphique {graphic.key.decode('ascii', 'replace')} chargé dans "
+                        f"l'imprimante {self.port} ({len(command)} octets)")
+        return sent
+
+    def _verify_graphics(self, printer, answered: bool):
+        """Oublier les graphiques perdus (imprimante éteinte ou redémarrée depuis le chargement)."""
+        if not self._graphics:
+            return
+        if not answered:
+            logger.info(f"[PRINTER] {self.port} ne répond plus : graphiques résidents à recharger")
+            self._graphics.clear()
+            return
+        if not self._graphics_listing:
+            return
+        keys = read_graphic_keys(printer)
+        if keys is None:
+            # Requête non gérée : on se fie au suivi (reconnexion, absence de réponse)
+            self._graphics_listing = False
+            logger.info(f"[PRINTER] {self.port} ne liste pas ses graphiques : suivi sans vérification")
+            return
+        lost = [key for key in self._graphics if key not in keys]
+        for key in lost:
+            del self._graphics[key]
+        if lost:
+            logger.info(f"[PRINTER] Graphiques perdus par {self.port} (redémarrage ?) : rechargement au prochain job")
+
+    # --- Opérations ---
+
+    def query_status(self, blocking: bool = True) -> Optional[dict]:
+        """
+        Interroger l'imprimante (DLE EOT 1, 2, 4) sur la connexion partagée.
+        blocking=False : retourne None si le port est occupé (impression en cours).
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return None
+        try:
+            printer = self._ensure_connected()
+            printer_byte = read_status_byte(printer, STATUS_PRINTER_QUERY)
+            offline_byte = paper_byte = None
+            if printer_byte is not None:
+                offline_byte = read_status_byte(printer, STATUS_OFFLINE_QUERY)
+                paper_byte = read_status_byte(printer, STATUS_PAPER_QUERY)
+            result = parse_status(printer_byte, offline_byte, paper_byte)
+            self._verify_graphics(printer, printer_byte is not None)
+        except RuntimeError as e:
+            result = {'status': 'error', 'message': str(e), 'paper_status': 'unknown'}
+        except Exception as e:
+            self.close()
+            result = {'status': 'error', 'message': f'Erreur de connexion: {str(e)}', 'paper_status': 'unknown'}
+        finally:
+            self._lock.release()
+        result.update(port=self.port, baudrate=self.baudrate)
+        return result
+
+    @staticmethod
+    def render_job(image_path: str, high_density: bool = False, footer_text: str = '',
+                   dither: str = DEFAULT_DITHER, contrast: float = 1.0, gamma: float = 1.0,
+                   buffer_bytes: int = DEFAULT_BUFFER_BYTES, logo=None) -> Tuple[bytes, dict]:
+        """
+        Rastériser une impression complète (image + pied de page) en octets ESC/POS.
+        Fait hors verrou : peut tourner pendant que l'imprimante est occupée,
+        et le résultat se renvoie tel quel pour chaque copie.
+        Retourne (octets, statistiques raster).
+        """
+        stats: dict = {}
+        chunks = iter_print_chunks(image_path, high_density, footer_text, dither, contrast, gamma,
+                                   buffer_bytes, logo, stats)
+        return b''.join(chunks), stats
+
+    def send(self, payload: Union[bytes, Iterable[bytes]], on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+             cancel_event: Optional[threading.Event] = None, started_at: Optional[float] = None,
+             graphics: Iterable = ()) -> dict:
+        """
+        Envoyer une impression, après vérification du papier.
+        - payload : octets déjà rastérisés, ou flux de bandes (RasterStream) envoyées dès leur production
+        - on_progress(octets_envoyés, total) appelé au fil de l'envoi (total estimé pour un flux)
+        - cancel_event permet d'interrompre l'envoi entre deux blocs (bloc d'image entamé complété en blanc)
+        - started_at (perf_counter) : origine du temps jusqu'au premier mouvement papier
+        - graphics : graphiques résidents appelés par le job (PrintAsset), chargés d'abord s'il le faut
+        Retourne {'success': bool, 'error': str, 'error_type': 'no_paper'|'cancelled'|'connection'|..., 'metrics': {...}}
+        """
+        try:
+            return self._send(payload, on_progress, cancel_event, started_at, graphics)
+        finally:
+            if isinstance(payload, RasterStream):
+                payload.close()
+
+    def _send(self, payload, on_progress, cancel_event, started_at, graphics) -> dict:
+        if isinstance(payload, RasterStream):
+            # Tramer la première bande pendant l'attente du port et la vérification du papier
+            payload.start()
+        with self._lock:
+            try:
+                printer = self._ensure_connected()
+                device = self._device
+                device.reset()
+                first_motion_at = None
+
+                # Vérifier le papier avant d'imprimer
+                paper_ok, paper_msg = check_paper_status(printer)
+                if paper_ok is False:
+                    logger.info(f"[PRINTER] {paper_msg}")
+                    return {'success': False, 'error': 'Plus de papier dans l\'imprimante', 'error_type': 'no_paper'}
+                elif paper_ok is None:
+                    logger.info(f"[PRINTER] {paper_msg} - impression sans vérification du papier")
+
+                graphics_bytes = self._load_graphics(printer, graphics)
+                sent = 0
+                raster_pending = 0
+                for chunk, pending in _iter_send_blocks(payload):
+                    if cancel_event is not None and cancel_event.is_set():
+                        # Compléter le bloc d'image entamé (blanc) : sinon l'imprimante prendrait le job
+                        # suivant pour des points de l'image. Puis dégager le papier
+                        printer._raw(b'\x00' * raster_pending + b'\n\n\n')
+                        device.flush()
+                        return {'success': False, 'error': 'Impression annulée', 'error_type': 'cancelled',
+                                'metrics': self._job_metrics(device, first_motion_at, started_at)}
+                    printer._raw(chunk)
+                    raster_pending = pending
+                    if first_motion_at is None:
+                        # Première bande partie : la tête commence à imprimer
+                        first_motion_at = time.perf_counter()
+                    sent += len(chunk)
+                    if on_progress:
+                        on_progress(sent, len(payload) if isinstance(payload, bytes) else payload.expected_bytes)
+                device.flush()  # attendre que tout soit parti sur la ligne série
+
+                metrics = dict(self._job_metrics(device, first_motion_at, started_at), graphics_bytes=graphics_bytes)
+                self.last_job = metrics
+                self.jobs_printed += 1
+                logger.info(f"[PRINTER] Impression terminée: premier mouvement papier après "
+                            f"{metrics['first_motion_ms']} ms, {metrics['bytes_sent']} octets en {metrics['duration_ms']} ms")
+                return {'success': True, 'message': 'Photo imprimée avec succès!', 'metrics': metrics}
+            except RasterError as e:
+                # Image illisible en cours de flux : dégager ce qui a été imprimé, la connexion reste valide
+                try:
+                    self._printer._raw(b'\n\n\n')
+                except Exception:
+                    pass
+                return {'success': False, 'error': str(e)}
+            except RuntimeError as e:
+                return {'success': False, 'error': str(e)}
+            except Exception as e:
+                logger.info(f"[PRINTER] Erreur d'impression: {e}")
+                # Connexion probablement invalide : on la rouvrira au prochain job
+                self.close()
+                return {'success': False, 'error': f'Erreur d\'impression: {e}', 'error_type': 'connection'}
+
+    def print_photo(self, image_path: str, high_density: bool = False, footer_text: str = '',
+                    dither: str = DEFAULT_DITHER, contrast: float = 1.0, gamma: float = 1.0,
+                    buffer_bytes: int = DEFAULT_BUFFER_BYTES, logo=None) -> dict:
+        """Imprimer une photo en streaming (usage direct, sans file d'attente)."""
+        started_at = time.perf_counter()
+        stats: dict = {}
+        stream = RasterStream(iter_print_chunks(image_path, high_density, footer_text, dither, contrast, gamma,
+                                                buffer_bytes, logo, stats), stats)
+        result = self.send(stream, started_at=started_at, graphics=resident_graphics(logo))
+        if 'metrics' in result:
+            result['metrics'].update(stream.stats)
+        return result
+
+    @staticmethod
+    def _job_metrics(device: MeteredDevice, first_motion_at: Optional[float] = None,
+                     started_at: Optional[float] = None) -> dict:
+        now = time.perf_counter()
+        first = device.first_write_at or now
+        duration = now - device.job_started_at
+        origin = started_at or device.job_started_at
+        return {
+            'ttfb_ms': round((first - device.job_started_at) * 1000, 1),
+            # Appui sur « Imprimer » -> première bande envoyée (l'imprimante commence à avancer)
+            'first_motion_ms': round(((first_motion_at or now) - origin) * 1000, 1),
+            'duration_ms': round(duration * 1000, 1),
+            'bytes_sent': device.bytes_written,
+            # Débit effectif sur la ligne (octets/s), à comparer à baudrate / 10
+            'throughput_bps': round(device.bytes_written / duration) if duration > 0 else 0,
+        }
+
+
+# === Cache des impressions rastérisées ===
+
+class RasterCache:
+    """
+    Cache LRU des impressions déjà rastérisées (octets ESC/POS prêts à envoyer).
+
+    Clé : (photo, taille/mtime, densité, largeur, tramage, pied de page, logo).
+    prefetch() rastérise en arrière-plan juste après la capture ou l'effet, pour
+    que l'appui sur « Imprimer » commence à envoyer des octets immédiatement.
+    Une rastérisation en cours n'est jamais lancée deux fois : get() l'attend.
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Tuple[bytes, dict]]" = OrderedDict()
+        self._inflight: Dict[tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._pending: "queue.Queue[tuple]" = queue.Queue()
+        self._worker = None
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+    @staticmethod
+    def _key(image_path: str, high_density: bool, footer_text: str, dither: str,
+             contrast: float, gamma: float, buffer_bytes: int, logo=None) -> Optional[tuple]:
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        return (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns,
+                bool(high_density), print_width(high_density), dither, float(contrast), float(gamma),
+                int(buffer_bytes), footer_text or '', logo.cache_token if logo is not None else None)
+
+    def _acquire(self, key: tuple, count: bool):
+        """
+        Retourne (entrée, None) si elle est en cache, sinon (None, événement) :
+        l'appelant devient alors responsable de la rastérisation et doit appeler _release().
+        """
+        while True:
+            with self._lock:
+                rendered = self._entries.get(key)
+                if rendered is not None:
+                    self._entries.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return rendered, None
+                waiting = self._inflight.get(key)
+                if waiting is None:
+                    done = self._inflight[key] = threading.Event()
+                    if count:
+                        self.misses += 1
+                    return None, done
+            # Rastérisation déjà en cours (ex: spéculative) : l'attendre plutôt que la refaire
+            waiting.wait()
+
+    def _store(self, key: tuple, rendered: Tuple[bytes, dict]):
+        with self._lock:
+            self._entries[key] = rendered
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _release(self, key: tuple, done: threading.Event):
+        with self._lock:
+            self._inflight.pop(key, None)
+        done.set()
+
+    def get(self, image_path: str, high_density: bool = False, footer_text: str = '',
+            dither: str = DEFAULT_DITHER, contrast: float = 1.0, gamma: float = 1.0,
+            buffer_bytes: int = DEFAULT_BUFFER_BYTES, logo=None, count: bool = True):
+        """Retourne ((payload, stats raster), depuis_le_cache). Rastérise si nécessaire."""
+        render_args = (image_path, high_density, footer_text, dither, contrast, gamma, buffer_bytes, logo)
+        key = self._key(*render_args)
+        if key is None:
+            return PrinterService.render_job(*render_args), False
+        rendered, done = self._acquire(key, count)
+        if rendered is not None:
+            return rendered, True
+        try:
+            rendered = PrinterService.render_job(*render_args)
+            self._store(key, rendered)
+            return rendered, False
+        finally:
+            self._release(key, done)
+
+    def open(self, image_path: str, high_density: bool = False, footer_text: str = '',
+             dither: str = DEFAULT_DITHER, contrast: float = 1.0, gamma: float = 1.0,
+             buffer_bytes: int = DEFAULT_BUFFER_BYTES, logo=None):
+        """
+        Source pour une impression : les octets en cache, sinon un flux de bandes
+        produit pendant l'envoi (et mis en cache une fois complet).
+        Retourne (octets ou RasterStream, stats raster, depuis_le_cache).
+        """
+        render_args = (image_path, high_density, footer_text, dither, contrast, gamma, buffer_bytes, logo)
+        key = self._key(*render_args)
+        done = None
+        if key is not None:
+            rendered, done = self._acquire(key, count=True)
+            if rendered is not None:
+                return rendered[0], rendered[1], True
+        stats: dict = {}
+        chunks = iter_print_chunks(*render_args, stats=stats)
+        if key is None:
+            return RasterStream(chunks, stats), stats, False
+        return RasterStream(chunks, stats,
+                            on_complete=lambda payload, st: self._store(key, (payload, st)),
+                            on_close=lambda: self._release(key, done)), stats, False
+
+    def prefetch(self, image_path: str, high_density: bool = False, footer_text: str = '',
+                 dither: str = DEFAULT_DITHER, contrast: float = 1.0, gamma: float = 1.0,
+                 buffer_bytes: int = DEFAULT_BUFFER_BYTES, logo=None):
+        """Rastérisation spéculative en arrière-plan (un seul thread, ordre d'arrivée)."""
+        self._pending.put((image_path, high_density, footer_text, dither, contrast, gamma, buffer_bytes, logo))
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='raster-prefetch', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                render_args = self._pending.get(timeout=30)
+            except queue.Empty:
+                return
+            image_path = render_args[0]
+            started = time.perf_counter()
+            try:
+                _, cached = self.get(*render_args, count=False)
+                if not cached:
+                    self.prefetched += 1
+                    logger.info(f"[PRINTER] Rastérisation anticipée de {os.path.basename(image_path)} "
+                                f"en {(time.perf_counter() - started) * 1000:.0f} ms")
+            except Exception as e:
+                logger.info(f"[PRINTER] Rastérisation anticipée impossible pour {image_path}: {e}")
+
+    def discard(self, image_path: str):
+        """Oublier les rastérisations d'une photo (supprimée)."""
+        path = os.path.abspath(image_path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                del self._entries[key]
+
+    def invalidate(self):
+        """Vider le cache (réglages d'impression modifiés)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': sum(len(p) for p, _ in self._entries.values()),
+                    'hits': self.hits, 'misses': self.misses, 'prefetched': self.prefetched}
+
+
+# === Pool d'imprimantes ===
+
+# Champs de statut dont le changement est poussé aux clients
+_STATUS_FIELDS = ('status', 'message', 'paper_status', 'online', 'cover_open')
+
+
+class PoolPrinter:
+    """Une imprimante du pool : connexion série, dernier statut connu et compteurs de débit."""
+
+    def __init__(self, port: str, baudrate: int):
+        self.service = PrinterService(port, baudrate)
+        self.status: dict = {'status': 'unknown', 'message': 'Vérification de l\'état de l\'imprimante...',
+                             'paper_status': 'unknown', 'checked_at': None, 'changed_at': None}
+        self.current_job: Optional[str] = None  # modifié par la file d'impression, sous son verrou
+        self.jobs_done = 0
+        self.copies_done = 0
+        self.bytes_sent = 0
+        self.busy_seconds = 0.0
+        self.failovers = 0
+
+    @property
+    def port(self) -> str:
+        return self.service.port
+
+    @property
+    def healthy(self) -> bool:
+        """Peut recevoir des jobs (statut inconnu compris : pas encore interrogée)"""
+        return self.status.get('status') != 'error'
+
+    def record(self, metrics: dict):
+        """Compter une copie imprimée."""
+        self.copies_done += 1
+        self.bytes_sent += metrics.get('bytes_sent', 0)
+        self.busy_seconds += metrics.get('duration_ms', 0) / 1000
+
+    def to_dict(self) -> dict:
+        return dict(self.status, port=self.port, baudrate=self.service.baudrate, healthy=self.healthy,
+                    busy=self.current_job is not None, current_job=self.current_job,
+                    jobs_done=self.jobs_done, copies_done=self.copies_done, bytes_sent=self.bytes_sent,
+                    throughput_bps=int(self.bytes_sent / self.busy_seconds) if self.busy_seconds else None,
+                    copies_per_hour=round(self.copies_done * 3600 / self.busy_seconds) if self.busy_seconds else None,
+                    failovers=self.failovers, graphics=self.service.resident_graphics)
+
+
+class PrinterPool:
+    """
+    Imprimantes de l'événement (principale + supplémentaires), une par port, dans l'ordre
+    de la configuration. Le statut de chaque imprimante (moniteur ou échec d'impression)
+    décide de sa participation : une imprimante en erreur ne prend plus de jobs tant
+    qu'une autre est disponible.
+    Les abonnés (file, moniteur) sont appelés à chaque changement de statut ou de configuration.
+    """
+
+    def __init__(self):
+        self._printers: "OrderedDict[str, PoolPrinter]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[dict]], None]] = []
+
+    def configure(self, endpoints: List[Tuple[str, int]]):
+        """Aligner le pool sur la configuration [(port, baudrate), ...] (sans effet si inchangée)."""
+        with self._lock:
+            if [(p.port, p.service.baudrate) for p in self._printers.values()] == \
+                    [(port, int(baudrate)) for port, baudrate in endpoints]:
+                return
+            printers: "OrderedDict[str, PoolPrinter]" = OrderedDict()
+            for port, baudrate in endpoints:
+                if port in printers:
+                    continue
+                printer = self._printers.get(port)
+                if printer is None:
+                    printer = PoolPrinter(port, baudrate)
+                elif printer.service.baudrate != int(baudrate):
+                    printer.service.configure(port, baudrate)
+                printers[port] = printer
+            removed = [p for port, p in self._printers.items() if port not in printers]
+            self._printers = printers
+        logger.info(f"[PRINTER] Pool d'impression: {', '.join(printers) or 'aucune imprimante'}")
+        for printer in removed:
+            # La fermeture attend la fin d'une éventuelle impression : pas dans le thread appelant
+            threading.Thread(target=printer.service.close, daemon=True).start()
+        self._emit(None)
+
+    def printers(self) -> List[PoolPrinter]:
+        with self._lock:
+            return list(self._printers.values())
+
+    def get(self, port: str) -> Optional[PoolPrinter]:
+        with self._lock:
+            return self._printers.get(port)
+
+    def has_healthy(self) -> bool:
+        with self._lock:
+            return any(p.healthy for p in self._printers.values())
+
+    def update_status(self, port: str, result: dict) -> Optional[dict]:
+        """Enregistrer le statut d'une imprimante. Retourne son instantané (None si hors du pool)."""
+        now = time.time()
+        with self._lock:
+            printer = self._printers.get(port)
+            if printer is None:
+                return None
+            previous = printer.status
+            changed = any(result.get(k) != previous.get(k) for k in _STATUS_FIELDS)
+            printer.status = dict(result, checked_at=now, changed_at=now if changed else previous.get('changed_at'))
+            snapshot = printer.to_dict()
+        if changed:
+            logger.info(f"[PRINTER] Statut {port}: {snapshot['status']} - {snapshot['message']}")
+            self._emit(snapshot)
+        return snapshot
+
+    def add_listener(self, listener: Callable[[Optional[dict]], None]):
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def _emit(self, snapshot: Optional[dict]):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.info(f"[PRINTER] Erreur notification pool: {e}")
+
+    def stats(self) -> List[dict]:
+        return [printer.to_dict() for printer in self.printers()]
+
+    def forget_graphics(self):
+        """Recharger les graphiques résidents dans toutes les imprimantes au prochain job."""
+        for printer in self.printers():
+            printer.service.forget_graphics()
+
+    def close(self):
+        for printer in self.printers():
+            printer.service.close()
+
+
+# === File d'attente d'impression ===
+
+# Statuts d'un job
+JOB_QUEUED = 'queued'
+JOB_PRINTING = 'printing'
+JOB_DONE = 'done'
+JOB_ERROR = 'error'
+JOB_NO_PAPER = 'no_paper'
+JOB_CANCELLED = 'cancelled'
+_FINAL_STATUSES = (JOB_DONE, JOB_ERROR, JOB_NO_PAPER, JOB_CANCELLED)
+
+# Nombre de jobs terminés conservés pour l'inspection
+_MAX_FINISHED_JOBS = 50
+# Échecs qui rendent l'imprimante indisponible et font basculer le job sur une autre
+_FAILOVER_ERRORS = ('no_paper', 'connection')
+# Attente maximale d'un worker sans réveil (filet de sécurité)
+_WORKER_WAIT_S = 2.0
+
+
+class PrintJob:
+    """Une demande d'impression (une photo, N copies)."""
+
+    def __init__(self, image_path: str, high_density: bool, footer_text: str, copies: int = 1, origin: str = 'guest',
+                 dither: str = DEFAULT_DITHER, contrast: float = 1.0, gamma: float = 1.0,
+                 buffer_bytes: int = DEFAULT_BUFFER_BYTES, logo=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.image_path = image_path
+        self.filename = os.path.basename(image_path)
+        self.high_density = high_density
+        self.footer_text = footer_text
+        self.dither = dither
+        self.contrast = contrast
+        self.gamma = gamma
+        self.buffer_bytes = buffer_bytes
+        self.logo = logo
+        self.copies = max(1, int(copies))
+        self.origin = origin
+        self.status = JOB_QUEUED
+        self.copies_done = 0
+        self.progress = 0.0
+        self.error = None
+        self.metrics: dict = {}
+        self.printer: Optional[str] = None  # port de l'imprimante qui traite le job
+        self.failovers = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINAL_STATUSES
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'copies': self.copies,
+            'copies_done': self.copies_done,
+            'origin': self.origin,
+            'dither': self.dither,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'error': self.error,
+            'metrics': self.metrics,
+            'printer': self.printer,
+            'failovers': self.failovers,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class PrintQueue:
+    """
+    File d'impression FIFO partagée par les imprimantes du pool, un worker par imprimante.
+    Le prochain job va à l'imprimante libre et disponible qui a le moins imprimé ; si elle
+    tombe en panne de papier (ou perd la connexion), le job repasse en tête de file pour
+    une autre imprimante.
+    Les changements d'état sont poussés via notify(payload) (ex: SSE /events).
+    """
+
+    def __init__(self, pool_provider: Callable[[], PrinterPool], notify: Optional[Callable[[dict], None]] = None,
+                 raster_cache: Optional[RasterCache] = None):
+        self._pool_provider = pool_provider
+        self._notify = notify or (lambda payload: None)
+        self._rasters = raster_cache or RasterCache()
+        self._pending: "deque[PrintJob]" = deque()
+        self._jobs: "OrderedDict[str, PrintJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._workers: Dict[str, threading.Thread] = {}
+        self._stop = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        pool = self._pool_provider()
+        pool.add_listener(self._on_pool_change)
+        self._sync_workers(pool)
+
+    def stop(self):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    # --- API ---
+
+    def submit(self, image_path: str, high_density: bool = False, footer_text: str = '',
+               copies: int = 1, origin: str = 'guest', dither: str = DEFAULT_DITHER,
+               contrast: float = 1.0, gamma: float = 1.0, buffer_bytes: int = DEFAULT_BUFFER_BYTES,
+               logo=None) -> PrintJob:
+        job = PrintJob(image_path, high_density, footer_text, copies, origin, dither, contrast, gamma, buffer_bytes,
+                       logo)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self.start()
+        with self._wakeup:
+            self._pending.append(job)
+            self._wakeup.notify_all()
+        logger.info(f"[PRINT QUEUE] Job {job.id} ajouté: {job.filename} x{job.copies} ({origin})")
+        self._publish(job)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Annuler un job en attente ou en cours (l'envoi s'arrête au prochain bloc)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        if job.status == JOB_QUEUED:
+            self._finish(job, JOB_CANCELLED, 'Impression annulée')
+        logger.info(f"[PRINT QUEUE] Annulation demandée pour le job {job_id}")
+        return True
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list_jobs(self) -> List[dict]:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def is_printing(self) -> bool:
+        with self._lock:
+            return any(job.status == JOB_PRINTING for job in self._jobs.values())
+
+    # --- Workers ---
+
+    def _on_pool_change(self, snapshot: Optional[dict]):
+        """Imprimante ajoutée/retirée ou statut changé : réveiller les workers concernés"""
+        if snapshot is None and not self._stop.is_set():
+            self._sync_workers(self._pool_provider())
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _sync_workers(self, pool: PrinterPool):
+        with self._lock:
+            for printer in pool.printers():
+                worker = self._workers.get(printer.port)
+                if worker is not None and worker.is_alive():
+                    continue
+                worker = threading.Thread(target=self._run, args=(printer.port,), daemon=True,
+                                          name=f'print-queue-{os.path.basename(printer.port)}')
+                self._workers[printer.port] = worker
+                worker.start()
+                logger.info(f"[PRINT QUEUE] Worker d'impression démarré pour {printer.port}")
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:-_MAX_FINISHED_JOBS] if len(finished) > _MAX_FINISHED_JOBS else []:
+            del self._jobs[job_id]
+
+    def _publish(self, job: PrintJob):
+        try:
+            self._notify({'event': 'print_job', 'job': job.to_dict()})
+        except Exception as e:
+            logger.info(f"[PRINT QUEUE] Erreur notification: {e}")
+
+    def _finish(self, job: PrintJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        self._publish(job)
+
+    def _is_next_printer(self, pool: PrinterPool, printer: PoolPrinter) -> bool:
+        """Cette imprimante est-elle celle qui doit prendre le prochain job ? (verrou de la file tenu)"""
+        idle = [p for p in pool.printers() if p.current_job is None and p.port in self._workers]
+        if pool.has_healthy():
+            idle = [p for p in idle if p.healthy]
+        # Sinon aucune n'est disponible : tenter quand même (le job échouera avec l'erreur réelle)
+        if not idle:
+            return False
+        # Moins de copies imprimées = moins occupée jusqu'ici (et usure / papier répartis)
+        return min(idle, key=lambda p: p.copies_done) is printer
+
+    def _take(self, pool: PrinterPool, printer: PoolPrinter) -> Optional[PrintJob]:
+        with self._wakeup:
+            while self._pending and self._pending[0].finished:
+                self._pending.popleft()  # annulé pendant l'attente
+            if self._pending and self._is_next_printer(pool, printer):
+                job = self._pending.popleft()
+                printer.current_job = job.id
+                return job
+            self._wakeup.wait(_WORKER_WAIT_S)
+            return None
+
+    def _run(self, port: str):
+        while not self._stop.is_set():
+            pool = self._pool_provider()
+            printer = pool.get(port)
+            if printer is None:
+                break  # imprimante retirée du pool
+            job = self._take(pool, printer)
+            if job is None:
+                continue
+            try:
+                self._process(job, pool, printer)
+            except Exception as e:
+                logger.info(f"[PRINT QUEUE] Erreur inattendue job {job.id}: {e}")
+                self._finish(job, JOB_ERROR, str(e))
+            finally:
+                with self._wakeup:
+                    printer.current_job = None
+                    self._wakeup.notify_all()
+        with self._lock:
+            if self._workers.get(port) is threading.current_thread():
+                del self._workers[port]
+        logger.info(f"[PRINT QUEUE] Worker d'impression arrêté pour {port}")
+
+    def _requeue(self, job: PrintJob, printer: PoolPrinter):
+        """Remettre le job en tête de file pour une autre imprimante (bascule)."""
+        job.failovers += 1
+        printer.failovers += 1
+        job.status = JOB_QUEUED
+        job.printer = None
+        with self._wakeup:
+            self._pending.appendleft(job)
+            self._wakeup.notify_all()
+        logger.info(f"[PRINT QUEUE] Job {job.id} basculé depuis {printer.port}")
+        self._publish(job)
+
+    def _process(self, job: PrintJob, pool: PrinterPool, printer: PoolPrinter):
+        job.status = JOB_PRINTING
+        job.printer = printer.port
+        job.started_at = job.started_at or time.time()
+        self._publish(job)
+
+        # Raster en cache (anticipé après la capture) ou produit en flux pendant l'envoi ;
+        # dans les deux cas la rastérisation n'a lieu qu'une fois pour toutes les copies
+        started = time.perf_counter()
+        try:
+            source, raster_stats, cached = self._rasters.open(job.image_path, job.high_density, job.footer_text,
+                                                              job.dither, job.contrast, job.gamma, job.buffer_bytes,
+                                                              job.logo)
+        except Exception as e:
+            self._finish(job, JOB_ERROR, f'Erreur de préparation de l\'image: {e}')
+            return
+
+        service = printer.service
+        last_published = [0.0]
+
+        def on_progress(sent, total):
+            fraction = min(sent / total, 0.99) if total else 0.0
+            job.progress = (job.copies_done + fraction) / job.copies
+            # Limiter le nombre d'événements poussés (~tous les 10%)
+            if job.progress - last_published[0] >= 0.1:
+                last_published[0] = job.progress
+                self._publish(job)
+
+        while job.copies_done < job.copies:
+            result = service.send(source, on_progress=on_progress, cancel_event=job.cancel_event,
+                                  started_at=started, graphics=resident_graphics(job.logo))
+            if 'metrics' in result:
+                job.metrics = dict(result['metrics'], raster_cached=cached, **raster_stats)
+            if not result['success']:
+                error_type = result.get('error_type')
+                if error_type in _FAILOVER_ERRORS:
+                    # Imprimante indisponible jusqu'au prochain statut correct du moniteur
+                    pool.update_status(printer.port, {'status': 'error', 'message': result.get('error'),
+                                                      'paper_status': 'out' if error_type == 'no_paper' else 'unknown'})
+                    if job.failovers < len(pool.printers()) - 1 and pool.has_healthy():
+                        self._requeue(job, printer)
+                        return
+                status = {'no_paper': JOB_NO_PAPER, 'cancelled': JOB_CANCELLED}.get(error_type, JOB_ERROR)
+                self._finish(job, status, result.get('error'))
+                return
+            printer.record(result['metrics'])
+            job.copies_done += 1
+            if isinstance(source, RasterStream):
+                # Copies suivantes : renvoyer les octets produits par le flux
+                source = source.payload
+            started = time.perf_counter()
+        printer.jobs_done += 1
+        job.progress = 1.0
+        self._finish(job, JOB_DONE)
+
+
+# === Surveillance des imprimantes ===
+
+# Ordre de préférence pour le statut global : la meilleure imprimante du pool fait foi
+_STATUS_RANK = {'ok': 0, 'unknown': 1, 'error': 2}
+
+
+class PrinterMonitor:
+    """
+    Unique propriétaire de l'interrogation de statut : un thread interroge chaque imprimante
+    du pool à intervalle régulier (en sautant celles qui impriment), le pool garde le
+    dernier état de chacune et les changements sont poussés via notify(payload).
+    status() répond depuis ce cache, sans toucher aux ports série.
+    """
+
+    def __init__(self, pool_provider: Callable[[], PrinterPool], enabled: Callable[[], bool] = lambda: True,
+                 notify: Optional[Callable[[dict], None]] = None, interval: float = 15.0):
+        self._pool_provider = pool_provider
+        self._enabled = enabled
+        self._notify = notify or (lambda payload: None)
+        self.interval = float(interval)
+        self._disabled = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+
+    def start(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._pool_provider().add_listener(self._on_pool_change)
+        self._worker = threading.Thread(target=self._run, name='printer-monitor', daemon=True)
+        self._worker.start()
+        logger.info(f"[PRINTER] Surveillance du statut démarrée (toutes les {self.interval:.0f} s)")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def poke(self):
+        """Demander une vérification au plus tôt (fin d'impression, changement de config)."""
+        self._wake.set()
+
+    def status(self) -> dict:
+        """Statut global (meilleure imprimante du pool) et détail par imprimante."""
+        if self._disabled:
+            return {'status': 'disabled', 'message': 'Imprimante désactivée dans la configuration',
+                    'paper_status': 'unknown', 'printers': [], 'checked_at': None, 'changed_at': None}
+        printers = self._pool_provider().stats()
+        if not printers:
+            return {'status': 'error', 'message': 'Aucune imprimante configurée', 'paper_status': 'unknown',
+                    'printers': [], 'checked_at': None, 'changed_at': None}
+        best = min(printers, key=lambda p: (_STATUS_RANK.get(p['status'], 2), p.get('paper_status') != 'ok'))
+        summary = {key: best.get(key) for key in _STATUS_FIELDS + ('port', 'baudrate')}
+        summary.update(printers=printers,
+                       ready=sum(1 for p in printers if p['healthy']),
+                       checked_at=max((p['checked_at'] or 0 for p in printers), default=0) or None,
+                       changed_at=max((p['changed_at'] or 0 for p in printers), default=0) or None)
+        return summary
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.info(f"[PRINTER] Erreur de surveillance: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh(self) -> dict:
+        """Interroger maintenant les imprimantes libres (celles qui impriment sont sautées)."""
+        enabled = self._enabled()
+        if enabled == self._disabled:
+            self._disabled = not enabled
+            self._publish()
+        if not enabled:
+            return self.status()
+        pool = self._pool_provider()
+        for printer in pool.printers():
+            if printer.current_job is not None:
+                continue
+            result = printer.service.query_status(blocking=False)
+            if result is not None:
+                pool.update_status(printer.port, result)
+        return self.status()
+
+    def _on_pool_change(self, snapshot: Optional[dict]):
+        if snapshot is None:
+            self.poke()  # imprimante ajoutée : l'interroger sans attendre
+        self._publish()
+
+    def _publish(self):
+        try:
+            self._notify({'event': 'printer_status', 'printer': self.status()})
+        except Exception as e:
+            logger.info(f"[PRINTER] Erreur notification statut: {e}")
+
+
+# === Pool partagé par l'application ===
+
+_pool_singleton: Optional[PrinterPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_printer_pool(endpoints: List[Tuple[str, int]]) -> PrinterPool:
+    """Retourne le pool d'imprimantes partagé, aligné sur [(port, baudrate), ...]."""
+    global _pool_singleton
+    with _pool_lock:
+        if _pool_singleton is None:
+            _pool_singleton = PrinterPool()
+        pool = _pool_singleton
+    pool.configure(endpoints)
+    return pool
+
+
+def release_printer_pool():
+    """Fermer les connexions série du pool (arrêt de l'application)."""
+    global _pool_singleton
+    with _pool_lock:
+        if _pool_singleton is not None:
+            _pool_singleton.close()
+            _pool_singleton = None
@@ -0,0 +1,228 @@
+import logging
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+GS = b'\x1d'
+ESC = b'\x1b'
+# En-tête d'un bloc raster : GS v 0 m xL xH yL yH, suivi de (xL + 256 xH) * (yL + 256 yH) octets d'image
+RASTER_HEADER = GS + b'v0'
+RASTER_HEADER_LEN = 8
+
+# Profils d'imprimante : tampon de réception et capacités raster.
+# Les imprimantes 57 mm génériques (celle du photobooth) n'ont pas de commande
+# raster compressée : on gagne les octets en sautant le blanc plutôt qu'en compressant.
+PRINTER_PROFILES = {
+    'generic': {'buffer_bytes': 4096, 'max_band_rows': 255},
+}
+
+# En dessous de ce nombre de lignes blanches, une avance papier (ESC J) + un nouvel
+# en-tête GS v 0 coûtent plus cher que d'envoyer les lignes telles quelles
+MIN_FEED_ROWS = 4
+_MAX_FEED_DOTS = 255  # ESC J n : n <= 255
+
+
+def to_bitmap(img: Image.Image) -> np.ndarray:
+    """
+    Image -> tableau booléen (True = point noir).
+    Une image 'L' non tramée est convertie comme le ferait escpos (Floyd-Steinberg de PIL).
+    """
+    if img.mode != '1':
+        img = img.convert('L').convert('1')
+    return ~np.asarray(img, dtype=bool)
+
+
+def band_rows_for_buffer(width_bytes: int, buffer_bytes: int, max_rows: int = 255) -> int:
+    """Hauteur de bande qui tient dans le tampon de l'imprimante (en-tête compris)"""
+    usable = max(buffer_bytes - 8, width_bytes)
+    return max(1, min(max_rows, usable // max(width_bytes, 1)))
+
+
+def _feed(dots: int, dots_per_row: int = 1) -> bytes:
+    """ESC J : avance papier de n points, sans rien imprimer (par pas de lignes entières)"""
+    out = bytearray()
+    max_step = _MAX_FEED_DOTS - _MAX_FEED_DOTS % dots_per_row
+    while dots > 0:
+        step = min(dots, max_step)
+        out += ESC + b'J' + bytes((step,))
+        dots -= step
+    return bytes(out)
+
+
+def _runs(blank_rows: np.ndarray) -> Iterator[Tuple[bool, int, int]]:
+    """Découper les lignes en suites (blanc, début, fin)"""
+    if not len(blank_rows):
+        return
+    edges = np.flatnonzero(np.diff(blank_rows.astype(np.int8))) + 1
+    bounds = [0] + edges.tolist() + [len(blank_rows)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        yield bool(blank_rows[start]), start, end
+
+
+class RasterEncoder:
+    """
+    Encodeur GS v 0 incrémental : les lignes arrivent bande par bande (tramage en cours)
+    et les commandes sortent au fur et à mesure, optimisées pour une liaison série lente :
+    - suites de lignes blanches remplacées par des avances papier (ESC J)
+    - octets blancs à droite retirés, bloc par bloc
+    - blocs dimensionnés selon le tampon de l'imprimante
+    """
+
+    def __init__(self, width: int, high_density: bool = False, buffer_bytes: int = 4096, max_band_rows: int = 255):
+        # m=0 : densité normale ; m=3 : double largeur et double hauteur (basse densité)
+        self.mode = 0 if high_density else 3
+        self.dots_per_row = 1 if high_density else 2
+        self.full_width_bytes = (width + 7) // 8
+        self.band_rows = band_rows_for_buffer(self.full_width_bytes, buffer_bytes, max_band_rows)
+        self._pending_blank = 0  # lignes blanches pas encore émises
+        self._started = False  # du contenu a déjà été émis (la marge du haut devient une avance)
+        self.rows = 0
+        self.bytes_out = 0
+        self.bands = 0
+        self.fed_rows = 0
+
+    def feed(self, bitmap: np.ndarray) -> bytes:
+        """bitmap : booléen (h, largeur), True = point noir. Retourne les commandes prêtes à envoyer."""
+        packed = np.packbits(bitmap, axis=1)  # bit de poids fort à gauche
+        self.rows += packed.shape[0]
+        out = bytearray()
+        for blank, start, end in _runs(~packed.any(axis=1)):
+            if blank:
+                self._pending_blank += end - start
+                continue
+            content = packed[start:end]
+            if self._pending_blank:
+                if self._pending_blank >= MIN_FEED_ROWS or not self._started:
+                    out += self._flush_feed()
+                else:
+                    # Courte suite de blanc : moins chère envoyée telle quelle qu'en avance + en-tête
+                    zeros = np.zeros((self._pending_blank, packed.shape[1]), dtype=np.uint8)
+                    content = np.concatenate([zeros, content])
+                    self._pending_blank = 0
+            for y in range(0, content.shape[0], self.band_rows):
+                out += self._block(content[y:y + self.band_rows])
+            self._started = True
+        self.bytes_out += len(out)
+        return bytes(out)
+
+    def finish(self) -> bytes:
+        """Émettre la marge du bas (avance papier)."""
+        out = self._flush_feed()
+        self.bytes_out += len(out)
+        return out
+
+    def _flush_feed(self) -> bytes:
+        rows, self._pending_blank = self._pending_blank, 0
+        self.fed_rows += rows
+        return _feed(rows * self.dots_per_row, self.dots_per_row)
+
+    def _block(self, band: np.ndarray) -> bytes:
+        # Largeur utile du bloc : jusqu'au dernier octet non blanc
+        used_columns = np.flatnonzero(band.any(axis=0))
+        width_bytes = int(used_columns[-1]) + 1 if len(used_columns) else 1
+        rows = band.shape[0]
+        self.bands += 1
+        header = RASTER_HEADER + bytes((self.mode, width_bytes & 0xFF, width_bytes >> 8, rows & 0xFF, rows >> 8))
+        return header + np.ascontiguousarray(band[:, :width_bytes]).tobytes()
+
+    def stats(self) -> dict:
+        # Référence : image entière envoyée en fragments de 1920 lignes (ancien print_image)
+        full_size = self.rows * self.full_width_bytes + 8 * ((self.rows + 1919) // 1920)
+        return {
+            'raster_bytes': self.bytes_out,
+            'raster_bytes_full': full_size,
+            'bands': self.bands,
+            'fed_rows': self.fed_rows,
+        }
+
+
+def iter_command_blocks(chunks: Iterable[bytes], size: int) -> Iterator[Tuple[bytes, int]]:
+    """
+    Découper un flux ESC/POS en blocs d'au plus size octets pour l'envoi série.
+    Retourne (bloc, octets d'image GS v 0 encore attendus par l'imprimante après ce bloc) :
+    un envoi interrompu doit compléter ces octets, sinon l'imprimante lit la suite (job suivant,
+    requêtes de statut) comme des points de l'image. Un en-tête GS v 0 n'est jamais coupé entre deux blocs.
+    """
+    pending = 0
+    for data in chunks:
+        pos, length = 0, len(data)
+        while pos < length:
+            end = min(pos + size, length)
+            cursor = pos
+            while cursor < end:
+                if pending:
+                    step = min(pending, end - cursor)
+                    pending -= step
+                    cursor += step
+                    continue
+                # En-têtes commençant avant la fin du bloc
+                header = data.find(RASTER_HEADER, cursor, end + len(RASTER_HEADER) - 1)
+                if header < 0:
+                    break
+                if header + RASTER_HEADER_LEN > end:
+                    if header > pos and header + RASTER_HEADER_LEN <= length:
+                        end = header  # en-tête à cheval : il ouvrira le bloc suivant
+                    break
+                width = data[header + 4] | (data[header + 5] << 8)
+                rows = data[header + 6] | (data[header + 7] << 8)
+                pending = width * rows
+                cursor = header + RASTER_HEADER_LEN
+            yield data[pos:end], pending
+            pos = end
+
+
+def encode_raster(bitmap: np.ndarray, high_density: bool = False, buffer_bytes: int = 4096,
+                  max_band_rows: int = 255) -> Tuple[bytes, dict]:
+    """Encoder une image 1 bit complète. Retourne (octets, statistiques)."""
+    encoder = RasterEncoder(bitmap.shape[1], high_density, buffer_bytes, max_band_rows)
+    payload = encoder.feed(bitmap) + encoder.finish()
+    return payload, encoder.stats()
+
+
+# === Graphiques résidents (GS ( L) ===
+# Un graphique chargé une fois dans la RAM de l'imprimante (« download graphics ») s'imprime
+# ensuite par sa clé de 2 caractères : 8 octets par impression au lieu du raster complet.
+# La RAM est perdue à l'extinction de l'imprimante : il faut alors le recharger.
+FN_GRAPHIC_KEYS = 80  # liste des clés définies
+FN_DELETE_GRAPHIC = 82
+FN_DEFINE_GRAPHIC = 83  # définition au format raster
+FN_PRINT_GRAPHIC = 85
+
+
+def _graphics_command(fn: int, params: bytes) -> bytes:
+    """GS ( L pL pH m fn ... (GS 8 L p1..p4 au-delà de 64 Ko)"""
+    body = bytes((48, fn)) + params
+    if len(body) <= 0xFFFF:
+        return GS + b'(L' + len(body).to_bytes(2, 'little') + body
+    return GS + b'8L' + len(body).to_bytes(4, 'little') + body
+
+
+def define_graphic(key: bytes, bitmap: np.ndarray) -> bytes:
+    """Charger un bitmap (booléen, True = noir) en RAM sous la clé donnée (2 octets, 32-126)"""
+    height, width = bitmap.shape
+    header = bytes((48,)) + key + bytes((1,)) + width.to_bytes(2, 'little') + height.to_bytes(2, 'little')
+    return _graphics_command(FN_DEFINE_GRAPHIC, header + bytes((49,)) + np.packbits(bitmap, axis=1).tobytes())
+
+
+def print_graphic(key: bytes, scale: int = 1) -> bytes:
+    """Imprimer un graphique résident (scale 2 : double largeur et hauteur, comme le raster basse densité)"""
+    return _graphics_command(FN_PRINT_GRAPHIC, key + bytes((scale, scale)))
+
+
+def delete_graphic(key: bytes) -> bytes:
+    return _graphics_command(FN_DELETE_GRAPHIC, key)
+
+
+GRAPHIC_KEY_LIST_QUERY = _graphics_command(FN_GRAPHIC_KEYS, b'KC')
+
+
+def parse_graphic_keys(response: bytes) -> Optional[Set[bytes]]:
+    """Réponse à GRAPHIC_KEY_LIST_QUERY : 37h, identifiant, statut, paires de clés, NUL. None si illisible."""
+    start = response.find(b'\x37')
+    if start < 0 or len(response) < start + 4 or not response.endswith(b'\x00'):
+        return None
+    keys = response[start + 3:-1]
+    return {keys[i:i + 2] for i in range(0, len(keys) - 1, 2)}
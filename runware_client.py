@@ -0,0 +1,276 @@
+import os
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+import httpx
+from runware import Runware
+
+logger = logging.getLogger(__name__)
+
+# Intervalle de vérification de la connexion (reconnexion avant le prochain effet)
+KEEPALIVE_SECONDS = 30.0
+# Durée maximale d'une inférence vue depuis Flask
+INFERENCE_TIMEOUT = 180.0
+# Vérification de la connexion pendant un appel (le SDK attendrait sinon sa propre expiration)
+CALL_CHECK_SECONDS = 1.0
+# Téléchargement des résultats (CDN Runware) : délais par opération, essais et taille des blocs écrits
+DOWNLOAD_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+DOWNLOAD_ATTEMPTS = 3
+DOWNLOAD_CHUNK = 64 * 1024
+
+
+def _is_connected(client) -> bool:
+    """État de la websocket selon la version du SDK Runware (True si on ne sait pas le lire)"""
+    for name in ('connected', 'isWebsocketReadyState'):
+        check = getattr(client, name, None)
+        if callable(check):
+            try:
+                return bool(check())
+            except Exception:
+                return False
+    ws = getattr(client, '_ws', None)
+    if ws is None:
+        return True
+    return not getattr(ws, 'closed', False)
+
+
+class RunwareClient:
+    """
+    Connexion Runware persistante, authentifiée une fois, sur une boucle asyncio dédiée.
+
+    Les handlers Flask (threads) soumettent leurs coroutines à cette boucle via run()/submit() :
+    plus de nouvelle boucle ni de poignée de main websocket à chaque appui sur « Effet ».
+    Une tâche de fond vérifie la connexion et la rétablit entre deux effets ; un appel
+    qui échoue sur une connexion perdue est rejoué une fois après reconnexion.
+    url : autre serveur que celui de Runware (ex: runware_mock.py pour les tests de charge).
+    """
+
+    def __init__(self, keepalive: float = KEEPALIVE_SECONDS, url: Optional[str] = None):
+        self.keepalive = keepalive
+        self.url = url
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self._client = None
+        self._api_key: Optional[str] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self.connects = 0
+        self.last_connect_ms: Optional[float] = None
+        self.last_inference_ms: Optional[float] = None
+        self.connected_at: Optional[float] = None
+
+    # --- Boucle dédiée ---
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='runware-loop', daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info("[RUNWARE] Boucle asyncio dédiée démarrée")
+
+    def _run_loop(self, ready: threading.Event):
+        asyncio.set_event_loop(self._loop)
+        self._connect_lock = asyncio.Lock()
+        self._keepalive_task = self._loop.create_task(self._keepalive())
+        ready.set()
+        self._loop.run_forever()
+
+    def submit(self, coro: Awaitable) -> Future:
+        """Exécuter une coroutine sur la boucle Runware (depuis n'importe quel thread)."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Awaitable, timeout: float = INFERENCE_TIMEOUT) -> Any:
+        """submit() puis attendre le résultat (handlers Flask)."""
+        return self.submit(coro).result(timeout)
+
+    def close(self):
+        if self._loop is None or not self._loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _shutdown(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        await self._disconnect()
+
+    # --- Connexion ---
+
+    async def connection(self, api_key: str):
+        """Client connecté pour cette clé (réutilisé, ou ouvert et chronométré)."""
+        async with self._connect_lock:
+            if self._client is not None and self._api_key == api_key and _is_connected(self._client):
+                return self._client
+            if self._client is not None:
+                reason = 'nouvelle clé API' if self._api_key != api_key else 'connexion perdue'
+                logger.info(f"[RUNWARE] Reconnexion ({reason})")
+                await self._disconnect()
+            started = time.perf_counter()
+            client = Runware(api_key=api_key, url=self.url) if self.url else Runware(api_key=api_key)
+            await client.connect()
+            self.last_connect_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._client, self._api_key = client, api_key
+            self.connects += 1
+            self.connected_at = time.time()
+            logger.info(f"[RUNWARE] Connecté et authentifié en {self.last_connect_ms} ms")
+            return client
+
+    async def _disconnect(self):
+        client, self._client = self._client, None
+        if client is None:
+            return
+        disconnect = getattr(client, 'disconnect', None)
+        try:
+            if callable(disconnect):
+                await disconnect()
+                return
+            # SDK sans disconnect() : arrêter sa reconnexion automatique et fermer la websocket
+            if hasattr(client, '_is_shutting_down'):
+                client._is_shutting_down = True
+            ws = getattr(client, '_ws', None)
+            if ws is not None:
+                await ws.close()
+        except Exception as e:
+            logger.info(f"[RUNWARE] Erreur à la déconnexion: {e}")
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive)
+            if self._client is None or self._api_key is None:
+                continue
+            if not _is_connected(self._client):
+                try:
+                    await self.connection(self._api_key)
+                except Exception as e:
+                    logger.info(f"[RUNWARE] Reconnexion impossible: {e}")
+
+    def warm_up(self, api_key: Optional[str]):
+        """Ouvrir la connexion à l'avance (démarrage, clé modifiée) sans attendre."""
+        if not api_key:
+            return
+        future = self.submit(self.connection(api_key))
+        future.add_done_callback(lambda f: f.exception() and
+                                 logger.info(f"[RUNWARE] Préconnexion impossible: {f.exception()}"))
+
+    # --- Appels ---
+
+    async def call(self, api_key: str, operation: Callable[[Any], Awaitable]) -> Tuple[Any, dict]:
+        """
+        operation(client) sur la connexion persistante.
+        Retourne (résultat, {'connect_ms', 'inference_ms', 'reused'}) : le temps de connexion
+        (0 si réutilisée) est mesuré à part du temps de l'appel lui-même.
+        """
+        connects_before = self.connects
+        started = time.perf_counter()
+        client = await self.connection(api_key)
+        connect_ms = round((time.perf_counter() - started) * 1000, 1)
+        reused = self.connects == connects_before
+        started = time.perf_counter()
+        try:
+            result = await self._watched(client, operation)
+        except Exception as e:
+            if not isinstance(e, ConnectionError) and _is_connected(client):
+                raise
+            # Connexion tombée pendant l'appel : une reconnexion, un nouvel essai
+            logger.info(f"[RUNWARE] Appel interrompu ({e}), nouvel essai après reconnexion")
+            client = await self.connection(api_key)
+            reused = False
+            started = time.perf_counter()
+            result = await self._watched(client, operation)
+        self.last_inference_ms = round((time.perf_counter() - started) * 1000, 1)
+        return result, {'connect_ms': connect_ms, 'inference_ms': self.last_inference_ms, 'reused': reused}
+
+    async def _watched(self, client, operation: Callable[[Any], Awaitable]) -> Any:
+        """operation(client), abandonnée si la websocket tombe en cours de route (réponse perdue)."""
+        task = asyncio.ensure_future(operation(client))
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=CALL_CHECK_SECONDS)
+            if done:
+                return task.result()
+            if not _is_connected(client):
+                task.cancel()
+                raise ConnectionError('connexion Runware perdue pendant l\'appel')
+
+    def image_inference(self, api_key: str, request, timeout: float = INFERENCE_TIMEOUT) -> Tuple[list, dict]:
+        """Inférence bloquante pour un handler Flask : (images, temps)."""
+        return self.run(self.call(api_key, lambda client: client.imageInference(requestImage=request)), timeout)
+
+    def upload_image(self, api_key: str, data_uri: str, timeout: float = INFERENCE_TIMEOUT) -> Tuple[Optional[str], dict]:
+        """Envoyer une image une fois chez Runware : (imageUUID réutilisable, temps) ; None si non supporté."""
+        async def upload(client):
+            upload_image = getattr(client, 'uploadImage', None)
+            if upload_image is None:
+                return None
+            uploaded = await upload_image(data_uri)
+            image_uuid = getattr(uploaded, 'imageUUID', None) if uploaded else None
+            # Certaines versions du SDK rendent la data URI telle quelle sans rien envoyer : pas d'UUID
+            return image_uuid if image_uuid != data_uri else None
+        return self.run(self.call(api_key, upload), timeout)
+
+    # --- Téléchargement des résultats ---
+
+    def http(self) -> httpx.AsyncClient:
+        """Client HTTP de la boucle : connexions au CDN gardées ouvertes d'un effet à l'autre."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT, follow_redirects=True,
+                                           limits=httpx.Limits(max_connections=8, max_keepalive_connections=4))
+        return self._http
+
+    async def download(self, url: str, folder: str) -> Tuple[str, dict]:
+        """
+        Télécharger url en flux vers un fichier temporaire de folder (jamais tout en mémoire).
+        Retourne (chemin temporaire, {'download_ms', 'download_bytes', 'download_attempts'}) ;
+        à l'appelant de le renommer à sa place définitive (os.replace, atomique).
+        Erreurs réseau et réponses 5xx : nouvel essai, jusqu'à DOWNLOAD_ATTEMPTS.
+        """
+        started = time.perf_counter()
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.effect_', suffix='.part')
+            size = 0
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    async with self.http().stream('GET', url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                            # Écriture hors de la boucle : une carte SD lente ne bloque pas les autres effets
+                            await asyncio.to_thread(f.write, chunk)
+                            size += len(chunk)
+                return tmp_path, {'download_ms': round((time.perf_counter() - started) * 1000, 1),
+                                  'download_bytes': size, 'download_attempts': attempt}
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                os.unlink(tmp_path)
+                client_error = isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500
+                if client_error or attempt == DOWNLOAD_ATTEMPTS:
+                    raise
+                logger.info(f"[RUNWARE] Téléchargement interrompu ({e}), essai {attempt + 1}/{DOWNLOAD_ATTEMPTS}")
+                await asyncio.sleep(0.5 * attempt)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def download_to(self, url: str, folder: str, timeout: float = INFERENCE_TIMEOUT) -> Tuple[str, dict]:
+        """download() bloquant pour un worker (thread)."""
+        return self.run(self.download(url, folder), timeout)
+
+    def stats(self) -> dict:
+        return {'connected': self._client is not None and _is_connected(self._client),
+                'connects': self.connects, 'last_connect_ms': self.last_connect_ms,
+                'last_inference_ms': self.last_inference_ms, 'connected_at': self.connected_at}
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Serveur Runware local (websocket + HTTP) pour tester et charger la chaîne des effets IA
+sans crédits ni connexion Internet.
+
+Parle le protocole utilisé par le SDK runware (Runware.connect(), uploadImage(),
+imageInference()) :
+- tâches JSON envoyées sur la websocket (en liste, ou {"newTask": ...} pour les inférences) :
+  authentication, ping, imageUpload, imageInference ; réponses {"data": [...]} ou {"errors": [...]} par taskUUID
+- images produites à partir de l'image de référence (imageUUID envoyé, data URI ou rien),
+  redimensionnées et stylisées avec Pillow, servies en HTTP sur le même port (/images/...)
+- latence d'inférence configurable (moyenne et variation), taux d'échec, coupures de
+  connexion, inférences simultanées limitées (les suivantes attendent, comme en production)
+  et limite de débit par minute (au-delà : erreur)
+
+Usage:
+  python3 runware_mock.py --port 8790 --latency 4 --jitter 0.3 --failure-rate 0.05
+  python3 runware_mock.py --max-concurrent 2 --rate-limit 30
+  (puis "runware_url": "ws://127.0.0.1:8790/v1" dans settings.json)
+"""
+
+import io
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import asyncio
+import logging
+import argparse
+import threading
+from collections import OrderedDict, deque
+from http import HTTPStatus
+from typing import Optional
+
+import websockets
+from PIL import Image, ImageDraw, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8790
+# Images envoyées ou produites gardées en mémoire (les plus anciennes sont oubliées)
+_MAX_IMAGES = 200
+_IMAGE_PATH = re.compile(r'^/images/([0-9a-f-]+)\.jpg$')
+
+
+def _decode_data_uri(value: str) -> Optional[bytes]:
+    if value.startswith('data:'):
+        value = value.split(',', 1)[-1]
+    try:
+        return base64.b64decode(value, validate=True)
+    except (ValueError, TypeError):
+        return None
+
+
+def render_effect(reference: Optional[bytes], prompt: str, width: int, height: int, seed: int) -> bytes:
+    """Fausse image d'effet : référence recadrée à la taille demandée, postérisée, prompt en bandeau"""
+    image = None
+    if reference:
+        try:
+            image = ImageOps.fit(Image.open(io.BytesIO(reference)).convert('RGB'), (width, height))
+        except OSError:
+            image = None
+    if image is None:
+        rng = random.Random(seed)
+        image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    image = ImageOps.posterize(image, 3)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, height - 40, width, height), fill=(0, 0, 0))
+    draw.text((12, height - 30), f"MOCK | {prompt[:120]}", fill=(255, 255, 255))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+class RunwareMock:
+    """Serveur Runware simulé : une boucle asyncio dans son propre thread (start/close ou with)"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT, latency: float = 3.0,
+                 jitter: float = 0.2, failure_rate: float = 0.0, disconnect_rate: float = 0.0,
+                 max_concurrent: int = 4, rate_limit: int = 0, download_latency: float = 0.0,
+                 api_key: Optional[str] = None, seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.latency = float(latency)  # secondes par inférence (moyenne)
+        self.jitter = float(jitter)  # variation relative de la latence (0.2 = ±20 %)
+        self.failure_rate = float(failure_rate)
+        self.disconnect_rate = float(disconnect_rate)  # websocket fermée au lieu de répondre
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.rate_limit = int(rate_limit)  # inférences acceptées par minute (0 = illimité)
+        self.download_latency = float(download_latency)
+        self.api_key = api_key  # None = toute clé acceptée
+        self._random = random.Random(seed)
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._accepted = deque()  # instants des inférences acceptées (limite de débit)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='runware-mock', daemon=True)
+        self.counters = {'connections': 0, 'authentications': 0, 'uploads': 0, 'inferences': 0,
+                         'images': 0, 'failures': 0, 'disconnects': 0, 'rate_limited': 0, 'downloads': 0}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+
+    @property
+    def url(self) -> str:
+        return f'ws://{self.host}:{self.port}/v1'
+
+    # --- Cycle de vie ---
+
+    def start(self) -> 'RunwareMock':
+        self._thread.start()
+        self._ready.wait()
+        logger.info(f"[RUNWARE-MOCK] Serveur sur {self.url} (latence {self.latency}s ±{self.jitter:.0%}, "
+                    f"échecs {self.failure_rate:.0%}, {self.max_concurrent} inférence(s) simultanée(s))")
+        return self
+
+    def close(self):
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join(timeout=5.0)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._serve())
+        # Fermetures de connexions encore en cours : terminées avant de fermer la boucle
+        pending = asyncio.all_tasks(self._loop)
+        if pending:
+            self._loop.run_until_complete(asyncio.wait(pending, timeout=2.0))
+        self._loop.close()
+
+    async def _serve(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._stopped = asyncio.Event()
+        async with websockets.serve(self._handle, self.host, self.port, max_size=None, close_timeout=1,
+                                    process_request=self._http) as server:
+            self._server = server
+            if not self.port:
+                self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._stopped.wait()
+
+    def stats(self) -> dict:
+        return dict(self.counters, in_flight=self.in_flight, max_in_flight=self.max_in_flight,
+                    waiting=self.waiting, max_waiting=self.max_waiting)
+
+    # --- HTTP : images produites (imageURL) ---
+
+    async def _http(self, path: str, headers):
+        match = _IMAGE_PATH.match(path)
+        if match is None:
+            return None  # poignée de main websocket
+        if self.download_latency:
+            await asyncio.sleep(self.download_latency)
+        data = self._images.get(match.group(1))
+        if data is None:
+            return HTTPStatus.NOT_FOUND, [('Content-Type', 'text/plain')], b'image inconnue\n'
+        self.counters['downloads'] += 1
+        return HTTPStatus.OK, [('Content-Type', 'image/jpeg')], data
+
+    def _store(self, data: bytes) -> str:
+        image_uuid = str(uuid.uuid4())
+        self._images[image_uuid] = data
+        while len(self._images) > _MAX_IMAGES:
+            self._images.popitem(last=False)
+        return image_uuid
+
+    def _image_url(self, image_uuid: str) -> str:
+        return f'http://{self.host}:{self.port}/images/{image_uuid}.jpg'
+
+    # --- Websocket ---
+
+    async def _handle(self, websocket, path=None):
+        self.counters['connections'] += 1
+        tasks = set()
+        try:
+            async for message in websocket:
+                try:
+                    payload = json.loads(message)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(payload, dict):
+                    payload = [payload.get('newTask', payload)]  # inférences : {"newTask": {...}}
+                for task in payload:
+                    # Chaque tâche à part : une inférence longue ne bloque ni ping ni envoi d'image
+                    running = asyncio.ensure_future(self._task(websocket, task))
+                    tasks.add(running)
+                    running.add_done_callback(tasks.discard)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for running in tasks:
+                running.cancel()
+
+    async def _send(self, websocket, key: str, items: list):
+        try:
+            await websocket.send(json.dumps({key: items}))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _task(self, websocket, task: dict):
+        task_type = task.get('taskType')
+        if task_type == 'authentication':
+            await self._authenticate(websocket, task)
+        elif task_type == 'ping':
+            await self._send(websocket, 'data', [{'taskType': 'ping', 'pong': True}])
+        elif task_type == 'imageUpload':
+            await self._upload(websocket, task)
+        elif task_type == 'imageInference':
+            await self._inference(websocket, task)
+        elif task_type:
+            await self._error(websocket, task, 'unsupportedTaskType', f"Tâche non simulée: {task_type}")
+
+    async def _error(self, websocket, task: dict, code: str, message: str):
+        await self._send(websocket, 'errors', [{'code': code, 'message': message, 'taskType': task.get('taskType'),
+                                                'taskUUID': task.get('taskUUID')}])
+
+    async def _authenticate(self, websocket, task: dict):
+        if self.api_key is not None and task.get('apiKey') != self.api_key:
+            await self._error(websocket, task, 'invalidApiKey', 'Clé API invalide')
+            return
+        self.counters['authentications'] += 1
+        session = task.get('connectionSessionUUID') or str(uuid.uuid4())
+        await self._send(websocket, 'data', [{'taskType': 'authentication', 'connectionSessionUUID': session}])
+
+    async def _upload(self, websocket, task: dict):
+        data = _decode_data_uri(task.get('image') or '')
+        if not data:
+            await self._error(websocket, task, 'invalidImage', 'Image illisible')
+            return
+        self.counters['uploads'] += 1
+        image_uuid = self._store(data)
+        await self._send(websocket, 'data', [{'taskType': 'imageUpload', 'taskUUID': task.get('taskUUID'),
+                                              'imageUUID': image_uuid, 'imageURL': self._image_url(image_uuid)}])
+
+    def _rate_limited(self) -> bool:
+        if self.rate_limit <= 0:
+            return False
+        now = time.monotonic()
+        while self._accepted and now - self._accepted[0] > 60:
+            self._accepted.popleft()
+        if len(self._accepted) >= self.rate_limit:
+            return True
+        self._accepted.append(now)
+        return False
+
+    def _reference(self, task: dict) -> Optional[bytes]:
+        references = task.get('referenceImages') or [task.get('seedImage')]
+        value = references[0] if references else None
+        if not value:
+            return None
+        return self._images.get(value) or _decode_data_uri(value)
+
+    async def _inference(self, websocket, task: dict):
+        self.counters['inferences'] += 1
+        if self._rate_limited():
+            self.counters['rate_limited'] += 1
+            await self._error(websocket, task, 'rateLimitExceeded', 'Trop de requêtes, réessayez plus tard')
+            return
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        async with self._semaphore:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+                await asyncio.sleep(max(0.0, delay))
+                roll = self._random.random()
+                if roll < self.disconnect_rate:
+                    self.counters['disconnects'] += 1
+                    logger.info(f"[RUNWARE-MOCK] Coupure simulée pendant {task.get('taskUUID')}")
+                    websocket.transport.abort()  # comme une coupure réseau : pas de trame de fermeture
+                    return
+                if roll < self.disconnect_rate + self.failure_rate:
+                    self.counters['failures'] += 1
+                    await self._error(websocket, task, 'mockFailure', 'Échec simulé de l\'inférence')
+                    return
+                width, height = int(task.get('width') or 1024), int(task.get('height') or 1024)
+                reference = self._reference(task)
+                results = []
+                for n in range(max(1, int(task.get('numberResults') or 1))):
+                    data = await asyncio.to_thread(render_effect, reference, task.get('positivePrompt', ''),
+                                                   width, height, self._random.randrange(1 << 30))
+                    image_uuid = self._store(data)
+                    results.append({'taskType': 'imageInference', 'taskUUID': task.get('taskUUID'),
+                                    'imageUUID': image_uuid, 'imageURL': self._image_url(image_uuid),
+                                    'seed': n, 'cost': 0})
+                self.counters['images'] += len(results)
+                await self._send(websocket, 'data', results)
+            finally:
+                self.in_flight -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serveur Runware simulé (websocket + HTTP)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', type=float, default=3.0, help='Durée moyenne d\'une inférence en s (défaut: 3)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Variation relative de la latence (défaut: 0.2)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Part des inférences en erreur (0-1)')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help='Part des inférences coupant la connexion')
+    parser.add_argument('--max-concurrent', type=int, default=4, help='Inférences simultanées (défaut: 4)')
+    parser.add_argument('--rate-limit', type=int, default=0, help='Inférences acceptées par minute (0 = illimité)')
+    parser.add_argument('--download-latency', type=float, default=0.0, help='Délai avant chaque image servie en s')
+    parser.add_argument('--api-key', help='Clé API attendue (par défaut : toutes acceptées)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    mock = RunwareMock(args.host, args.port, args.latency, args.jitter, args.failure_rate, args.disconnect_rate,
+                       args.max_concurrent, args.rate_limit, args.download_latency, args.api_key)
+    mock.start()
+    print(f"Runware simulé prêt : {mock.url} (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            time.sleep(10)
+            logger.info(f"[RUNWARE-MOCK] {mock.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Serveur Bot API Telegram local pour tester la file d'envoi (telegram_utils.TelegramOutbox)
+sans bot, sans groupe et sans connexion Internet.
+
+Répond aux méthodes utilisées par python-telegram-bot pour la borne :
+- getMe, sendPhoto (fichier envoyé ou file_id déjà connu), sendMediaGroup (album de 2 à 10 photos)
+- limite de débit par chat comme Telegram : au plus --group-rate envois par --window secondes dans un
+  groupe ou un canal, --private-rate dans un chat privé ; au-delà, 429 avec retry_after
+- latence par requête, débit montant simulé (--uplink-kbps : le temps d'envoi dépend de la taille des
+  photos) et taux d'erreurs 502
+- chat_id « nochat » : 400 « chat not found »
+
+Usage:
+  python3 telegram_mock.py --port 8791 --group-rate 20 --window 60
+  python3 telegram_mock.py --uplink-kbps 2000 --failure-rate 0.05
+  (puis "telegram_api_url": "http://127.0.0.1:8791/bot" dans settings.json)
+"""
+
+import json
+import math
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from collections import deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8791
+
+
+def parse_form(content_type: str, body: bytes) -> Tuple[Dict[str, str], Dict[str, bytes]]:
+    """Champs et fichiers d'une requête Bot API (multipart ou formulaire encodé)"""
+    if content_type.startswith('multipart/'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+        fields, files = {}, {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name is None:
+                continue
+            payload = part.get_payload(decode=True) or b''
+            if part.get_filename() is not None:
+                files[name] = payload
+            else:
+                fields[name] = payload.decode('utf-8')
+        return fields, files
+    if content_type.startswith('application/json'):
+        data = json.loads(body or b'{}')
+        return {k: v if isinstance(v, str) else json.dumps(v) for k, v in data.items()}, {}
+    return {k: v[-1] for k, v in parse_qs(body.decode('utf-8')).items()}, {}
+
+
+class TelegramMock:
+    """Bot API simulée : serveur HTTP dans son propre thread (start/close ou with)"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT, group_rate: int = 20,
+                 private_rate: int = 1, window: float = 60.0, latency: float = 0.1, uplink_kbps: float = 0.0,
+                 failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.group_rate = int(group_rate)  # envois par fenêtre dans un groupe/canal
+        self.private_rate = int(private_rate)  # envois par seconde dans un chat privé
+        self.window = float(window)
+        self.latency = float(latency)  # secondes par requête
+        self.uplink_kbps = float(uplink_kbps)  # 0 = envoi instantané
+        self.failure_rate = float(failure_rate)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sent: Dict[str, deque] = {}  # chat -> instants des envois acceptés
+        self._file_ids: Dict[str, int] = {}  # file_id -> taille de la photo reçue
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {'requests': 0, 'messages': 0, 'albums': 0, 'photos': 0, 'uploads': 0,
+                         'uploaded_bytes': 0, 'file_id_reuses': 0, 'rate_limited': 0, 'failures': 0}
+
+    @property
+    def url(self) -> str:
+        """Préfixe à donner à Bot(base_url=...) (le token est ajouté par le client)"""
+        return f'http://{self.host}:{self.port}/bot'
+
+    # --- Cycle de vie ---
+
+    def start(self) -> 'TelegramMock':
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, result = mock._request(self.path, self.headers.get('Content-Type', ''), body)
+                data = json.dumps(result).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='telegram-mock', daemon=True)
+        self._thread.start()
+        logger.info(f"[TELEGRAM-MOCK] Serveur sur {self.url} ({self.group_rate} envois/{self.window:.0f} s par "
+                    f"groupe, latence {self.latency}s, débit montant "
+                    f"{f'{self.uplink_kbps:.0f} kbit/s' if self.uplink_kbps else 'illimité'})")
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+    # --- Bot API ---
+
+    @staticmethod
+    def _error(status: int, description: str, **parameters) -> Tuple[int, dict]:
+        result = {'ok': False, 'error_code': status, 'description': description}
+        if parameters:
+            result['parameters'] = parameters
+        return status, result
+
+    def _throttle(self, chat_id: str) -> Optional[int]:
+        """retry_after (s) si le chat a épuisé son budget, sinon l'envoi est compté (verrou tenu)"""
+        private = chat_id.isdigit()
+        limit, window = (self.private_rate, 1.0) if private else (self.group_rate, self.window)
+        now = time.monotonic()
+        sent = self._sent.setdefault(chat_id, deque())
+        while sent and now - sent[0] >= window:
+            sent.popleft()
+        if limit > 0 and len(sent) >= limit:
+            return max(1, math.ceil(sent[0] + window - now))
+        sent.append(now)
+        return None
+
+    def _photo(self, media: str, files: Dict[str, bytes]) -> Optional[dict]:
+        """PhotoSize reçue : fichier joint (attach://nom ou champ photo) ou file_id déjà envoyé"""
+        if media in files or media.startswith('attach://'):
+            data = files.get(media[len('attach://'):] if media.startswith('attach://') else media)
+            if data is None:
+                return None
+            file_id = f'mock-{uuid.uuid4().hex}'
+            self._file_ids[file_id] = len(data)
+            self.counters['uploads'] += 1
+            return {'file_id': file_id, 'file_unique_id': file_id[-16:], 'width': 1280, 'height': 960,
+                    'file_size': len(data)}
+        if media in self._file_ids:
+            self.counters['file_id_reuses'] += 1
+            return {'file_id': media, 'file_unique_id': media[-16:], 'width': 1280, 'height': 960,
+                    'file_size': self._file_ids[media]}
+        return None
+
+    def _message(self, chat_id: str, photo: dict, caption: Optional[str], group_id: Optional[str] = None) -> dict:
+        self.counters['messages'] += 1
+        self.counters['photos'] += 1
+        message = {'message_id': self.counters['messages'], 'date': int(time.time()),
+                   'chat': {'id': int(chat_id) if chat_id.lstrip('-').isdigit() else -1,
+                            'type': 'private' if chat_id.isdigit() else 'supergroup', 'title': 'mock'},
+                   'photo': [photo]}
+        if caption:
+            message['caption'] = caption
+        if group_id:
+            message['media_group_id'] = group_id
+        return message
+
+    def _request(self, path: str, content_type: str, body: bytes) -> Tuple[int, dict]:
+        method = path.rstrip('/').rsplit('/', 1)[-1]
+        fields, files = parse_form(content_type, body)
+        delay = self.latency
+        if self.uplink_kbps > 0:
+            delay += len(body) * 8 / (self.uplink_kbps * 1000)
+        time.sleep(delay)
+        with self._lock:
+            self.counters['requests'] += 1
+            self.counters['uploaded_bytes'] += sum(len(data) for data in files.values())
+            if method == 'getMe':
+                return 200, {'ok': True, 'result': {'id': 4242, 'is_bot': True, 'first_name': 'Booth',
+                                                    'username': 'booth_mock_bot'}}
+            if method not in ('sendPhoto', 'sendMediaGroup'):
+                return self._error(404, 'Not Found: method not found')
+            chat_id = fields.get('chat_id', '')
+            if self._random.random() < self.failure_rate:
+                self.counters['failures'] += 1
+                return self._error(502, 'Bad Gateway')
+            if chat_id.lstrip('@') == 'nochat' or not chat_id:
+                return self._error(400, 'Bad Request: chat not found')
+            retry_after = self._throttle(chat_id)
+            if retry_after is not None:
+                self.counters['rate_limited'] += 1
+                return self._error(429, f'Too Many Requests: retry after {retry_after}', retry_after=retry_after)
+            if method == 'sendPhoto':
+                photo = self._photo(fields.get('photo', 'photo'), files)
+                if photo is None:
+                    return self._error(400, 'Bad Request: wrong file identifier/HTTP URL specified')
+                return 200, {'ok': True, 'result': self._message(chat_id, photo, fields.get('caption'))}
+            media = json.loads(fields.get('media', '[]'))
+            if not 2 <= len(media) <= 10:
+                return self._error(400, 'Bad Request: wrong number of media in the album')
+            photos = [self._photo(item.get('media', ''), files) for item in media]
+            if None in photos:
+                return self._error(400, 'Bad Request: wrong file identifier/HTTP URL specified')
+            self.counters['albums'] += 1
+            group_id = uuid.uuid4().hex[:12]
+            return 200, {'ok': True, 'result': [self._message(chat_id, photo, item.get('caption'), group_id)
+                                                for item, photo in zip(media, photos)]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bot API Telegram simulée')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--group-rate', type=int, default=20, help='Envois par fenêtre dans un groupe (défaut: 20)')
+    parser.add_argument('--private-rate', type=int, default=1, help='Envois par seconde en privé (défaut: 1)')
+    parser.add_argument('--window', type=float, default=60.0, help='Fenêtre de la limite de groupe en s')
+    parser.add_argument('--latency', type=float, default=0.1, help='Délai par requête en s (défaut: 0.1)')
+    parser.add_argument('--uplink-kbps', type=float, default=0.0, help='Débit montant simulé (0 = illimité)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Part des envois en erreur 502 (0-1)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    mock = TelegramMock(args.host, args.port, args.group_rate, args.private_rate, args.window, args.latency,
+                        args.uplink_kbps, args.failure_rate)
+    mock.start()
+    print(f"Telegram simulé prêt : {mock.url} (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            time.sleep(10)
+            logger.info(f"[TELEGRAM-MOCK] {mock.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,573 @@
+import io
+import os
+import json
+import time
+import uuid
+import random
 import asyncio
 import logging
-from telegram import Bot
-from telegram.error import TelegramError
+import threading
+import statistics
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+from telegram import Bot, InputFile, InputMediaPhoto, Message
+from telegram.error import BadRequest, ChatMigrated, Forbidden, InvalidToken, RetryAfter
+from telegram.request import HTTPXRequest
 
 logger = logging.getLogger(__name__)
 
-async def _send_telegram_photo(bot_token, chat_id, photo_path, caption):
-    bot = Bot(token=bot_token)
-    cleaned_chat_id = chat_id.strip()
-    if cleaned_chat_id and cleaned_chat_id[0].isalpha() and not cleaned_chat_id.startswith('@'):
-        cleaned_chat_id = '@' + cleaned_chat_id
-    logger.info(f"[TELEGRAM] Utilisation de l'ID de chat: '{cleaned_chat_id}'")
-    try:
-        with open(photo_path, 'rb') as photo_file:
-            await bot.send_photo(chat_id=cleaned_chat_id, photo=photo_file, caption=caption)
-    except Exception as e:
-        if "chat not found" in str(e).lower():
-            logger.info(f"[TELEGRAM] ERREUR: Chat introuvable avec l'ID '{cleaned_chat_id}'")
-            logger.info("[TELEGRAM] Assurez-vous que:")
-            logger.info("   - Le bot a été ajouté au groupe/canal")
-            logger.info("   - Pour un groupe: l'ID commence par '-' (ex: -123456789)")
-            logger.info("   - Pour un canal: utilisez '@nom_du_canal' ou ajoutez le bot comme admin")
-            logger.info("   - Pour un chat privé: utilisez l'ID numérique de l'utilisateur")
-        raise
-
-def send_to_telegram(photo_path, config, photo_type="photo"):
-    if not config.get('telegram_enabled', False):
-        return
-    bot_token = config.get('telegram_bot_token', '')
-    chat_id = config.get('telegram_chat_id', '')
-    if not bot_token or not chat_id:
-        logger.info("[TELEGRAM] Configuration incomplète (token ou chat_id manquant)")
-        return
-    try:
-        logger.info(f"[TELEGRAM] Envoi de {photo_path} vers le chat {chat_id}")
-        caption = "📸 Nouvelle photo du photobooth!"
-        if photo_type == "effet":
-            caption = "🎨 Photo avec effet IA du photobooth!"
-        async def send_photo_async():
+OUTBOX_QUEUED = 'queued'
+OUTBOX_SENDING = 'sending'
+OUTBOX_SENT = 'sent'
+OUTBOX_FAILED = 'failed'
+
+CAPTIONS = {'photo': "📸 Nouvelle photo du photobooth!",
+            'effet': "🎨 Photo avec effet IA du photobooth!"}
+ALBUM_CAPTIONS = {'photo': "📸 Nouvelles photos du photobooth!",
+                  'effet': "🎨 Photos avec effet IA du photobooth!"}
+
+# Limites d'envoi Telegram par chat (envois, fenêtre en s) : environ 20 par minute dans un groupe ou un canal,
+# 1 par seconde dans un chat privé. Un album (sendMediaGroup) compte pour un envoi ; un 429 reste possible
+# (autres bots, limites globales) et son retry_after est alors respecté pour tout le chat.
+GROUP_RATE = (20, 60.0)
+PRIVATE_RATE = (1, 1.0)
+# Photos en attente pour un même chat regroupées en un album (limite Telegram : 10)
+ALBUM_MAX = 10
+
+# Nouvel essai après une erreur réseau : attente doublée à chaque échec (avec aléa), plafonnée
+RETRY_BASE_S = 5.0
+RETRY_MAX_S = 600.0
+MAX_ATTEMPTS = 10
+# Telegram désactivé ou token/chat manquant : envois gardés en file, configuration relue périodiquement
+CONFIG_WAIT_S = 30.0
+# Délais HTTP de la session du bot (l'envoi d'une photo 12 Mpx sur une connexion lente prend du temps)
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 30.0
+UPLOAD_TIMEOUT = 120.0
+# Telegram réduit les photos envoyées par un bot à 1280 px de grand côté et les recompresse :
+# envoyer plus grand ne fait qu'allonger l'envoi
+TELEGRAM_PHOTO_SIDE = 1280
+TELEGRAM_PHOTO_QUALITY = 87
+# file_id des photos déjà reçues par Telegram (renvoi vers un autre chat ou nouvel essai sans upload)
+_MAX_FILE_IDS = 500
+# Envois terminés (envoyés ou abandonnés) gardés dans le fichier pour le statut par photo
+_MAX_FINISHED = 200
+# Délais de livraison (ajout à la file -> reçu par Telegram) gardés pour les percentiles
+_LATENCY_SAMPLES = 200
+
+
+def clean_chat_id(chat_id) -> str:
+    """ID de chat tel qu'attendu par l'API (nom de canal sans @ complété)"""
+    cleaned = str(chat_id).strip()
+    if cleaned and cleaned[0].isalpha() and not cleaned.startswith('@'):
+        cleaned = '@' + cleaned
+    return cleaned
+
+
+def chat_ids(value) -> List[str]:
+    """Chats de destination de telegram_chat_id (plusieurs IDs séparés par des virgules)"""
+    return list(dict.fromkeys(clean_chat_id(chat) for chat in str(value or '').split(',') if chat.strip()))
+
+
+def prepare_photo(photo_path: str, max_side: int = TELEGRAM_PHOTO_SIDE,
+                  quality: int = TELEGRAM_PHOTO_QUALITY) -> bytes:
+    """
+    Photo à envoyer : réduite à la résolution gardée par Telegram et réencodée en JPEG ; l'original est
+    envoyé tel quel s'il est déjà à cette taille et plus léger.
+    """
+    with open(photo_path, 'rb') as f:
+        original = f.read()
+    with Image.open(io.BytesIO(original)) as img:
+        is_jpeg = img.format == 'JPEG'
+        # draft() laisse le décodeur JPEG réduire directement (beaucoup plus rapide sur Pi)
+        img.draft('RGB', (max_side, max_side))
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        small_enough = max(img.size) <= max_side
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=quality, optimize=True)
+    encoded = buffer.getvalue()
+    if is_jpeg and small_enough and len(original) <= len(encoded):
+        return original
+    return encoded
+
+
+def retry_delay(attempts: int, rng: random.Random = random) -> float:
+    """Attente avant l'essai suivant : moitié fixe, moitié aléatoire (bornes relancées sans synchronisation)"""
+    delay = min(RETRY_MAX_S, RETRY_BASE_S * 2 ** max(attempts - 1, 0))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+def album_caption(entries: List[dict]) -> str:
+    types = {e['type'] for e in entries}
+    return ALBUM_CAPTIONS['effet'] if types == {'effet'} else ALBUM_CAPTIONS['photo']
+
+
+def percentiles(values) -> Optional[dict]:
+    values = sorted(values)
+    if not values:
+        return None
+    if len(values) == 1:
+        return {f'p{p}': round(values[0], 2) for p in (50, 90, 95, 99)}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {f'p{p}': round(cuts[p - 1], 2) for p in (50, 90, 95, 99)}
+
+
+def _log_chat_not_found(chat_id: str):
+    logger.info(f"[TELEGRAM] ERREUR: Chat introuvable avec l'ID '{chat_id}'")
+    logger.info("[TELEGRAM] Assurez-vous que:")
+    logger.info("   - Le bot a été ajouté au groupe/canal")
+    logger.info("   - Pour un groupe: l'ID commence par '-' (ex: -123456789)")
+    logger.info("   - Pour un canal: utilisez '@nom_du_canal' ou ajoutez le bot comme admin")
+    logger.info("   - Pour un chat privé: utilisez l'ID numérique de l'utilisateur")
+
+
+class ChatRateLimiter:
+    """
+    Budget d'envoi de chaque chat (fenêtre glissante) et blocage après un 429 (retry_after) :
+    le worker attend son tour au lieu de se faire refuser ses envois.
+    """
+
+    def __init__(self, group_rate: Tuple[int, float] = GROUP_RATE, private_rate: Tuple[int, float] = PRIVATE_RATE):
+        self.group_rate = group_rate
+        self.private_rate = private_rate
+        self._sent: Dict[str, deque] = {}
+        self._blocked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _rate(self, chat_id: str) -> Tuple[int, float]:
+        # ID numérique positif : chat privé ; négatif ou @nom : groupe ou canal
+        return self.private_rate if chat_id.isdigit() else self.group_rate
+
+    def wait_time(self, chat_id: str, now: Optional[float] = None) -> float:
+        """Secondes avant le prochain envoi autorisé vers ce chat (0 : tout de suite)."""
+        now = time.time() if now is None else now
+        limit, window = self._rate(chat_id)
+        with self._lock:
+            wait = self._blocked_until.get(chat_id, 0.0) - now
+            sent = self._sent.get(chat_id)
+            if sent:
+                while sent and sent[0] <= now - window:
+                    sent.popleft()
+                if len(sent) >= limit:
+                    wait = max(wait, sent[0] + window - now)
+        return max(wait, 0.0)
+
+    def record(self, chat_id: str):
+        with self._lock:
+            self._sent.setdefault(chat_id, deque()).append(time.time())
+
+    def block(self, chat_id: str, seconds: float):
+        with self._lock:
+            self._blocked_until[chat_id] = max(self._blocked_until.get(chat_id, 0.0), time.time() + seconds)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            chats = list(self._sent)
+        return {chat: {'limit': self._rate(chat)[0], 'window_s': self._rate(chat)[1],
+                       'wait_s': round(self.wait_time(chat), 1)} for chat in chats}
+
+
+class TelegramOutbox:
+    """
+    Envois Telegram en arrière-plan, dans une file gardée sur disque (path, écriture atomique) :
+    un envoi en attente ou interrompu par un arrêt de l'application est repris au démarrage suivant.
+
+    Un seul worker, une seule boucle asyncio et un seul Bot (session HTTP réutilisée) quel que soit
+    le nombre de captures : une rafale de photos s'ajoute à la file au lieu de lancer un thread chacune.
+    Erreur réseau : nouvel essai après retry_delay() (au plus MAX_ATTEMPTS) ; limite de débit
+    Telegram : attente du retry_after indiqué ; chat introuvable, token refusé : abandon immédiat.
+    Un envoi expiré mais reçu par Telegram peut être refait (au moins une fois, jamais perdu).
+
+    Débit : limiter (ChatRateLimiter) donne le budget de chaque chat ; quand il est épuisé, le worker attend et
+    les photos arrivées entre-temps partent ensemble en album (sendMediaGroup, ALBUM_MAX photos au plus).
+
+    config() : configuration courante (telegram_enabled, telegram_bot_token, telegram_chat_id), relue
+    à chaque envoi. notify(payload) reçoit chaque changement de statut (ex: SSE /events).
+    api_url : autre serveur que l'API Telegram (ex: telegram_mock.py, « http://127.0.0.1:8791/bot »).
+    """
+
+    def __init__(self, path: str, config: Callable[[], dict], notify: Optional[Callable[[dict], None]] = None,
+                 max_pending: int = 500, api_url: Optional[str] = None,
+                 limiter: Optional[ChatRateLimiter] = None):
+        self.path = path
+        self.api_url = api_url
+        self.limiter = limiter or ChatRateLimiter()
+        self._config = config
+        self._notify = notify or (lambda payload: None)
+        self.max_pending = max_pending
+        self._entries: List[dict] = []
+        # « id du bot|chemin|taille|mtime » -> file_id (un file_id n'est valable que pour le bot qui l'a reçu)
+        self._file_ids: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._bot: Optional[Bot] = None
+        self._bot_token: Optional[str] = None
+        self._rng = random.Random()
+        # throttled : 429 reçus ; throttle_waits : attentes du budget d'un chat (sans 429)
+        self.stats_counters = {'sent': 0, 'failed': 0, 'retries': 0, 'throttled': 0, 'throttle_waits': 0,
+                               'albums': 0}
+        # Débit montant : octets des photos envoyées (après réduction) et photos renvoyées par file_id
+        self.upload_stats = {'uploads': 0, 'original_bytes': 0, 'uploaded_bytes': 0, 'file_id_reuses': 0}
+        self._latencies: "deque[float]" = deque(maxlen=_LATENCY_SAMPLES)
+        self._throttling = False
+        self._load()
+
+    # --- Persistance ---
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if isinstance(data, list):  # ancien format : liste des envois seule
+            data = {'entries': data}
+        self._entries = [entry for entry in data.get('entries', []) if isinstance(entry, dict) and entry.get('id')]
+        self._file_ids = OrderedDict(data.get('file_ids', {}))
+        resumed = 0
+        for entry in self._entries:
+            # Interrompu pendant l'envoi (arrêt, coupure) : à refaire
+            if entry.get('status') == OUTBOX_SENDING:
+                entry['status'] = OUTBOX_QUEUED
+            if entry.get('status') == OUTBOX_QUEUED:
+                resumed += 1
+        if resumed:
+            logger.info(f"[TELEGRAM] {resumed} envoi(s) en attente repris depuis {self.path}")
+
+    def _save(self):
+        """Écriture atomique de la file (verrou tenu)."""
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': self._entries, 'file_ids': self._file_ids}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.info(f"[TELEGRAM] File d'envoi non sauvegardée: {e}")
+
+    def _prune(self):
+        finished = [e for e in self._entries if e['status'] in (OUTBOX_SENT, OUTBOX_FAILED)]
+        if len(finished) > _MAX_FINISHED:
+            drop = {e['id'] for e in finished[:len(finished) - _MAX_FINISHED]}
+            self._entries = [e for e in self._entries if e['id'] not in drop]
+
+    # --- Cycle de vie ---
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='telegram-outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # --- API ---
+
+    def enqueue(self, photo_path: str, photo_type: str = 'photo') -> List[dict]:
+        """
+        Ajouter une photo à envoyer, un envoi par chat de telegram_chat_id (aucun si Telegram est désactivé,
+        incomplet ou la file pleine).
+        """
+        config = self._config()
+        if not config.get('telegram_enabled', False):
+            return []
+        chats = chat_ids(config.get('telegram_chat_id', ''))
+        if not config.get('telegram_bot_token', '') or not chats:
+            logger.info("[TELEGRAM] Configuration incomplète (token ou chat_id manquant)")
+            return []
+        created_at = time.time()
+        entries = [{'id': uuid.uuid4().hex[:12], 'path': os.path.abspath(photo_path),
+                    'filename': os.path.basename(photo_path), 'type': photo_type,
+                    'caption': CAPTIONS.get(photo_type, CAPTIONS['photo']), 'chat_id': chat,
+                    'status': OUTBOX_QUEUED, 'attempts': 0, 'created_at': created_at, 'next_attempt_at': 0.0,
+                    'sent_at': None, 'error': None, 'file_id': None, 'uploaded_bytes': 0}
+                   for chat in chats]
+        with self._wakeup:
+            if sum(1 for e in self._entries if e['status'] == OUTBOX_QUEUED) + len(entries) > self.max_pending:
+                logger.info(f"[TELEGRAM] File d'envoi pleine, {entries[0]['filename']} ignorée")
+                return []
+            self._entries.extend(entries)
+            self._save()
+            self._wakeup.notify_all()
+        logger.info(f"[TELEGRAM] {entries[0]['filename']} ajoutée à la file d'envoi vers {', '.join(chats)}")
+        for entry in entries:
+            self._publish(entry)
+        return [dict(entry) for entry in entries]
+
+    def retry(self, entry_id: str) -> bool:
+        """Relancer un envoi abandonné (ex: après correction du chat_id)."""
+        with self._wakeup:
+            entry = next((e for e in self._entries if e['id'] == entry_id), None)
+            if entry is None or entry['status'] != OUTBOX_FAILED:
+                return False
+            chats = chat_ids(self._config().get('telegram_chat_id', ''))
+            if len(chats) == 1 and entry['chat_id'] not in chats:
+                entry['chat_id'] = chats[0]
+            entry.update(status=OUTBOX_QUEUED, attempts=0, next_attempt_at=0.0, error=None)
+            self._save()
+            self._wakeup.notify_all()
+        self._publish(entry)
+        return True
+
+    def status(self, filename: str) -> List[dict]:
+        """Envois d'une photo (statut, essais, dernière erreur)."""
+        with self._lock:
+            return [dict(e) for e in self._entries if e['filename'] == filename]
+
+    def list_entries(self) -> List[dict]:
+        with self._lock:
+            return [dict(e) for e in self._entries]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {status: 0 for status in (OUTBOX_QUEUED, OUTBOX_SENDING, OUTBOX_SENT, OUTBOX_FAILED)}
+            for entry in self._entries:
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+            latencies = list(self._latencies)
+            upload = dict(self.upload_stats, file_ids=len(self._file_ids))
+        sent = self.stats_counters['sent']
+        upload['bytes_per_photo'] = round(upload['uploaded_bytes'] / sent) if sent else None
+        return {'pending': counts[OUTBOX_QUEUED], 'sending': counts[OUTBOX_SENDING], **self.stats_counters,
+                'latency_s': percentiles(latencies), 'chats': self.limiter.to_dict(), 'upload': upload}
+
+
+    # --- Worker ---
+
+    def _publish(self, entry: dict):
+        try:
+            self._notify({'event': 'telegram_delivery', 'delivery': dict(entry)})
+        except Exception as e:
+            logger.info(f"[TELEGRAM] Notification impossible: {e}")
+
+    def _next_batch(self) -> List[dict]:
+        """
+        Prochain envoi prêt (heure d'essai venue et budget du chat disponible), avec les autres photos en attente
+        pour le même chat regroupées en album (ALBUM_MAX au plus) ; attend sinon. Entrées marquées en cours.
+        """
+        with self._wakeup:
+            while not self._stop.is_set():
+                now = time.time()
+                queued = sorted((e for e in self._entries if e['status'] == OUTBOX_QUEUED),
+                                key=lambda e: e['created_at'])
+                if not queued:
+                    self._wakeup.wait()
+                    continue
+                chat_waits = {chat: self.limiter.wait_time(chat, now) for chat in {e['chat_id'] for e in queued}}
+                entry = min(queued, key=lambda e: max(e['next_attempt_at'] - now, chat_waits[e['chat_id']]))
+                retry_wait = entry['next_attempt_at'] - now
+                wait = max(retry_wait, chat_waits[entry['chat_id']])
+                if wait > 0:
+                    if chat_waits[entry['chat_id']] > max(retry_wait, 0) and not self._throttling:
+                        # Budget du chat épuisé : les photos s'accumulent et partiront en album
+                        self._throttling = True
+                        self.stats_counters['throttle_waits'] += 1
+                        logger.info(f"[TELEGRAM] Budget d'envoi du chat {entry['chat_id']} épuisé, "
+                                    f"attente de {wait:.0f} s")
+                    self._wakeup.wait(wait)
+                    continue
+                self._throttling = False
+                batch = [entry]
+                if not entry.get('solo'):
+                    batch += [e for e in queued if e is not entry and e['chat_id'] == entry['chat_id']
+                              and not e.get('solo') and e['next_attempt_at'] <= now][:ALBUM_MAX - 1]
+                batch.sort(key=lambda e: e['created_at'])
+                for e in batch:
+                    e['status'] = OUTBOX_SENDING
+                self._save()
+                return batch
+        return []
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while True:
+                batch = self._next_batch()
+                if not batch:
+                    break
+                loop.run_until_complete(self._attempt(batch))
+        finally:
+            loop.run_until_complete(self._close_bot())
+            loop.close()
+
+    async def _get_bot(self, token: str) -> Bot:
+        """Bot et session HTTP partagés, recréés seulement si le token change."""
+        if self._bot is not None and self._bot_token == token:
+            return self._bot
+        await self._close_bot()
+        request = HTTPXRequest(connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, write_timeout=UPLOAD_TIMEOUT)
+        bot = Bot(token=token, base_url=self.api_url, request=request) if self.api_url else \
+            Bot(token=token, request=request)
+        await bot.initialize()
+        self._bot, self._bot_token = bot, token
+        logger.info(f"[TELEGRAM] Bot @{bot.username} prêt (session HTTP partagée)")
+        return bot
+
+    async def _close_bot(self):
+        bot, self._bot, self._bot_token = self._bot, None, None
+        if bot is not None:
             try:
-                await _send_telegram_photo(bot_token, chat_id, photo_path, caption)
-                logger.info("[TELEGRAM] Photo envoyée avec succès!")
-            except Exception as e:
-                logger.info(f"[TELEGRAM] Erreur dans la coroutine: {e}")
-        asyncio.run(send_photo_async())
-    except TelegramError as e:
-        logger.info(f"[TELEGRAM] Erreur Telegram: {e}")
-    except Exception as e:
-        logger.info(f"[TELEGRAM] Erreur lors de l'envoi: {e}")
+                await bot.shutdown()
+            except Exception:
+                pass
+
+    def _update(self, entries: List[dict], **changes):
+        with self._wakeup:
+            for entry in entries:
+                entry.update(changes)
+            self._prune()
+            self._save()
+        for entry in entries:
+            self._publish(entry)
+
+    @staticmethod
+    def _file_key(entry: dict, token: str) -> str:
+        try:
+            stat = os.stat(entry['path'])
+        except OSError:
+            return ''
+        return f"{token.split(':', 1)[0]}|{entry['path']}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def _known_file_id(self, key: str) -> Optional[str]:
+        with self._lock:
+            file_id = self._file_ids.get(key)
+            if file_id is not None:
+                self._file_ids.move_to_end(key)
+            return file_id
+
+    def _remember_file_id(self, key: str, file_id: Optional[str]):
+        if not key or not file_id:
+            return
+        with self._lock:
+            self._file_ids[key] = file_id
+            self._file_ids.move_to_end(key)
+            while len(self._file_ids) > _MAX_FILE_IDS:
+                self._file_ids.popitem(last=False)
+
+    def _forget_file_ids(self, keys: List[str]):
+        with self._lock:
+            for key in keys:
+                self._file_ids.pop(key, None)
+
+    def _payload(self, entry: dict) -> InputFile:
+        """Photo réduite à envoyer, octets comptés (débit montant)"""
+        data = prepare_photo(entry['path'])
+        entry['uploaded_bytes'] = entry.get('uploaded_bytes', 0) + len(data)
+        with self._lock:
+            self.upload_stats['uploads'] += 1
+            self.upload_stats['original_bytes'] += os.path.getsize(entry['path'])
+            self.upload_stats['uploaded_bytes'] += len(data)
+        return InputFile(data, filename=entry['filename'], attach=True)
+
+    async def _send(self, bot: Bot, chat_id: str, batch: List[dict], reused: List[Optional[str]]) -> List[Message]:
+        """
+        Une photo seule (sendPhoto) ou un album (sendMediaGroup), légende sur la première photo.
+        Une photo déjà reçue par Telegram (file_id dans reused) est renvoyée sans upload.
+        """
+        media = [file_id or self._payload(entry) for entry, file_id in zip(batch, reused)]
+        if len(batch) == 1:
+            return [await bot.send_photo(chat_id=chat_id, photo=media[0], caption=batch[0]['caption'],
+                                         write_timeout=UPLOAD_TIMEOUT)]
+        return list(await bot.send_media_group(chat_id=chat_id, media=[InputMediaPhoto(m) for m in media],
+                                               caption=album_caption(batch), write_timeout=UPLOAD_TIMEOUT))
 
+    async def _attempt(self, batch: List[dict]):
+        config = self._config()
+        token = config.get('telegram_bot_token', '')
+        if not config.get('telegram_enabled', False) or not token:
+            # Envois gardés pour quand Telegram sera réactivé
+            self._update(batch, status=OUTBOX_QUEUED, next_attempt_at=time.time() + CONFIG_WAIT_S)
+            return
+        missing = [e for e in batch if not os.path.exists(e['path'])]
+        if missing:
+            self.stats_counters['failed'] += len(missing)
+            self._update(missing, status=OUTBOX_FAILED, error='Fichier introuvable')
+            logger.info(f"[TELEGRAM] {', '.join(e['filename'] for e in missing)} supprimée(s) avant l'envoi, abandon")
+            batch = [e for e in batch if e not in missing]
+            if not batch:
+                return
+        chat_id = batch[0]['chat_id']
+        names = ', '.join(e['filename'] for e in batch)
+        keys = [self._file_key(entry, token) for entry in batch]
+        reused = [None if entry.get('upload') else self._known_file_id(key) for entry, key in zip(batch, keys)]
+        try:
+            bot = await self._get_bot(token)
+            self.limiter.record(chat_id)
+            messages = await self._send(bot, chat_id, batch, reused)
+        except RetryAfter as e:
+            retry_after = float(e.retry_after)
+            self.limiter.block(chat_id, retry_after)
+            self.stats_counters['throttled'] += 1
+            logger.info(f"[TELEGRAM] Limite de débit atteinte (429), nouvel essai dans {retry_after:.0f} s")
+            self._update(batch, status=OUTBOX_QUEUED, next_attempt_at=time.time() + retry_after,
+                         error=f'Limite de débit ({retry_after:.0f} s)')
+        except ChatMigrated as e:
+            logger.info(f"[TELEGRAM] Le groupe est devenu un supergroupe: utilisez l'ID {e.new_chat_id}")
+            self._update(batch, status=OUTBOX_QUEUED, chat_id=str(e.new_chat_id), next_attempt_at=0.0)
+        except (BadRequest, Forbidden, InvalidToken) as e:
+            if isinstance(e, InvalidToken):
+                await self._close_bot()
+            chat_not_found = "chat not found" in str(e).lower()
+            if isinstance(e, BadRequest) and any(reused) and 'file' in str(e).lower():
+                # file_id refusé (fichier expiré côté Telegram) : photo renvoyée en entier
+                logger.info(f"[TELEGRAM] file_id refusé ({e}), nouvel envoi de {names} avec upload")
+                self._forget_file_ids([key for key, file_id in zip(keys, reused) if file_id])
+                self._update(batch, status=OUTBOX_QUEUED, upload=True)
+                return
+            if len(batch) > 1 and isinstance(e, BadRequest) and not chat_not_found:
+                # Une photo de l'album peut être en cause : chacune renvoyée seule
+                logger.info(f"[TELEGRAM] Album refusé ({e}), photos renvoyées une par une")
+                self._update(batch, status=OUTBOX_QUEUED, solo=True)
+                return
+            if chat_not_found:
+                _log_chat_not_found(chat_id)
+            self.stats_counters['failed'] += len(batch)
+            logger.info(f"[TELEGRAM] Envoi de {names} refusé: {e}")
+            for entry in batch:
+                entry['attempts'] += 1
+            self._update(batch, status=OUTBOX_FAILED, error=str(e))
+        except Exception as e:
+            for entry in batch:
+                entry['attempts'] += 1
+            abandoned = [entry for entry in batch if entry['attempts'] >= MAX_ATTEMPTS]
+            if abandoned:
+                self.stats_counters['failed'] += len(abandoned)
+                logger.info(f"[TELEGRAM] Envoi de {', '.join(x['filename'] for x in abandoned)} abandonné "
+                            f"après {MAX_ATTEMPTS} essais: {e}")
+                self._update(abandoned, status=OUTBOX_FAILED, error=str(e))
+            retried = [entry for entry in batch if entry not in abandoned]
+            if retried:
+                self.stats_counters['retries'] += 1
+                attempts = max(entry['attempts'] for entry in retried)
+                delay = retry_delay(attempts, self._rng)
+                logger.info(f"[TELEGRAM] Erreur lors de l'envoi de {names} ({e}), essai {attempts}/{MAX_ATTEMPTS}, "
+                            f"nouvel essai dans {delay:.0f} s")
+                self._update(retried, status=OUTBOX_QUEUED, next_attempt_at=time.time() + delay, error=str(e))
+        else:
+            sent_at = time.time()
+            for entry, key, file_id, message in zip(batch, keys, reused, messages):
+                entry['attempts'] += 1
+                self._latencies.append(sent_at - entry['created_at'])
+                entry['file_id'] = file_id or (message.photo[-1].file_id if message.photo else None)
+                self._remember_file_id(key, entry['file_id'])
+            with self._lock:
+                self.upload_stats['file_id_reuses'] += sum(1 for file_id in reused if file_id)
+            self.stats_counters['sent'] += len(batch)
+            if len(batch) > 1:
+                self.stats_counters['albums'] += 1
+                logger.info(f"[TELEGRAM] Album de {len(batch)} photos envoyé avec succès ({names})")
+            else:
+                logger.info(f"[TELEGRAM] {names} envoyée avec succès ({batch[0]['attempts']} essai(s))")
+            # Nouveau file_id gardé : un prochain envoi de ces photos le réutilise au lieu de les renvoyer
+            self._update(batch, status=OUTBOX_SENT, sent_at=sent_at, error=None, upload=False)